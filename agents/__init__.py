@@ -1,7 +1,9 @@
-from .workflow import run_workflow
+from .workflow import run_workflow, stream_workflow
 from .preference_parser import PreferenceParserAgent
 from .educator import EducatorAgent
 from .strategist import StrategistAgent
 from .market_analyst import MarketAnalystAgent
 from .executor import ExecutorAgent
+from .forecaster import ForecastAgent
 from .monitor_guardrail import MonitorGuardrailAgent
+from .registry import get_agent, agent_health
@@ -5,15 +5,23 @@ import traceback
 import time
 import re
 from tenacity import retry, stop_after_attempt, wait_exponential
-from utils.config import FINNHUB_API_KEY
+from utils.finnhub_quota import INTERACTIVE, get_finnhub_quota
+
+HEALTH_CHECK_TIMEOUT = 2
+# (connect, read) seconds for generation; when streaming, the read timeout applies
+# between chunks, and it also has to cover Ollama loading the model
+GENERATE_TIMEOUT = (5, 120)
 
 class EducatorAgent:
-    def __init__(self):
+    def __init__(self, probe: bool = True):
+        """``probe=False`` skips the blocking Ollama test call; the shared
+        instance in agents.registry runs the cheaper ``check_health`` instead."""
         self.api_available = False
         self.base_url = "http://localhost:11434/api"
         self.model = "gemma:2b"
-        self.finnhub_url = "https://finnhub.io/api/v1"
-        
+        if not probe:
+            return
+
         try:
             # Test Ollama connection
             logger.info(f"Testing Ollama connection with {self.model}...")
@@ -30,6 +38,27 @@ class EducatorAgent:
             logger.error(f"Full traceback: {traceback.format_exc()}")
             self.api_available = False
 
+    def check_health(self) -> bool:
+        """Cheap availability check: Ollama is up and has the model pulled.
+
+        Lists local models with a short timeout instead of generating text,
+        so it can run periodically without retries or long waits.
+        """
+        try:
+            response = requests.get(f"{self.base_url}/tags", timeout=HEALTH_CHECK_TIMEOUT)
+            response.raise_for_status()
+            names = {model.get("name", "") for model in response.json().get("models", [])}
+            available = any(name == self.model or name.startswith(f"{self.model}-") for name in names)
+            if not available:
+                logger.warning(f"Ollama is running but {self.model} is not pulled")
+        except Exception as e:
+            logger.debug(f"Ollama health check failed: {str(e)}")
+            available = False
+        if available != self.api_available:
+            logger.info(f"Ollama {self.model} is now {'available' if available else 'unavailable'}")
+        self.api_available = available
+        return available
+
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -44,7 +73,8 @@ class EducatorAgent:
                     "model": self.model,
                     "prompt": prompt,
                     "stream": False
-                }
+                },
+                timeout=GENERATE_TIMEOUT
             )
             response.raise_for_status()
             return response.json()["response"]
@@ -52,6 +82,32 @@ class EducatorAgent:
             logger.warning(f"Error generating response: {str(e)}")
             raise
 
+    def _stream_generate(self, prompt):
+        """Yield response text from Ollama as it is generated (``stream: true``).
+
+        Ollama sends one JSON object per line; each carries the next piece of
+        the response and the last one has ``done`` set.
+        """
+        with requests.post(
+            f"{self.base_url}/generate",
+            json={
+                "model": self.model,
+                "prompt": prompt,
+                "stream": True
+            },
+            stream=True,
+            timeout=GENERATE_TIMEOUT
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    break
+
     def _get_company_info(self, company_name):
         """Get company information using Finnhub API."""
         try:
@@ -72,25 +128,10 @@ class EducatorAgent:
             # Get ticker symbol
             ticker_symbol = company_map.get(company_name.lower(), company_name.upper())
             
-            # Fetch company profile
-            profile_url = f"{self.finnhub_url}/stock/profile2"
-            profile_params = {
-                'symbol': ticker_symbol,
-                'token': FINNHUB_API_KEY
-            }
-            profile_response = requests.get(profile_url, params=profile_params)
-            profile_response.raise_for_status()
-            profile_data = profile_response.json()
-            
-            # Fetch quote data
-            quote_url = f"{self.finnhub_url}/quote"
-            quote_params = {
-                'symbol': ticker_symbol,
-                'token': FINNHUB_API_KEY
-            }
-            quote_response = requests.get(quote_url, params=quote_params)
-            quote_response.raise_for_status()
-            quote_data = quote_response.json()
+            # Fetch company profile and quote through the shared Finnhub quota
+            finnhub_quota = get_finnhub_quota()
+            profile_data = finnhub_quota.company_profile2(ticker_symbol, priority=INTERACTIVE)
+            quote_data = finnhub_quota.quote(ticker_symbol, priority=INTERACTIVE)
             
             # Calculate price change percentage
             price_change_percent = ((quote_data.get('c', 0) - quote_data.get('pc', 0)) / quote_data.get('pc', 1)) * 100 if quote_data.get('pc', 0) != 0 else 0
@@ -238,36 +279,38 @@ class EducatorAgent:
         
         What would you like to learn about?"""
 
-    def provide_education(self, user_message: str) -> str:
-        """Main method to handle user queries and provide responses."""
-        try:
-            if not self.api_available:
-                return self._get_fallback_response(user_message)
-
-            # Extract any company names for additional context
-            companies = self._extract_companies(user_message)
-            company_info = ""
-            
-            if companies:
-                for company in companies:
-                    info = self._get_company_info(company)
-                    if info:
-                        company_info += f"\nCompany Information for {info['name']} ({info['symbol']}):"
-                        company_info += f"\n- Current Price: ${info['current_price']}"
-                        company_info += f"\n- Recent Performance: {info['recent_change']}"
-                        company_info += f"\n- Industry: {info['industry']}\n"
+    def _education_prompt(self, user_message: str) -> str:
+        # Extract any company names for additional context
+        companies = self._extract_companies(user_message)
+        company_info = ""
+        
+        if companies:
+            for company in companies:
+                info = self._get_company_info(company)
+                if info:
+                    company_info += f"\nCompany Information for {info['name']} ({info['symbol']}):"
+                    company_info += f"\n- Current Price: ${info['current_price']}"
+                    company_info += f"\n- Recent Performance: {info['recent_change']}"
+                    company_info += f"\n- Industry: {info['industry']}\n"
 
-            # Construct the prompt with company information if available
-            system_prompt = """You are a knowledgeable financial advisor and educator. 
+        # Construct the prompt with company information if available
+        system_prompt = """You are a knowledgeable financial advisor and educator. 
             Provide clear, accurate, and helpful information about investing and the stock market. 
             Focus on educational value and practical advice. 
             If discussing specific companies, use the provided company information."""
 
-            prompt = f"{system_prompt}\n\nUser Question: {user_message}"
-            if company_info:
-                prompt += f"\n\nRelevant Company Information:{company_info}"
+        prompt = f"{system_prompt}\n\nUser Question: {user_message}"
+        if company_info:
+            prompt += f"\n\nRelevant Company Information:{company_info}"
+        return prompt
 
-            response = self._generate_with_retry(prompt)
+    def provide_education(self, user_message: str) -> str:
+        """Main method to handle user queries and provide responses."""
+        try:
+            if not self.api_available:
+                return self._get_fallback_response(user_message)
+
+            response = self._generate_with_retry(self._education_prompt(user_message))
             return response if response else self._get_fallback_response(user_message)
 
         except Exception as e:
@@ -275,6 +318,22 @@ class EducatorAgent:
             logger.error(f"Full traceback: {traceback.format_exc()}")
             return self._get_fallback_response(user_message)
 
+    def stream_education(self, user_message: str):
+        """Streaming variant of provide_education that yields text as Ollama generates it."""
+        if not self.api_available:
+            yield self._get_fallback_response(user_message)
+            return
+        produced = False
+        try:
+            for text in self._stream_generate(self._education_prompt(user_message)):
+                produced = True
+                yield text
+        except Exception as e:
+            logger.error(f"Error in stream_education: {str(e)}")
+            logger.error(f"Full traceback: {traceback.format_exc()}")
+        if not produced:
+            yield self._get_fallback_response(user_message)
+
     def _provide_definition(self, query_info: dict) -> list:
         """Provide definition and explanation of investment terms."""
         parts = []
@@ -0,0 +1,26 @@
+from analytics.forecast import forecast_inputs, get_forecasts
+from utils.logger import logger
+from typing import Dict, Iterable
+import json
+
+class ForecastAgent:
+    """Serves the trained model's forward-return forecasts (analytics/forecast.py) to the other agents.
+
+    No LLM is involved: forecasts come from the offline-trained model and are
+    cached per trading day, so asking for them costs a dictionary lookup.
+    """
+
+    def forecast(self, symbols: Iterable[str]) -> Dict:
+        """Structured forecasts for ``symbols``; {} when there is no matrix or trained model."""
+        try:
+            return forecast_inputs(symbols, get_forecasts())
+        except Exception as e:
+            logger.error(f"Failed to load forecasts: {str(e)}")
+            return {}
+
+    def describe(self, symbols: Iterable[str]) -> str:
+        """Forecasts as compact JSON for prompts, or a note that there are none."""
+        forecasts = self.forecast(symbols)
+        if not forecasts.get("forecasts"):
+            return "Not available (no trained forecast model); do not state model forecasts."
+        return json.dumps(forecasts)
@@ -1,12 +1,12 @@
-from langchain_groq import ChatGroq
-from utils.config import GROQ_API_KEY
+from utils.clients import get_groq_llm
 from utils.logger import logger
+from utils.llm_cache import CachedLLM
 from typing import List, Dict
 import json
 
 class GroqEnhancerAgent:
     def __init__(self):
-        self.llm = ChatGroq(model_name="mixtral-8x7b-32768", api_key=GROQ_API_KEY)  # Using mixtral model as compound-beta might not be available
+        self.llm = CachedLLM(get_groq_llm("mixtral-8x7b-32768"), namespace="groq_enhancer", ttl=3600)  # Using mixtral model as compound-beta might not be available
 
     def enhance_recommendations(self, recommendations: List[Dict], preferences: Dict) -> List[Dict]:
         """Enhance stock recommendations using Groq's model based on user preferences and additional details."""
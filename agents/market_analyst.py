@@ -1,20 +1,59 @@
-from langchain_groq import ChatGroq
-from utils.config import GROQ_API_KEY, NEWSAPI_KEY, FINNHUB_API_KEY, ALPHA_VANTAGE_API_KEY, FRED_API_KEY
+from utils.clients import get_groq_llm, get_newsapi_client
+from utils.finnhub_quota import INTERACTIVE, get_finnhub_quota
+from utils.singleflight import coalesced
+from utils.config import ALPHA_VANTAGE_API_KEY, FRED_API_KEY, SENTIMENT_LLM_CONFIDENCE
 from utils.logger import logger
-import finnhub
-from newsapi import NewsApiClient
+from utils.llm_cache import CachedLLM
+from analytics.sentiment import score_symbols, sentiment_label
+from analytics.indicators import get_indicators
+from data.mysql_db import db_connection
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from cachetools import TTLCache
 from typing import Dict, List, Optional
 import json
+import re
+import threading
+import time
 import requests
+import pandas as pd
+
+class LockedTTLCache(TTLCache):
+    """TTLCache safe to share between threads; ``get`` and ``in`` go through the locked methods."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            super().__delitem__(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            return super().__contains__(key)
+
+# News sentiment is shared by every agent instance in the process
+NEWS_SENTIMENT_TTL = 3600
+NEWS_MAX_WORKERS = 8
+news_sentiment_cache = TTLCache(maxsize=500, ttl=NEWS_SENTIMENT_TTL)
+_news_sentiment_lock = threading.Lock()
 
 class MarketAnalystAgent:
     def __init__(self):
-        self.llm = ChatGroq(model_name="llama-3.1-8b-instant", api_key=GROQ_API_KEY)
-        self.finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
-        self.newsapi_client = NewsApiClient(api_key=NEWSAPI_KEY)
-        self.cache = TTLCache(maxsize=100, ttl=3600)
+        self.llm = CachedLLM(get_groq_llm("llama-3.1-8b-instant"), namespace="market_analyst", ttl=600)
+        self.finnhub_quota = get_finnhub_quota()
+        self.newsapi_client = get_newsapi_client()
+        # One instance serves every session via agents.registry, so guard the cache
+        self.cache = LockedTTLCache(maxsize=100, ttl=3600)
 
     def analyze(self, user_message: str) -> str:
         """Analyze user message and provide market insights."""
@@ -82,40 +121,39 @@ class MarketAnalystAgent:
 
         try:
             logger.info(f"Fetching MySQL financials for CIK {cik}")
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-
             five_years_ago = datetime.now() - timedelta(days=5*365)
 
-            cursor.execute("""
-                SELECT revenue, net_income, fiscal_date_ending
-                FROM income_statements
-                WHERE cik = %s AND fiscal_date_ending >= %s
-                ORDER BY fiscal_date_ending DESC
-            """, (cik, five_years_ago))
-            income = cursor.fetchall() or []
-            logger.info(f"Income statements for CIK {cik}: {len(income)} records")
-
-            cursor.execute("""
-                SELECT total_assets, total_liabilities, total_equity
-                FROM balance_sheets
-                WHERE cik = %s AND fiscal_date_ending >= %s
-                ORDER BY fiscal_date_ending DESC
-            """, (cik, five_years_ago))
-            balance = cursor.fetchall() or []
-            logger.info(f"Balance sheets for CIK {cik}: {len(balance)} records")
-
-            cursor.execute("""
-                SELECT operating_cash_flow, capital_expenditure
-                FROM cash_flows
-                WHERE cik = %s AND fiscal_date_ending >= %s
-                ORDER BY fiscal_date_ending DESC
-            """, (cik, five_years_ago))
-            cash_flow = cursor.fetchall() or []
-            logger.info(f"Cash flows for CIK {cik}: {len(cash_flow)} records")
-
-            cursor.close()
-            conn.close()
+            with db_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    cursor.execute("""
+                        SELECT revenue, net_income, fiscal_date_ending
+                        FROM income_statements
+                        WHERE cik = %s AND fiscal_date_ending >= %s
+                        ORDER BY fiscal_date_ending DESC
+                    """, (cik, five_years_ago))
+                    income = cursor.fetchall() or []
+                    logger.info(f"Income statements for CIK {cik}: {len(income)} records")
+
+                    cursor.execute("""
+                        SELECT total_assets, total_liabilities, total_equity
+                        FROM balance_sheets
+                        WHERE cik = %s AND fiscal_date_ending >= %s
+                        ORDER BY fiscal_date_ending DESC
+                    """, (cik, five_years_ago))
+                    balance = cursor.fetchall() or []
+                    logger.info(f"Balance sheets for CIK {cik}: {len(balance)} records")
+
+                    cursor.execute("""
+                        SELECT operating_cash_flow, capital_expenditure
+                        FROM cash_flows
+                        WHERE cik = %s AND fiscal_date_ending >= %s
+                        ORDER BY fiscal_date_ending DESC
+                    """, (cik, five_years_ago))
+                    cash_flow = cursor.fetchall() or []
+                    logger.info(f"Cash flows for CIK {cik}: {len(cash_flow)} records")
+                finally:
+                    cursor.close()
 
             financials = {
                 "income": income,
@@ -129,7 +167,140 @@ class MarketAnalystAgent:
             logger.error(f"Failed to fetch financials for CIK {cik}: {str(e)}")
             return {}
 
-    def fetch_news_sentiment(self, symbols: List[str]) -> Dict[str, str]:
+    def _fetch_headlines(self, symbol: str, from_date: datetime, to_date: datetime) -> List[str]:
+        response = self.newsapi_client.get_everything(
+            q=symbol,
+            from_param=from_date.strftime('%Y-%m-%d'),
+            to=to_date.strftime('%Y-%m-%d'),
+            language='en',
+            sort_by='relevancy'
+        )
+        return [article['title'] for article in response.get('articles', [])[:5] if article.get('title')]
+
+    def _score_headlines(self, headlines: Dict[str, List[str]]) -> Dict[str, float]:
+        """Score every symbol's headlines in one structured LLM call.
+
+        Symbols missing from the reply or with an invalid score are left out
+        of the result, and the cached reply is then dropped so a retry asks again.
+        """
+        prompt = f"""
+Analyze the sentiment of the news headlines for each stock symbol below:
+{json.dumps(headlines, indent=2, sort_keys=True)}
+Score each symbol's sentiment from -1 (negative) to 1 (positive). Return one JSON object
+with every symbol as a key and its score as the value, for example:
+```json
+{{
+    "AAPL": 0.8,
+    "TSLA": -0.4
+}}
+```
+Return ONLY the JSON object.
+"""
+        response = self.llm.invoke(prompt)
+        raw_response = response.content.strip()
+        json_match = re.search(r'\{[\s\S]*\}', raw_response)
+        try:
+            scores = json.loads(json_match.group(0)) if json_match else {}
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse batched sentiment response: {str(e)}")
+            scores = {}
+        if not isinstance(scores, dict):
+            scores = {}
+        result = {}
+        for symbol in headlines:
+            try:
+                result[symbol] = max(-1.0, min(1.0, float(scores[symbol])))
+            except KeyError:
+                logger.warning(f"No sentiment score for {symbol} in the batched response")
+            except (TypeError, ValueError):
+                logger.warning(f"Invalid sentiment score for {symbol}: {scores.get(symbol)}")
+        if len(result) < len(headlines):
+            self.llm.invalidate(prompt)
+        return result
+
+    def fetch_news_sentiment_scores(self, symbols: List[str]) -> Dict[str, Dict]:
+        """Batched news sentiment for many symbols.
+
+        Headlines for cache misses are fetched from NewsAPI concurrently and
+        scored with the finance lexicon; only symbols scoring below
+        ``SENTIMENT_LLM_CONFIDENCE`` are sent to the LLM, together in a single
+        prompt. Returns ``{symbol: {"sentiment": label, "score": float,
+        "confidence": float, "headlines": count, "source": str}}`` where
+        source is lexicon, llm or none.
+        Results are kept in the module-level cache shared by all instances;
+        symbols whose headlines could not be fetched are reported as Neutral
+        and symbols the LLM failed to score keep their lexicon score; neither
+        is cached, so the next call retries them.
+        """
+        results = {}
+        missing = []
+        with _news_sentiment_lock:
+            for symbol in symbols:
+                cached = news_sentiment_cache.get(symbol)
+                if cached is not None:
+                    results[symbol] = cached
+                else:
+                    missing.append(symbol)
+        if not missing:
+            return results
+
+        to_date = datetime.now()
+        from_date = to_date - timedelta(days=7)
+        headlines = {}
+        failed = set()
+        with ThreadPoolExecutor(max_workers=min(NEWS_MAX_WORKERS, len(missing)), thread_name_prefix="newsapi") as executor:
+            futures = {symbol: executor.submit(self._fetch_headlines, symbol, from_date, to_date) for symbol in missing}
+            for symbol, future in futures.items():
+                try:
+                    headlines[symbol] = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to fetch news for {symbol}: {str(e)}")
+                    failed.add(symbol)
+
+        with_news = {symbol: titles for symbol, titles in headlines.items() if titles}
+        lexicon = score_symbols(with_news)
+        uncertain = {
+            symbol: with_news[symbol]
+            for symbol in lexicon.index[lexicon["confidence"] < SENTIMENT_LLM_CONFIDENCE]
+        }
+        llm_scores = {}
+        if uncertain:
+            try:
+                llm_scores = self._score_headlines(uncertain)
+            except Exception as e:
+                logger.error(f"Batched sentiment scoring failed: {str(e)}")
+            # Unscored symbols keep their lexicon score but are retried on the next call
+            failed.update(symbol for symbol in uncertain if symbol not in llm_scores)
+
+        fresh = {}
+        for symbol in missing:
+            if symbol in llm_scores:
+                score, source = llm_scores[symbol], "llm"
+            elif symbol in lexicon.index:
+                score, source = float(lexicon.at[symbol, "score"]), "lexicon"
+            else:
+                score, source = 0.0, "none"
+            entry = {
+                "sentiment": sentiment_label(score),
+                "score": score,
+                "confidence": float(lexicon.at[symbol, "confidence"]) if symbol in lexicon.index else 0.0,
+                "headlines": len(headlines.get(symbol, [])),
+                "source": source
+            }
+            results[symbol] = entry
+            if symbol not in failed:
+                fresh[symbol] = entry
+        with _news_sentiment_lock:
+            news_sentiment_cache.update(fresh)
+        logger.info(f"Scored news sentiment for {len(missing)} symbols: {len(with_news) - len(uncertain)} by lexicon, "
+                    f"{len(llm_scores)} by LLM, {len(failed)} failed")
+        return results
+
+    def fetch_news_sentiment(self, symbols: List[str], batched: bool = True) -> Dict[str, str]:
+        """Sentiment label per symbol; ``batched=False`` scores one symbol per LLM call."""
+        if batched:
+            return {symbol: entry["sentiment"] for symbol, entry in self.fetch_news_sentiment_scores(symbols).items()}
+
         sentiments = {}
         to_date = datetime.now()
         from_date = to_date - timedelta(days=7)
@@ -158,6 +329,13 @@ class MarketAnalystAgent:
                     continue
 
                 headlines = [article['title'] for article in articles[:5]]
+                lexicon = score_symbols({symbol: headlines}).loc[symbol]
+                if lexicon["confidence"] >= SENTIMENT_LLM_CONFIDENCE:
+                    logger.info(f"News sentiment for {symbol}: {lexicon['sentiment']} (lexicon)")
+                    sentiments[symbol] = lexicon["sentiment"]
+                    self.cache[cache_key] = lexicon["sentiment"]
+                    continue
+
                 prompt = f"""
 Analyze the sentiment of these news headlines for {symbol}:
 {headlines}
@@ -224,8 +402,8 @@ Where sentiment is 'Positive' (>=0.3), 'Negative' (<= -0.3), or 'Neutral' (else)
         """Analyze stock with enhanced GPT analysis."""
         try:
             # Get basic stock data
-            quote = self.finnhub_client.quote(symbol)
-            company = self.finnhub_client.company_profile2(symbol=symbol)
+            quote = self.finnhub_quota.quote(symbol, priority=INTERACTIVE)
+            company = self.finnhub_quota.company_profile2(symbol, priority=INTERACTIVE)
             
             # Get news sentiment
             news = self.fetch_market_news()
@@ -257,6 +435,7 @@ Where sentiment is 'Positive' (>=0.3), 'Negative' (<= -0.3), or 'Neutral' (else)
                 "error": f"Unable to analyze {symbol} at this time."
             }
 
+    @coalesced("market_news", key=lambda self: "market_news")
     def fetch_market_news(self) -> List[Dict]:
         """Fetch real-time market news from Alpha Vantage."""
         cache_key = "market_news"
@@ -292,6 +471,7 @@ Where sentiment is 'Positive' (>=0.3), 'Negative' (<= -0.3), or 'Neutral' (else)
             logger.error(f"Error fetching market news: {str(e)}")
             return []
 
+    @coalesced("fred", key=lambda self, series_id, start_date=None: (series_id, start_date))
     def fetch_fred_data(self, series_id: str, start_date: Optional[str] = None) -> Dict:
         """Fetch economic data from FRED."""
         cache_key = f"fred_{series_id}"
@@ -396,19 +576,39 @@ Where sentiment is 'Positive' (>=0.3), 'Negative' (<= -0.3), or 'Neutral' (else)
         return parts
 
     def _format_technical_analysis(self, stock_data: dict, metrics: list) -> list:
-        """Format technical analysis metrics."""
+        """Format technical analysis metrics computed from the daily price history."""
         parts = []
-        parts.append(f"\n**Technical Analysis for {stock_data['symbol']}:**")
-        
+        symbol = stock_data['symbol']
+        parts.append(f"\n**Technical Analysis for {symbol}:**")
+
+        indicators = get_indicators()
+        if indicators is None or symbol not in indicators.index or pd.isna(indicators.loc[symbol, "close"]):
+            parts.append("No price history available for technical indicators.")
+            return parts
+        row = indicators.loc[symbol]
+        parts.append(f"As of {indicators.attrs.get('as_of')} close ({row['close']:.2f}):")
+
+        def value(column, fmt):
+            return "n/a" if pd.isna(row[column]) else fmt.format(row[column])
+
         # Add requested technical indicators
         for metric in metrics:
-            if metric.lower() == "rsi":
-                parts.append("RSI (14-day): [Calculate RSI]")
-            elif metric.lower() == "moving_averages":
+            metric = metric.lower()
+            if metric == "rsi":
+                parts.append(f"RSI (14-day): {value('rsi_14', '{:.1f}')}")
+            elif metric == "moving_averages":
                 parts.append("Moving Averages:")
-                parts.append("- 50-day MA: [Calculate 50-day MA]")
-                parts.append("- 200-day MA: [Calculate 200-day MA]")
-        
+                for window in (20, 50, 200):
+                    parts.append(f"- {window}-day MA: {value(f'sma_{window}', '{:.2f}')}")
+            elif metric == "macd":
+                parts.append(f"MACD (12/26/9): {value('macd', '{:.2f}')}, signal {value('macd_signal', '{:.2f}')}, "
+                             f"histogram {value('macd_hist', '{:+.2f}')}")
+            elif metric == "bollinger":
+                parts.append(f"Bollinger Bands (20, 2): {value('bb_lower', '{:.2f}')} - {value('bb_upper', '{:.2f}')}, "
+                             f"%B {value('bb_pct_b', '{:.2f}')}")
+            elif metric == "atr":
+                parts.append(f"ATR (14-day): {value('atr_14', '{:.2f}')} ({value('atr_pct', '{:.1%}')} of price)")
+
         return parts
 
     def _format_news_analysis(self, symbol: str, news: list) -> list:
@@ -1,10 +1,10 @@
-from langchain_groq import ChatGroq
+from utils.clients import get_groq_llm
 from langchain.prompts import PromptTemplate
-from utils.config import GROQ_API_KEY
+from utils.llm_cache import CachedLLM
 
 class MonitorGuardrailAgent:
     def __init__(self):
-        self.llm = ChatGroq(model_name="llama-guard-3-8b", api_key=GROQ_API_KEY)  # Specialized for guardrails
+        self.llm = CachedLLM(get_groq_llm("llama-guard-3-8b"), namespace="guardrail", ttl=86400)  # Specialized for guardrails
 
     def monitor(self, action, user_id):
         prompt = PromptTemplate(
@@ -1,13 +1,137 @@
-from langchain_groq import ChatGroq
-from langchain.prompts import PromptTemplate
+from utils.clients import get_groq_llm
 from pydantic import BaseModel, Field
-from utils.config import GROQ_API_KEY
+from utils.config import PREFERENCE_RULE_CONFIDENCE
+from utils.llm_cache import CachedLLM
 import json
 import re
 from utils.logger import logger
 from langchain_core.exceptions import LangChainException
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+import threading
 import time
 
+DEFAULT_PREFERENCES = {
+    "risk_appetite": "medium",
+    "investment_goals": "growth",
+    "time_horizon": "medium",
+    "investment_amount": 10000.0,
+    "investment_style": "index"
+}
+
+# Keyword rules mirroring the mappings in the LLM prompt below
+RULES = {
+    "risk_appetite": [
+        (re.compile(r"\b(safe(ly)?|secure|cautious(ly)?|conservative(ly)?|low[- ]risk|careful(ly)?|preserve|preservation)\b"), "low"),
+        (re.compile(r"\b(aggressive(ly)?|risky|high[- ]risk|speculative|bold(ly)?)\b"), "high"),
+        (re.compile(r"\b(moderate(ly)?|balanced|medium[- ]risk)\b"), "medium"),
+    ],
+    "investment_goals": [
+        (re.compile(r"\b(retire(ment)?|retiring|pension|long[- ]term savings|nest egg)\b"), "retirement"),
+        (re.compile(r"\b(dividends?|income|yield|cash flow)\b"), "income"),
+        (re.compile(r"\b(wealth|expansion|grow|appreciation|capital gains?)\b"), "growth"),
+    ],
+    "investment_style": [
+        (re.compile(r"\b(value|undervalued|bargains?)\b"), "value"),
+        (re.compile(r"\bgrowth\b"), "growth"),
+        (re.compile(r"\b(index(es)?|index funds?|etfs?|passive(ly)?)\b"), "index"),
+    ],
+    "time_horizon": [
+        (re.compile(r"\b(short[- ]term|soon|next year|months?)\b"), "short"),
+        (re.compile(r"\b(medium[- ]term|mid[- ]term)\b"), "medium"),
+        (re.compile(r"\b(long[- ]term|decades?|long run|for the long haul)\b"), "long"),
+    ],
+}
+YEARS = re.compile(r"\b(\d{1,2})(?:\s*(?:-|to)\s*(\d{1,2}))?\s*(\+|or more)?\s*(?:years?|yrs?)\b")
+_NUMBER = r"(\d[\d,]*(?:\.\d+)?)\s*(k|m|thousand|million)?"
+AMOUNTS = [
+    re.compile(r"\$\s*" + _NUMBER + r"\b"),
+    re.compile(r"\b" + _NUMBER + r"\s*(?:dollars|usd|bucks)\b"),
+    re.compile(r"\binvest(?:ing)?\s+" + _NUMBER + r"\b(?!\s*(?:years?|yrs?|months?|%|percent))"),
+]
+MULTIPLIERS = {"k": 1e3, "thousand": 1e3, "m": 1e6, "million": 1e6}
+# A negation up to three words before a keyword, within the same clause ("don't
+# want anything risky", "avoid aggressive bets"), reverses it, which the rules
+# cannot map to a value
+NEGATED = re.compile(r"\b(?:no|not|never|nothing|none|avoid(?:ing)?|without|(?:do|does|did|would|wo|ca)n['’]?t|isn['’]?t|aren['’]?t)\b"
+                     r"(?:[^\w.,;:!?]+\w+){0,3}[^\w.,;:!?]*$")
+
+# Weight of a field left at its default: the user may have implied it in a way
+# only the LLM can pick up, so missing fields lower confidence but less than conflicts
+MISSING_FIELD_WEIGHT = 0.5
+
+_stats = {"parsed": 0, "rules": 0, "llm": 0, "llm_fallbacks": 0, "defaults": 0}
+_stats_lock = threading.Lock()
+
+def _count(event: str):
+    with _stats_lock:
+        _stats["parsed"] += 1
+        _stats[event] += 1
+
+def parser_stats() -> Dict:
+    """Counts of inputs by how they were served, plus the share that needed no LLM call.
+
+    ``llm`` counts inputs whose LLM reply was parsed; ``llm_fallbacks`` those
+    where the LLM failed and the rule-based result was returned.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["without_llm_share"] = (stats["rules"] + stats["defaults"]) / stats["parsed"] if stats["parsed"] else 0.0
+    return stats
+
+def _horizon_from_years(text: str):
+    values = set()
+    for match in YEARS.finditer(text):
+        years = int(match.group(2) or match.group(1)) + (1 if match.group(3) else 0)
+        values.add("short" if years <= 3 else "medium" if years <= 7 else "long")
+    return values
+
+def _amounts(text: str):
+    values = set()
+    for pattern in AMOUNTS:
+        for number, suffix in pattern.findall(text):
+            try:
+                values.add(float(number.replace(",", "")) * MULTIPLIERS.get(suffix, 1.0))
+            except ValueError:
+                continue
+    return {value for value in values if value > 0}
+
+def extract_preferences(text: str) -> Tuple[Dict, float]:
+    """Rule-based preference extraction; returns (preferences, confidence).
+
+    Each field scores 1 when exactly one value matched, ``MISSING_FIELD_WEIGHT``
+    when nothing matched (the default is used) and 0 when the text matched
+    conflicting values or a negated keyword (the default is used). Confidence
+    is the mean score.
+    """
+    text = text.strip().lower()
+    preferences = dict(DEFAULT_PREFERENCES)
+    found, negated = {}, set()
+    for field, rules in RULES.items():
+        found[field] = set()
+        for pattern, value in rules:
+            for match in pattern.finditer(text):
+                if NEGATED.search(text, 0, match.start()):
+                    negated.add(field)
+                else:
+                    found[field].add(value)
+    found["time_horizon"] |= _horizon_from_years(text)
+    found["investment_amount"] = _amounts(text)
+    # "passive income" is an income goal, not a request for index funds
+    if "passive income" in text:
+        found["investment_style"].discard("index")
+
+    scores = []
+    for field, values in found.items():
+        if field in negated:
+            scores.append(0.0)
+        elif len(values) == 1:
+            preferences[field] = values.pop()
+            scores.append(1.0)
+        else:
+            scores.append(MISSING_FIELD_WEIGHT if not values else 0.0)
+    return preferences, sum(scores) / len(scores)
+
 class InvestmentPersona(BaseModel):
     risk_appetite: str = Field(..., description="Risk appetite (low, medium, high)")
     investment_goals: str = Field(..., description="Investment goals (retirement, growth, income)")
@@ -18,16 +142,72 @@ class InvestmentPersona(BaseModel):
 class PreferenceParserAgent:
     def __init__(self):
         try:
-            self.llm = ChatGroq(model_name="llama-3.1-8b-instant", api_key=GROQ_API_KEY)
+            self.llm = CachedLLM(get_groq_llm("llama-3.1-8b-instant"), namespace="preference_parser", ttl=86400)
         except Exception as e:
             logger.error(f"Failed to initialize ChatGroq: {str(e)}")
             raise
 
     def parse_preferences(self, text: str) -> dict:
-        logger.debug()
-        prompt = PromptTemplate(
-            input_variables=text,
-            template="""
+        """Parse free-text preferences, calling the LLM only when the rules are unsure."""
+        if not text or text.isspace():
+            logger.warning("Empty or whitespace input provided; returning defaults")
+            _count("defaults")
+            return dict(DEFAULT_PREFERENCES)
+        preferences, confidence = extract_preferences(text)
+        if confidence >= PREFERENCE_RULE_CONFIDENCE:
+            logger.info(f"Rule-based preferences (confidence {confidence:.2f}): {preferences}")
+            _count("rules")
+            return preferences
+        logger.info(f"Rule confidence {confidence:.2f} below {PREFERENCE_RULE_CONFIDENCE}; asking the LLM")
+        parsed, from_llm = self._parse_with_llm(text, preferences)
+        _count("llm" if from_llm else "llm_fallbacks")
+        return parsed
+
+    def parse_many(self, texts: List[str], max_workers: int = 4) -> List[dict]:
+        """Parse a batch of inputs, e.g. an onboarding import, keeping their order.
+
+        Rules run over every input first; the remaining distinct inputs go to
+        the LLM concurrently.
+        """
+        results = [None] * len(texts)
+        pending = {}
+        for index, text in enumerate(texts):
+            if not text or text.isspace():
+                results[index] = dict(DEFAULT_PREFERENCES)
+                _count("defaults")
+                continue
+            preferences, confidence = extract_preferences(text)
+            if confidence >= PREFERENCE_RULE_CONFIDENCE:
+                results[index] = preferences
+                _count("rules")
+            else:
+                pending.setdefault(text.strip().lower(), (preferences, []))[1].append(index)
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+                futures = {
+                    text: executor.submit(self._parse_with_llm, text, preferences)
+                    for text, (preferences, _) in pending.items()
+                }
+                for text, (_, indices) in pending.items():
+                    parsed, from_llm = futures[text].result()
+                    for index in indices:
+                        results[index] = dict(parsed)
+                        _count("llm" if from_llm else "llm_fallbacks")
+        served = len(texts) - sum(len(indices) for _, indices in pending.values())
+        logger.info(f"Parsed {len(texts)} preference inputs: {served} without the LLM, "
+                    f"{len(pending)} distinct LLM calls")
+        return results
+
+    def _parse_with_llm(self, text: str, fallback: dict) -> Tuple[dict, bool]:
+        """LLM parse; returns (preferences, True), or (``fallback``, False) if it fails.
+
+        ``fallback`` is the rule-based result.
+        """
+        # Normalize input
+        text = text.strip().lower()
+        logger.info(f"Normalized input: {text}")
+        prompt = f"""
 You are an expert investment advisor tasked with generating a complete investment persona based on user input. The persona must include exactly the following fields:
 - risk_appetite: Must be one of 'low', 'medium', 'high'.
 - investment_goals: Must be one of 'retirement', 'growth', 'income'.
@@ -55,48 +235,33 @@ You are an expert investment advisor tasked with generating a complete investmen
 
 **Examples**:
 - Input: "I want to invest $5000 safely for retirement."
-  Output: {
+  Output: {{
     "risk_appetite": "low",
     "investment_goals": "retirement",
     "time_horizon": "medium",
     "investment_amount": 5000.0,
     "investment_style": "index"
-  }
+  }}
 - Input: "Invest $10000 aggressively for 10 years."
-  Output: {
+  Output: {{
     "risk_appetite": "high",
     "investment_goals": "growth",
     "time_horizon": "long",
     "investment_amount": 10000.0,
     "investment_style": "growth"
-  }
+  }}
 
 **User Input**: {text}
 
 Output the investment persona as a valid JSON object.
 """
-        )
-        defaults = {
-            "risk_appetite": "medium",
-            "investment_goals": "growth",
-            "time_horizon": "medium",
-            "investment_amount": 10000.0,
-            "investment_style": "index"
-        }
+        defaults = dict(fallback)
         raw_response = None
         try:
-            if not text or text.isspace():
-                logger.warning("Empty or whitespace input provided; returning defaults")
-                return defaults
-
-            # Normalize input
-            text = text.strip().lower()
-            logger.info(f"Normalized input: {text}")
-
             # Call LLM with retry
             for attempt in range(3):
                 try:
-                    response = self.llm.invoke(prompt.format(text=text))
+                    response = self.llm.invoke(prompt)
                     raw_response = response.content
                     logger.debug(f"Raw LLM response (attempt {attempt + 1}): {raw_response}")
                     break
@@ -106,49 +271,20 @@ Output the investment persona as a valid JSON object.
                         time.sleep(2 ** attempt)
                         continue
                     logger.error(f"LLM API failed after {attempt + 1} attempts: {str(e)}")
-                    return defaults
+                    return defaults, False
 
             # Check for empty or invalid response
             if not raw_response or raw_response.isspace():
                 logger.error("LLM returned empty or whitespace response")
-                return defaults
+                return defaults, False
 
             # Extract JSON
             json_match = re.search(r'\{[\s\S]*\}', raw_response)
             if not json_match:
                 logger.error(f"No valid JSON found in response: {raw_response}")
-                # Fallback: Manual parsing
-                preferences = defaults.copy()
-                if "safe" in text or "secure" in text or "cautious" in text:
-                    preferences["risk_appetite"] = "low"
-                elif "aggressive" in text or "risky" in text:
-                    preferences["risk_appetite"] = "high"
-                if "retirement" in text or "long-term savings" in text:
-                    preferences["investment_goals"] = "retirement"
-                elif "wealth" in text or "expansion" in text:
-                    preferences["investment_goals"] = "growth"
-                elif "dividends" in text or "passive" in text:
-                    preferences["investment_goals"] = "income"
-                if "1-3 years" in text or "short-term" in text:
-                    preferences["time_horizon"] = "short"
-                elif "3-7 years" in text:
-                    preferences["time_horizon"] = "medium"
-                elif "7+ years" in text or "long-term" in text:
-                    preferences["time_horizon"] = "long"
-                amount_match = re.search(r'\$?(\d+\.?\d*)', text)
-                if amount_match:
-                    try:
-                        preferences["investment_amount"] = float(amount_match.group(1))
-                    except ValueError:
-                        pass
-                if "value" in text:
-                    preferences["investment_style"] = "value"
-                elif "growth" in text:
-                    preferences["investment_style"] = "growth"
-                elif "index" in text or "passive" in text:
-                    preferences["investment_style"] = "index"
-                logger.info(f"Fallback preferences: {preferences}")
-                return preferences
+                self.llm.invalidate(prompt)
+                logger.info(f"Fallback preferences: {defaults}")
+                return defaults, False
 
             cleaned_response = json_match.group(0)
             logger.debug(f"Extracted JSON: {cleaned_response}")
@@ -159,17 +295,19 @@ Output the investment persona as a valid JSON object.
                 logger.debug(f"Parsed JSON: {preferences_json}")
             except json.JSONDecodeError as e:
                 logger.error(f"Failed to parse LLM response as JSON: {raw_response}, Error: {str(e)}")
-                return defaults
+                self.llm.invalidate(prompt)
+                return defaults, False
 
             # Validate with Pydantic
             try:
                 preferences = InvestmentPersona.parse_obj(preferences_json)
                 logger.info(f"Validated preferences: {preferences.dict()}")
-                return preferences.dict()
+                return preferences.dict(), True
             except ValueError as e:
                 logger.error(f"Pydantic validation error: {str(e)}, Parsed JSON: {preferences_json}")
-                return defaults
+                self.llm.invalidate(prompt)
+                return defaults, False
 
         except Exception as e:
             logger.error(f"Unexpected error parsing preferences: {str(e)}, Raw response: {raw_response or 'No response'}")
-            return defaults
\ No newline at end of file
+            return defaults, False
\ No newline at end of file
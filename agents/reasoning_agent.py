@@ -1,8 +1,14 @@
 from decimal import Decimal
-from langchain_groq import ChatGroq
-from utils.config import GROQ_API_KEY
+from utils.clients import get_groq_llm
 from utils.logger import logger
-from typing import List, Dict, Tuple
+from utils.llm_cache import CachedLLM
+from data.price_snapshot import PriceSnapshot
+from analytics.indicators import get_indicators, summarize
+from analytics.monte_carlo import SimulationResult, horizon_years, simulate_portfolio
+from analytics.price_matrix import open_matrix
+from agents.forecaster import ForecastAgent
+from utils.config import MONTE_CARLO_PATHS, MONTE_CARLO_WORKERS
+from typing import List, Dict, Optional, Tuple
 import json
 import time
 import decimal
@@ -12,12 +18,13 @@ import re
 class ReasoningAgent:
     def __init__(self):
         # Using deepseek-coder for better reasoning capabilities
-        self.llm = ChatGroq(model_name="deepseek-r1-distill-llama-70b", api_key=GROQ_API_KEY)
+        self.llm = CachedLLM(get_groq_llm("deepseek-r1-distill-llama-70b"), namespace="reasoning", ttl=900)
         # Define allowed stocks
         self.ALLOWED_STOCKS = [
             "UNH", "TSLA", "QCOM", "ORCL", "NVDA", "NFLX", "MSFT", "META", "LLY", "JNJ",
             "INTC", "IBM", "GOOGL", "GM", "F", "CSCO", "AMZN", "AMD", "ADBE", "AAPL"
         ]
+        self.forecaster = ForecastAgent()
 
     def _convert_to_float(self, value) -> float:
         """Safely convert a value to float, handling Decimal types."""
@@ -54,14 +61,11 @@ class ReasoningAgent:
             logger.error(f"Error in numeric operation: {str(e)}")
             return 0.0
 
-    def _get_current_price(self, symbol: str) -> float:
-        """Get current price for a symbol, handling different data types."""
+    def _get_current_price(self, symbol: str, snapshot: PriceSnapshot = None) -> float:
+        """Get current price for a symbol from the run's price snapshot."""
         try:
-            from scripts.fetch_stock_prices import fetch_stock_prices
-            stock_data = fetch_stock_prices()
-            price_data = stock_data.get(symbol, {})
-            current_price = price_data.get("current_price", 0.0)
-            return self._convert_to_float(current_price)
+            snapshot = snapshot or PriceSnapshot.capture()
+            return self._convert_to_float(snapshot.price(symbol))
         except Exception as e:
             logger.error(f"Error fetching price for {symbol}: {str(e)}")
             return 0.0
@@ -155,15 +159,15 @@ class ReasoningAgent:
                     "investment_strategy": {}
                 }
 
-    def _get_thinking_process(self, preferences: Dict) -> List[str]:
-        """Capture the model's inner thought process with detailed numerical analysis."""
+    def _get_thinking_process(self, preferences: Dict, snapshot: PriceSnapshot = None, on_token=None) -> List[str]:
+        """Capture the model's inner thought process with detailed numerical analysis.
+
+        When ``on_token`` is given the response is streamed and each text chunk
+        is passed to it as the model produces it.
+        """
         # Get current price data for calculations
-        try:
-            from scripts.fetch_stock_prices import fetch_stock_prices
-            stock_data = fetch_stock_prices()
-        except Exception as e:
-            logger.error(f"Failed to fetch stock prices for thinking process: {str(e)}")
-            stock_data = {}
+        snapshot = snapshot or PriceSnapshot.capture()
+        stock_data = snapshot.as_stock_data()
 
         # Convert and validate investment amount
         investment_amount = self._convert_to_float(preferences.get('investment_amount', 0.0))
@@ -171,23 +175,9 @@ class ReasoningAgent:
         # Handle risk profile
         risk_profile = preferences.get('risk_profile', 'moderate').lower()
         
-        # Convert time horizon string to years
+        # Convert time horizon string to years (1-30)
         time_horizon_input = str(preferences.get('time_horizon', 'medium')).lower()
-        time_horizon_mapping = {
-            'short': 2,
-            'medium': 5,
-            'long': 10,
-            'very_long': 20
-        }
-        try:
-            # First try to convert directly to int
-            time_horizon = int(time_horizon_input)
-        except ValueError:
-            # If that fails, use the mapping
-            time_horizon = time_horizon_mapping.get(time_horizon_input, 5)  # Default to 5 years if not found
-        
-        # Validate time horizon is within reasonable bounds
-        time_horizon = max(1, min(30, time_horizon))  # Limit between 1 and 30 years
+        time_horizon = horizon_years(time_horizon_input)
         
         # Calculate risk-adjusted returns based on time horizon
         # Shorter time horizons should be more conservative
@@ -209,6 +199,9 @@ class ReasoningAgent:
         moderate_fv = investment_amount * (1 + moderate_return) ** time_horizon
         aggressive_fv = investment_amount * (1 + aggressive_return) ** time_horizon
         
+        # Simulated value bands for an equal-weight basket of the allowed stocks
+        monte_carlo_context = self._monte_carlo_context(self._baseline_allocations(investment_amount), time_horizon)
+        
         # Calculate risk-based allocation limits adjusted for time horizon
         base_allocations = {
             'conservative': 0.15,  # 15% max for conservative
@@ -278,6 +271,8 @@ Consider and explicitly state your thinking about:
    - Conservative ({conservative_return*100:.1f}%/year): ${investment_amount:.2f} → ${conservative_fv:.2f}
    - Moderate ({moderate_return*100:.1f}%/year): ${investment_amount:.2f} → ${moderate_fv:.2f}
    - Aggressive ({aggressive_return*100:.1f}%/year): ${investment_amount:.2f} → ${aggressive_fv:.2f}
+   - Monte Carlo simulation of an equal-weight basket of the allowed stocks (historical returns):
+{monte_carlo_context}
 
 3. Volatility Analysis ({risk_profile} profile):
    - Daily volatility: ±${daily_risk:.2f} (±{volatility_levels['daily']*100:.1f}% of ${investment_amount:.2f})
@@ -324,9 +319,17 @@ Return ONLY the list of thoughts, with each starting with "🤔 Inner Monologue:
 """
 
         try:
-            response = self.llm.invoke(thinking_prompt)
+            if on_token is None:
+                content = self.llm.invoke(thinking_prompt).content
+            else:
+                chunks = []
+                for chunk in self.llm.stream(thinking_prompt):
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                        on_token(chunk.content)
+                content = "".join(chunks)
             # Split response into individual thoughts and clean them up
-            thoughts = [t.strip() for t in response.content.split('🤔 Inner Monologue:') if t.strip()]
+            thoughts = [t.strip() for t in content.split('🤔 Inner Monologue:') if t.strip()]
             
             # Format each thought with proper indentation and line breaks
             formatted_thoughts = []
@@ -363,22 +366,82 @@ Return ONLY the list of thoughts, with each starting with "🤔 Inner Monologue:
                 "🤔 Inner Monologue:\n    Proceeding with basic analysis based on available data."
             ]
 
-    def analyze_investment_scenario(self, preferences: Dict, is_trade: bool = False) -> Tuple[List[Dict], str, List[str], List[str]]:
+    def _baseline_allocations(self, investment_amount: float) -> Dict[str, float]:
+        """Equal dollar split of ``investment_amount`` over the allowed stocks that have price history."""
+        matrix = open_matrix()
+        symbols = [symbol for symbol in self.ALLOWED_STOCKS if matrix is not None and symbol in matrix.column]
+        return {symbol: investment_amount / len(symbols) for symbol in symbols}
+
+    def _simulate(self, allocations: Dict[str, float], time_horizon) -> List[SimulationResult]:
+        """GBM and bootstrap projections of ``allocations``; empty if there is no usable history."""
+        if not allocations or sum(allocations.values()) <= 0:
+            return []
+        try:
+            return [simulate_portfolio(allocations, time_horizon, method=method, n_paths=MONTE_CARLO_PATHS,
+                                       workers=MONTE_CARLO_WORKERS)
+                    for method in ("gbm", "bootstrap")]
+        except Exception as e:
+            logger.warning(f"Monte Carlo projection unavailable: {str(e)}")
+            return []
+
+    def _monte_carlo_context(self, allocations: Dict[str, float], time_horizon) -> str:
+        """Prompt lines with percentile bands at the first, middle and last year of the horizon."""
+        results = self._simulate(allocations, time_horizon)
+        if not results:
+            return "     Not available (no price history); do not invent simulated percentiles."
+        lines = []
+        for result in results:
+            lines.append(f"     {result.summary()}")
+            for year in sorted({1, (result.years + 1) // 2, result.years}):
+                band = {p: values[year - 1] for p, values in result.bands.items()}
+                lines.append(f"       year {year}: 5th ${band[5]:,.2f} | 25th ${band[25]:,.2f} | median ${band[50]:,.2f} "
+                             f"| 75th ${band[75]:,.2f} | 95th ${band[95]:,.2f}")
+        return "\n".join(lines)
+
+    def _projection_step(self, recommendations: List[Dict], preferences: Dict) -> Optional[str]:
+        """Reasoning step with the simulated outcome of the recommended buys, or None."""
+        allocations = {}
+        for rec in recommendations:
+            if rec.get("Action") == "Buy" and rec.get("TotalCost", 0) > 0:
+                allocations[rec["Symbol"]] = allocations.get(rec["Symbol"], 0.0) + rec["TotalCost"]
+        results = self._simulate(allocations, preferences.get('time_horizon', 'medium'))
+        if not results:
+            return None
+        return "🎲 Monte Carlo projection of the recommended portfolio\n" + "\n".join(f"  {result.summary()}" for result in results)
+
+    def _technical_context(self) -> str:
+        """Computed indicator lines for the allowed stocks, or a note that there are none."""
+        try:
+            indicators = get_indicators()
+        except Exception as e:
+            logger.error(f"Failed to load technical indicators: {str(e)}")
+            indicators = None
+        if indicators is None:
+            return "Not available (no price history); do not state indicator values."
+        lines = summarize(self.ALLOWED_STOCKS, indicators)
+        return f"daily bars as of {indicators.attrs.get('as_of')}\n" + "\n".join(f"  - {line}" for line in lines.values())
+
+    def analyze_investment_scenario(self, preferences: Dict, is_trade: bool = False, snapshot: PriceSnapshot = None,
+                                    include_thinking: bool = True) -> Tuple[List[Dict], str, List[str], List[str]]:
         """
         Perform a detailed analysis of the investment scenario with step-by-step reasoning.
+        All prices come from ``snapshot``; one is captured if not given. Pass
+        ``include_thinking=False`` when the thinking process is produced separately.
         Returns: (recommendations, insights, reasoning_steps, thinking_process)
         """
         reasoning_steps = []
-        thinking_process = self._get_thinking_process(preferences)
+        snapshot = snapshot or PriceSnapshot.capture()
+        thinking_process = self._get_thinking_process(preferences, snapshot) if include_thinking else []
         
         try:
-            # Fetch current stock data
-            from scripts.fetch_stock_prices import fetch_stock_prices
-            stock_data = fetch_stock_prices()
+            stock_data = snapshot.as_stock_data()
+            reasoning_steps.append(snapshot.describe())
             
             # Add investment amount to prompt for better quantity calculation
             investment_amount = self._convert_to_float(preferences.get('investment_amount', 0.0))
             reasoning_steps.append(f"Investment amount specified: ${investment_amount:.2f}")
+            technical_context = self._technical_context()
+            forecast_context = self.forecaster.describe(self.ALLOWED_STOCKS)
             
             # Combined analysis prompt that includes initial analysis, market context, and recommendations
             comprehensive_prompt = f"""You are an expert investment advisor performing a detailed market analysis and generating recommendations.
@@ -391,6 +454,8 @@ Input Parameters:
 - Investment Budget: ${investment_amount:.2f}
 - Current Market Data: {json.dumps({symbol: {"price": data.get("current_price", 0.0)} for symbol, data in stock_data.items()}, indent=2)}
 - Allowed Stocks: {json.dumps(self.ALLOWED_STOCKS)}
+- Technical Indicators: {technical_context}
+- Model Forecasts: {forecast_context}
 
 Required JSON Structure:
 {{
@@ -407,9 +472,9 @@ Required JSON Structure:
             "market_sentiment": "Detailed sentiment analysis with specific indicators (Fear & Greed, Put/Call ratio, etc.)",
             "technical_overview": {{
                 "short_term_trend": "Detailed analysis of 10-20 day price action",
-                "medium_term_trend": "50-day moving average analysis and market structure",
-                "long_term_trend": "200-day moving average and major trend analysis",
-                "momentum_indicators": "RSI, MACD, and other key technical signals",
+                "medium_term_trend": "Analysis of price vs the provided SMA50 and market structure",
+                "long_term_trend": "Analysis of price vs the provided SMA200 and major trend",
+                "momentum_indicators": "Reading of the provided RSI, MACD and Bollinger values",
                 "volume_analysis": "Trading volume trends and significant levels"
             }}
         }},
@@ -553,12 +618,17 @@ REQUIREMENTS:
 8. Include exactly 3 recommendations
 9. Format all currency values as numbers without $ signs
 10. Use proper JSON syntax with double quotes for strings
+11. Take every moving average, RSI, MACD, Bollinger and ATR figure from Technical Indicators; never estimate them
+12. Quote expected returns only from Model Forecasts (expected_return_pct over horizon_trading_days); never invent forecasts
 
 The response must be a single, valid JSON object that can be parsed by json.loads().
 """
 
             response = self.llm.invoke(comprehensive_prompt)
             complete_analysis = self._parse_json_response(response.content)
+            if "error" in complete_analysis:
+                # Do not keep serving the unparseable answer from the cache
+                self.llm.invalidate(comprehensive_prompt)
 
             # Extract components from the comprehensive analysis
             recommendations = complete_analysis.get("recommendations", [])
@@ -600,7 +670,7 @@ The response must be a single, valid JSON object that can be parsed by json.load
                         continue
 
                     # Get current price and validate quantity
-                    current_price = self._get_current_price(validated_rec["Symbol"])
+                    current_price = self._get_current_price(validated_rec["Symbol"], snapshot)
                     quantity = validated_rec["Quantity"]
                     total_cost = current_price * quantity
 
@@ -684,6 +754,10 @@ The response must be a single, valid JSON object that can be parsed by json.load
                 )
                 reasoning_steps.append(formatted_output)
             
+            projection = self._projection_step(validated_recommendations, preferences)
+            if projection:
+                reasoning_steps.append(projection)
+            
             reasoning_steps.extend([
                 "✅ Validated investment amounts and share quantities",
                 "🏁 Compiled final market insights and guidance"
@@ -694,9 +768,10 @@ The response must be a single, valid JSON object that can be parsed by json.load
             logger.error(f"Reasoning analysis failed: {str(e)}")
             return [], "Analysis failed due to technical issues.", reasoning_steps, thinking_process
 
-    def validate_trade(self, recommendation: Dict, preferences: Dict) -> Tuple[bool, str, List[str]]:
+    def validate_trade(self, recommendation: Dict, preferences: Dict, snapshot: PriceSnapshot = None) -> Tuple[bool, str, List[str]]:
         """
-        Validate a specific trade recommendation with detailed reasoning steps.
+        Validate a specific trade recommendation with detailed reasoning steps,
+        pricing it from ``snapshot`` so it matches the analysis that produced it.
         Returns: (is_valid, explanation, reasoning_steps)
         """
         reasoning_steps = []
@@ -707,7 +782,7 @@ The response must be a single, valid JSON object that can be parsed by json.load
                 return False, f"Invalid stock symbol: {recommendation['Symbol']} is not in the allowed list", reasoning_steps
 
             # Validate trade amount
-            current_price = self._get_current_price(recommendation["Symbol"])
+            current_price = self._get_current_price(recommendation["Symbol"], snapshot)
             if current_price <= 0:
                 return False, f"Could not get valid price for {recommendation['Symbol']}", reasoning_steps
 
@@ -795,6 +870,8 @@ Return ONLY the JSON object, no other text."""
 
             response = self.llm.invoke(validation_prompt)
             validation_result = self._parse_json_response(response.content)
+            if "error" in validation_result:
+                self.llm.invalidate(validation_prompt)
             
             # Extract validation decision
             validation = validation_result.get("validation", {}).get("validation_result", {})
@@ -901,7 +978,10 @@ Return analysis in this exact JSON format:
 Return ONLY the JSON object, no other text."""
 
             response = self.llm.invoke(market_prompt)
-            return self._parse_json_response(response.content)
+            analysis = self._parse_json_response(response.content)
+            if "error" in analysis:
+                self.llm.invalidate(market_prompt)
+            return analysis
         except Exception as e:
             logger.error(f"Market analysis failed: {str(e)}")
             return {
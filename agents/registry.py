@@ -0,0 +1,100 @@
+"""Process-level agent instances shared by every session and workflow run.
+
+Agents are built lazily on first use, once per process, under a per-agent
+lock. Agents exposing ``check_health()`` (currently the educator's Ollama
+check) are probed once while they are built, so the first caller already
+sees the real status, and then in the background every
+``HEALTH_REFRESH_INTERVAL`` seconds. ``check_health`` must therefore be
+cheap: the educator's is a model listing with a short timeout.
+"""
+import threading
+import time
+from typing import Dict
+
+from utils.logger import logger
+from .educator import EducatorAgent
+from .executor import ExecutorAgent
+from .forecaster import ForecastAgent
+from .market_analyst import MarketAnalystAgent
+from .monitor_guardrail import MonitorGuardrailAgent
+from .preference_parser import PreferenceParserAgent
+from .reasoning_agent import ReasoningAgent
+from .strategist import StrategistAgent
+
+HEALTH_REFRESH_INTERVAL = 60
+
+AGENT_FACTORIES = {
+    "educator": lambda: EducatorAgent(probe=False),
+    "executor": ExecutorAgent,
+    "forecaster": ForecastAgent,
+    "market_analyst": MarketAnalystAgent,
+    "guardrail": MonitorGuardrailAgent,
+    "preference_parser": PreferenceParserAgent,
+    "reasoning": ReasoningAgent,
+    "strategist": StrategistAgent,
+}
+
+_agents = {}
+_build_locks = {name: threading.Lock() for name in AGENT_FACTORIES}
+_health = {}
+_health_lock = threading.Lock()
+_refresher = None
+_refresher_lock = threading.Lock()
+
+def get_agent(name: str):
+    """Return the shared instance of agent ``name``, building it on first use."""
+    agent = _agents.get(name)
+    if agent is not None:
+        return agent
+    if name not in AGENT_FACTORIES:
+        raise KeyError(f"Unknown agent: {name}")
+    with _build_locks[name]:
+        agent = _agents.get(name)
+        if agent is None:
+            started = time.monotonic()
+            agent = AGENT_FACTORIES[name]()
+            if hasattr(agent, "check_health"):
+                _check(name, agent)
+                start_health_refresh()
+            _agents[name] = agent
+            logger.info(f"Built shared {name} agent in {time.monotonic() - started:.2f}s")
+    return agent
+
+def _check(name: str, agent):
+    try:
+        healthy = bool(agent.check_health())
+        error = None
+    except Exception as e:
+        logger.error(f"Health check for {name} failed: {str(e)}")
+        healthy, error = False, str(e)
+    with _health_lock:
+        _health[name] = {"healthy": healthy, "checked_at": time.time(), "error": error}
+
+def refresh_health():
+    """Run ``check_health`` on every built agent that has one."""
+    for name, agent in list(_agents.items()):
+        if hasattr(agent, "check_health"):
+            _check(name, agent)
+
+def agent_health() -> Dict[str, Dict]:
+    """Last health result per agent: healthy, checked_at (epoch seconds) and error."""
+    with _health_lock:
+        return {name: dict(state) for name, state in _health.items()}
+
+def start_health_refresh(interval: float = HEALTH_REFRESH_INTERVAL):
+    """Start the background health refresher once per process."""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is not None and _refresher.is_alive():
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    refresh_health()
+                except Exception as e:
+                    logger.error(f"Agent health refresh failed: {str(e)}")
+
+        _refresher = threading.Thread(target=loop, name="agent-health", daemon=True)
+        _refresher.start()
@@ -1,7 +1,8 @@
-from langchain_groq import ChatGroq
-from utils.config import GROQ_API_KEY
+from utils.clients import get_groq_llm
+from utils.llm_cache import CachedLLM
 from utils.logger import logger
-from typing import List, Dict
+from agents.forecaster import ForecastAgent
+from typing import List, Dict, Iterator
 import json
 import time
 import re
@@ -9,7 +10,8 @@ import re
 class StrategistAgent:
     
     def __init__(self):
-        self.llm = ChatGroq(model_name="llama-3.1-8b-instant", api_key=GROQ_API_KEY)
+        self.llm = CachedLLM(get_groq_llm("llama-3.1-8b-instant"), namespace="strategist", ttl=900)
+        self.forecaster = ForecastAgent()
 
     def generate_recommendations(self, preferences: Dict, market_data: List[Dict]) -> List[Dict]:
         STOCK_LIST = ["AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "NVDA", "META", "JPM", "WMT", "V"]
@@ -26,6 +28,7 @@ class StrategistAgent:
         if not valid_symbols:
             logger.error("No valid symbols in market data")
             return []
+        forecast_context = self.forecaster.describe(sorted(valid_symbols))
 
         for attempt in range(3):
             try:
@@ -34,11 +37,13 @@ class StrategistAgent:
 You are a stock market expert. Generate up to 3 to 5 stock recommendations based on:
 - User Preferences: {preferences}
 - Market Data: {market_data}
+- Model Forecasts (forward returns from the trained forecast model): {forecast_context}
 
 Consider:
 - Risk appetite, investment goals, time horizon, investment amount, and style.
 - Real-time prices, 5 years of financials (income, balance, cash flows).
 - News sentiment, P/E ratio, debt-to-equity ratio for each stock.
+- Model Forecasts: expected_return_pct over horizon_trading_days, signal and rank_pct. Quote forecasts only from there.
 - Ensure the total cost (Quantity * price) is less than or equal to investment_amount in {preferences}
 - Only these stocks: {', '.join(valid_symbols)}
 
@@ -91,6 +96,7 @@ Example:
                         logger.warning(f"Attempt {attempt + 1}: No JSON delimiters, extracted raw JSON: {json_str}")
                     else:
                         logger.error(f"Attempt {attempt + 1}: No JSON block found")
+                        self.llm.invalidate(prompt)
                         if attempt < 2:
                             time.sleep(5 * (2 ** attempt))
                             continue
@@ -118,12 +124,14 @@ Example:
                     return rec_list
                 except json.JSONDecodeError as e:
                     logger.error(f"Attempt {attempt + 1}: Failed to parse JSON: {str(e)}")
+                    self.llm.invalidate(prompt)
                     if attempt < 2:
                         time.sleep(5 * (2 ** attempt))
                         continue
                     return []
                 except ValueError as e:
                     logger.error(f"Attempt {attempt + 1}: Invalid format: {str(e)}")
+                    self.llm.invalidate(prompt)
                     if attempt < 2:
                         time.sleep(5 * (2 ** attempt))
                         continue
@@ -216,6 +224,7 @@ Example:
                         if not (json_str.startswith('{') or json_str.startswith('[')):
                             json_str = '{' + json_str + '}' if 'SelectedRecommendation' in json_str else json_str
                         logger.error(f"Attempt {attempt + 1}: No JSON block found, attempting to parse: {json_str}")
+                        self.llm.invalidate(prompt)
                         if attempt < 2:
                             time.sleep(5 * (2 ** attempt))
                             continue
@@ -247,12 +256,14 @@ Example:
                     return selected_rec
                 except json.JSONDecodeError as e:
                     logger.error(f"Attempt {attempt + 1}: Failed to parse JSON: {str(e)}, raw response: {raw_response}")
+                    self.llm.invalidate(prompt)
                     if attempt < 2:
                         time.sleep(5 * (2 ** attempt))
                         continue
                     return {}
                 except ValueError as e:
                     logger.error(f"Attempt {attempt + 1}: Invalid format: {str(e)}, raw response: {raw_response}")
+                    self.llm.invalidate(prompt)
                     if attempt < 2:
                         time.sleep(5 * (2 ** attempt))
                         continue
@@ -271,16 +282,19 @@ Example:
         logger.error("All attempts to select recommendation failed")
         return {}
 
-    def provide_strategy(self, user_message: str) -> str:
-        """Provide strategic investment advice based on user's question."""
-        try:
-            prompt = f"""Based on this user question: "{user_message}"
+    def _strategy_prompt(self, user_message: str) -> str:
+        return f"""Based on this user question: "{user_message}"
             Provide strategic investment advice. Focus on:
             1. Relevant investment strategies
             2. Risk management considerations
             3. Portfolio allocation suggestions
             4. Timing and market condition considerations
             Keep it practical and actionable."""
+
+    def provide_strategy(self, user_message: str) -> str:
+        """Provide strategic investment advice based on user's question."""
+        try:
+            prompt = self._strategy_prompt(user_message)
             
             response = self.llm.invoke(prompt)
             
@@ -292,4 +306,18 @@ Example:
             
         except Exception as e:
             logger.error(f"Error in strategy generation: {str(e)}")
-            return ""
\ No newline at end of file
+            return ""
+
+    def stream_strategy(self, user_message: str) -> Iterator[str]:
+        """Streaming variant of provide_strategy that yields text as the model produces it."""
+        try:
+            header_sent = False
+            for chunk in self.llm.stream(self._strategy_prompt(user_message)):
+                if not chunk.content:
+                    continue
+                if not header_sent:
+                    yield "\n**Strategic Recommendations:**\n"
+                    header_sent = True
+                yield chunk.content
+        except Exception as e:
+            logger.error(f"Error in streaming strategy generation: {str(e)}")
\ No newline at end of file
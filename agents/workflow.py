@@ -1,70 +1,311 @@
-from langgraph.graph import StateGraph, END
-from typing import TypedDict, List, Dict
+from langgraph.graph import StateGraph, START, END
+from langchain_core.runnables import RunnableConfig
+from typing import Annotated, TypedDict, List, Dict, Iterator, Optional
 from agents.reasoning_agent import ReasoningAgent
+from agents.registry import get_agent
+from data.price_snapshot import PriceSnapshot
 from utils.logger import logger
-import finnhub
-from utils.config import FINNHUB_API_KEY
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import copy
+import json
+import queue
+import threading
 import time
 
-class WorkflowState(TypedDict):
+def _merge_timings(left: Dict[str, float], right: Dict[str, float]) -> Dict[str, float]:
+    return {**(left or {}), **(right or {})}
+
+class WorkflowState(TypedDict, total=False):
     preferences: Dict
     user_id: str
+    is_trade: bool
     recommendations: List[Dict]
     market_insights: str
     reasoning_steps: List[str]
     thinking_process: List[str]
+    price_snapshot: PriceSnapshot
+    news_sentiment: Dict[str, str]
+    economic_indicators: Dict
+    validation_steps: List[str]
+    validation_timing: Optional[Dict]
+    # Written by every node concurrently, so merged rather than overwritten
+    node_timings: Annotated[Dict[str, float], _merge_timings]
+    result: Dict
 
-finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
 STOCK_LIST = ["AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "NVDA", "META", "JPM", "WMT", "V"]
 
-def run_workflow(preferences: Dict, user_id: str, is_trade: bool = False) -> Dict:
-    """Run the investment recommendation workflow with step-by-step reasoning."""
+# Trade validation fans out one LLM call per recommendation
+VALIDATION_MAX_WORKERS = 4
+VALIDATION_TIMEOUT = 90  # seconds per validate_trade call
+
+# Node outputs are reused across runs for this long (seconds)
+NODE_CACHE_TTLS = {
+    "news_sentiment": 900,
+    "economic_indicators": 3600,
+    "thinking_process": 900,
+    "main_analysis": 900
+}
+_node_caches = {name: TTLCache(maxsize=128, ttl=ttl) for name, ttl in NODE_CACHE_TTLS.items()}
+_node_cache_lock = threading.Lock()
+
+def _timed_validation(reasoning_agent: ReasoningAgent, rec: Dict, preferences: Dict, snapshot: PriceSnapshot):
+    started = time.monotonic()
+    is_valid, explanation, steps = reasoning_agent.validate_trade(rec, preferences, snapshot)
+    return is_valid, explanation, steps, time.monotonic() - started
+
+def validate_trades(reasoning_agent: ReasoningAgent, recommendations: List[Dict], preferences: Dict,
+                    snapshot: PriceSnapshot, max_workers: int = VALIDATION_MAX_WORKERS,
+                    timeout: float = VALIDATION_TIMEOUT):
+    """Validate recommendations concurrently, keeping their original order.
+
+    Each call gets ``timeout`` seconds from when its worker could start it; a
+    call that runs over is treated as invalid. Returns (valid_recommendations,
+    validation_steps, timing) where timing compares wall-clock time with the
+    summed latency of the individual calls.
+    """
+    if not recommendations:
+        return [], [], {"wall_seconds": 0.0, "summed_seconds": 0.0, "workers": 0, "timeouts": 0}
+
+    workers = max(1, min(max_workers, len(recommendations)))
+    started = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="validate_trade")
+    futures = [
+        executor.submit(_timed_validation, reasoning_agent, rec, preferences, snapshot)
+        for rec in recommendations
+    ]
+    valid_recommendations = []
+    validation_steps = []
+    summed = 0.0
+    timeouts = 0
     try:
-        reasoning_agent = ReasoningAgent()
-
-        # Initialize state
-        state = WorkflowState(
-            preferences=preferences,
-            user_id=user_id,
-            recommendations=[],
-            market_insights="",
-            reasoning_steps=[],
-            thinking_process=[]
-        )
+        for index, (rec, future) in enumerate(zip(recommendations, futures)):
+            # Calls run in waves of ``workers``, so later ones get a later deadline
+            deadline = started + timeout * (index // workers + 1)
+            try:
+                is_valid, explanation, val_steps, latency = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                timeouts += 1
+                future.cancel()
+                summed += time.monotonic() - started
+                logger.error(f"Validation of {rec.get('Symbol')} timed out after {timeout}s")
+                validation_steps.append(f"Validation of {rec.get('Symbol')} timed out; trade skipped")
+                continue
+            except Exception as e:
+                logger.error(f"Validation of {rec.get('Symbol')} failed: {str(e)}")
+                validation_steps.append(f"Validation of {rec.get('Symbol')} failed: {str(e)}")
+                continue
+            summed += latency
+            if is_valid:
+                valid_recommendations.append(rec)
+            validation_steps.extend(val_steps)
+    finally:
+        # Do not block the request on calls that already timed out
+        executor.shutdown(wait=False, cancel_futures=True)
 
-        # Run the analysis
-        recommendations, insights, steps, thinking = reasoning_agent.analyze_investment_scenario(
-            preferences,
-            is_trade=is_trade
-        )
+    wall = time.monotonic() - started
+    timing = {"wall_seconds": wall, "summed_seconds": summed, "workers": workers, "timeouts": timeouts}
+    logger.info(f"Validated {len(recommendations)} trades in {wall:.1f}s wall-clock "
+                f"vs {summed:.1f}s summed latency ({workers} workers, {timeouts} timeouts)")
+    validation_steps.append(f"Validated {len(recommendations)} trades in {wall:.1f}s "
+                            f"(sequential would take about {summed:.1f}s)")
+    return valid_recommendations, validation_steps, timing
 
-        if not recommendations:
-            logger.warning("No recommendations generated")
-            return {
-                "recommendations": [],
-                "market_insights": "Unable to generate recommendations at this time.",
-                "reasoning_steps": steps,
-                "thinking_process": thinking
-            }
-
-        # If this is a trade request, validate the recommendations
-        if is_trade:
-            valid_recommendations = []
-            validation_steps = []
-            for rec in recommendations:
-                is_valid, explanation, val_steps = reasoning_agent.validate_trade(rec, preferences)
-                if is_valid:
-                    valid_recommendations.append(rec)
-                validation_steps.extend(val_steps)
-            recommendations = valid_recommendations
-            steps.extend(validation_steps)
+class _SnapshotLoader:
+    """Captures the run's price snapshot once, however many nodes ask for it.
 
-        return {
-            "recommendations": recommendations,
-            "market_insights": insights,
-            "reasoning_steps": steps,
-            "thinking_process": thinking
-        }
+    The price node and the nodes that price off the snapshot start together;
+    the first caller fetches and the rest block until it is ready.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def get(self) -> PriceSnapshot:
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = PriceSnapshot.capture()
+            return self._snapshot
+
+def _cache_key(*parts) -> str:
+    return json.dumps(parts, sort_keys=True, default=str)
+
+def _snapshot_key(snapshot: PriceSnapshot) -> Dict:
+    return {symbol: quote["current_price"] for symbol, quote in snapshot.prices.items()}
+
+def _node(name: str, cache_key_fn=None, cacheable=None):
+    """Wrap a node function with timing and, optionally, a TTL cache.
+
+    ``cache_key_fn(state, config)`` builds the cache key; ``cacheable(update)``
+    decides whether a result is worth keeping (failed results are not cached).
+    """
+    def decorator(fn):
+        def node(state: WorkflowState, config: RunnableConfig) -> Dict:
+            started = time.monotonic()
+            key = cache_key_fn(state, config) if cache_key_fn else None
+            update = None
+            if key is not None:
+                with _node_cache_lock:
+                    update = _node_caches[name].get(key)
+                if update is not None:
+                    logger.info(f"Workflow node {name} served from cache")
+                    update = copy.deepcopy(update)
+            if update is None:
+                update = fn(state, config)
+                if key is not None and (cacheable is None or cacheable(update)):
+                    with _node_cache_lock:
+                        _node_caches[name][key] = copy.deepcopy(update)
+            elapsed = time.monotonic() - started
+            logger.info(f"Workflow node {name} finished in {elapsed:.2f}s")
+            _emit(config, {"type": "node", "name": name, "seconds": elapsed, "update": update})
+            return {**update, "node_timings": {name: elapsed}}
+        node.__name__ = name
+        return node
+    return decorator
+
+def _configurable(config: RunnableConfig, key: str):
+    return config["configurable"][key]
+
+def _emit(config: RunnableConfig, event: Dict):
+    """Send a progress event to the run's listener, if streaming was requested."""
+    on_event = config["configurable"].get("on_event")
+    if on_event is not None:
+        on_event(event)
+
+@_node("price_snapshot")
+def price_snapshot_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    return {"price_snapshot": _configurable(config, "snapshot_loader").get()}
+
+@_node("news_sentiment", cache_key_fn=lambda state, config: _cache_key(STOCK_LIST),
+       cacheable=lambda update: bool(update["news_sentiment"]))
+def news_sentiment_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    try:
+        return {"news_sentiment": _configurable(config, "market_analyst").fetch_news_sentiment(STOCK_LIST)}
+    except Exception as e:
+        logger.error(f"News sentiment node failed: {str(e)}")
+        return {"news_sentiment": {}}
+
+@_node("economic_indicators", cache_key_fn=lambda state, config: "latest",
+       cacheable=lambda update: bool(update["economic_indicators"]))
+def economic_indicators_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    try:
+        return {"economic_indicators": _configurable(config, "market_analyst").get_economic_indicators()}
+    except Exception as e:
+        logger.error(f"Economic indicators node failed: {str(e)}")
+        return {"economic_indicators": {}}
+
+def _priced_key(state: WorkflowState, config: RunnableConfig) -> str:
+    snapshot = _configurable(config, "snapshot_loader").get()
+    return _cache_key(state["preferences"], state.get("is_trade", False), _snapshot_key(snapshot))
+
+@_node("thinking_process", cache_key_fn=_priced_key, cacheable=lambda update: bool(update["thinking_process"]))
+def thinking_process_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    snapshot = _configurable(config, "snapshot_loader").get()
+    reasoning_agent = _configurable(config, "reasoning_agent")
+    on_token = None
+    if config["configurable"].get("on_event") is not None:
+        on_token = lambda text: _emit(config, {"type": "token", "content": text})
+    return {"thinking_process": reasoning_agent._get_thinking_process(state["preferences"], snapshot, on_token=on_token)}
+
+@_node("main_analysis", cache_key_fn=_priced_key, cacheable=lambda update: bool(update["recommendations"]))
+def main_analysis_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    snapshot = _configurable(config, "snapshot_loader").get()
+    recommendations, insights, steps, _ = _configurable(config, "reasoning_agent").analyze_investment_scenario(
+        state["preferences"],
+        is_trade=state.get("is_trade", False),
+        snapshot=snapshot,
+        include_thinking=False
+    )
+    return {"recommendations": recommendations, "market_insights": insights, "reasoning_steps": steps}
+
+@_node("validate_trades")
+def validate_trades_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    if not state.get("is_trade") or not state.get("recommendations"):
+        return {"validation_steps": [], "validation_timing": None}
+    recommendations, validation_steps, timing = validate_trades(
+        _configurable(config, "reasoning_agent"),
+        state["recommendations"],
+        state["preferences"],
+        _configurable(config, "snapshot_loader").get()
+    )
+    return {"recommendations": recommendations, "validation_steps": validation_steps, "validation_timing": timing}
+
+def merge_node(state: WorkflowState) -> Dict:
+    """Assemble the result dict callers of run_workflow expect."""
+    snapshot = state["price_snapshot"]
+    steps = list(state.get("reasoning_steps", [])) + list(state.get("validation_steps", []))
+    # Prefer sentiment scored from actual headlines over the label the analysis LLM guessed
+    news_sentiment = state.get("news_sentiment", {})
+    recommendations = [
+        dict(rec, NewsSentiment=news_sentiment[rec.get("Symbol")]) if rec.get("Symbol") in news_sentiment else rec
+        for rec in state.get("recommendations", [])
+    ]
+    result = {
+        "recommendations": recommendations,
+        "market_insights": state.get("market_insights", ""),
+        "reasoning_steps": steps,
+        "thinking_process": state.get("thinking_process", []),
+        "price_snapshot": snapshot.to_dict(),
+        "validation_timing": state.get("validation_timing"),
+        "news_sentiment": state.get("news_sentiment", {}),
+        "economic_indicators": state.get("economic_indicators", {}),
+        "node_timings": dict(state.get("node_timings", {}))
+    }
+    if not result["recommendations"] and not state.get("validation_steps"):
+        logger.warning("No recommendations generated")
+        result["market_insights"] = "Unable to generate recommendations at this time."
+    return {"result": result}
+
+PARALLEL_NODES = ["price_snapshot", "news_sentiment", "economic_indicators", "thinking_process", "main_analysis"]
+
+def build_workflow_graph():
+    """Compile the recommendation graph.
+
+    The five independent nodes start together from START. Trade validation
+    follows the main analysis, and merge runs once every branch has finished.
+    """
+    graph = StateGraph(WorkflowState)
+    graph.add_node("price_snapshot", price_snapshot_node)
+    graph.add_node("news_sentiment", news_sentiment_node)
+    graph.add_node("economic_indicators", economic_indicators_node)
+    graph.add_node("thinking_process", thinking_process_node)
+    graph.add_node("main_analysis", main_analysis_node)
+    graph.add_node("validate_trades", validate_trades_node)
+    graph.add_node("merge", merge_node)
+    for name in PARALLEL_NODES:
+        graph.add_edge(START, name)
+    graph.add_edge("main_analysis", "validate_trades")
+    graph.add_edge([name for name in PARALLEL_NODES if name != "main_analysis"] + ["validate_trades"], "merge")
+    graph.add_edge("merge", END)
+    return graph.compile()
+
+workflow_graph = build_workflow_graph()
+
+def run_workflow(preferences: Dict, user_id: str, is_trade: bool = False, on_event=None) -> Dict:
+    """Run the investment recommendation workflow with step-by-step reasoning.
+
+    ``on_event`` receives progress events while the graph runs: thinking
+    tokens as the model streams them (``{"type": "token"}``) and each node's
+    output as it finishes (``{"type": "node"}``).
+    """
+    try:
+        started = time.monotonic()
+        config = {"configurable": {
+            "reasoning_agent": get_agent("reasoning"),
+            "market_analyst": get_agent("market_analyst"),
+            # Every node prices off this one snapshot so results are consistent
+            "snapshot_loader": _SnapshotLoader(),
+            "on_event": on_event
+        }}
+        state = workflow_graph.invoke(
+            WorkflowState(preferences=preferences, user_id=user_id, is_trade=is_trade, node_timings={}),
+            config=config
+        )
+        result = state["result"]
+        timings = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in result["node_timings"].items())
+        logger.info(f"Workflow finished in {time.monotonic() - started:.2f}s ({timings})")
+        return result
 
     except Exception as e:
         logger.error(f"Workflow failed: {str(e)}")
@@ -73,4 +314,26 @@ def run_workflow(preferences: Dict, user_id: str, is_trade: bool = False) -> Dic
             "market_insights": f"Analysis failed: {str(e)}",
             "reasoning_steps": ["Error occurred during analysis"],
             "thinking_process": ["🤔 Thinking: An error occurred during analysis..."]
-        }
\ No newline at end of file
+        }
+
+def stream_workflow(preferences: Dict, user_id: str, is_trade: bool = False) -> Iterator[Dict]:
+    """Run the workflow in the background and yield its events as they happen.
+
+    Yields the ``run_workflow`` progress events followed by a final
+    ``{"type": "result", "content": result}`` carrying the usual result dict.
+    """
+    events = queue.Queue()
+    done = object()
+
+    def worker():
+        try:
+            events.put({"type": "result", "content": run_workflow(preferences, user_id, is_trade=is_trade, on_event=events.put)})
+        finally:
+            events.put(done)
+
+    threading.Thread(target=worker, name="workflow-stream", daemon=True).start()
+    while True:
+        event = events.get()
+        if event is done:
+            return
+        yield event
@@ -0,0 +1,392 @@
+"""Forward-return forecasts for the whole universe from lagged price features.
+
+Features are built from the price matrix (analytics/price_matrix.py) for
+every symbol and date at once, as a (dates, symbols, features) array. They
+cover lagged daily returns, momentum over several horizons, realized
+volatility, distance from moving averages, RSI, relative volume and the
+symbol's momentum against the cross-section. The target is the log return
+over the next ``HORIZON_DAYS`` trading days.
+
+Training is offline and runs on the local matrix only, on CPU. It uses
+LightGBM when it is installed and otherwise a closed-form ridge
+regression. The last ``holdout`` share of dates is held out for validation,
+with a ``HORIZON_DAYS`` gap so no training target overlaps them.
+
+    python -m analytics.forecast train [--model auto|lightgbm|ridge]
+    python -m analytics.forecast predict
+
+At inference time the features of the latest date form one (symbols,
+features) block, scored with a single ``predict`` call. ``get_forecasts()``
+caches the result per exported trading day and trained model.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import threading
+import warnings
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from analytics.indicators import rolling_std, rsi, sma
+from analytics.price_matrix import DEFAULT_PATH, PriceMatrix, open_matrix
+from utils.logger import logger
+
+HORIZON_DAYS = 21
+# Bars with volume needed in the 21-day window for the relative-volume feature
+VOLUME_MIN_PERIODS = 15
+MODEL_PATH = Path("finance_simulator/forecast_model")
+MODEL_FILE = "model.json"
+LIGHTGBM_FILE = "model.lgb.txt"
+# Rows needed for the latest features: 252-day momentum plus time for RSI smoothing to settle
+LOOKBACK = 400
+# Penalty on standardized coefficients, relative to the per-row Gram matrix
+RIDGE_ALPHA = 0.1
+# |forecast| below this share of the horizon's volatility is reported as "flat"
+FLAT_Z = 0.1
+LIGHTGBM_PARAMS = {
+    "objective": "huber",
+    "learning_rate": 0.03,
+    "num_leaves": 15,
+    "min_data_in_leaf": 200,
+    "feature_fraction": 0.8,
+    "bagging_fraction": 0.8,
+    "bagging_freq": 1,
+    "lambda_l2": 1.0,
+    "verbose": -1
+}
+LIGHTGBM_ROUNDS = 300
+FEATURES = [
+    "ret_1d", "ret_1d_lag1", "ret_1d_lag2", "mom_5d", "mom_21d", "mom_63d", "mom_126d", "mom_252_21",
+    "vol_21d", "vol_63d", "sma_50_gap", "sma_200_gap", "rsi_14", "volume_ratio_21d",
+    "rel_mom_21d", "market_mom_21d"
+]
+
+def _lag(values: np.ndarray, days: int) -> np.ndarray:
+    """``values`` shifted ``days`` rows later along axis 0, NaN-filled."""
+    out = np.full(values.shape, np.nan)
+    if days < len(values):
+        out[days:] = values[:len(values) - days]
+    return out
+
+def _lead(values: np.ndarray, days: int) -> np.ndarray:
+    """``values`` shifted ``days`` rows earlier along axis 0, NaN-filled."""
+    out = np.full(values.shape, np.nan)
+    if days < len(values):
+        out[:len(values) - days] = values[days:]
+    return out
+
+def build_features(close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """Lagged features for every (date, symbol), shape (dates, symbols, len(FEATURES)).
+
+    ``close`` should be adjusted closes. A feature is NaN until its window
+    has full history, except relative volume, which only needs
+    ``VOLUME_MIN_PERIODS`` bars with volume and is 0 for a bar without one.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        # Dates on which no symbol has 21 days of history have no market momentum
+        warnings.simplefilter("ignore", RuntimeWarning)
+        log_close = np.log(close)
+        returns = log_close - _lag(log_close, 1)
+        momentum = {days: log_close - _lag(log_close, days) for days in (5, 21, 63, 126)}
+        market = np.nanmean(momentum[21], axis=1, keepdims=True)
+        # Provisional bars have no volume: average over the bars that do and
+        # score a bar without volume as average (ratio 0)
+        average_volume = sma(volume, 21, min_periods=VOLUME_MIN_PERIODS)
+        volume_ratio = np.where(np.isnan(volume) & (average_volume > 0), 0.0, np.log(volume / average_volume))
+        columns = {
+            "ret_1d": returns,
+            "ret_1d_lag1": _lag(returns, 1),
+            "ret_1d_lag2": _lag(returns, 2),
+            "mom_5d": momentum[5],
+            "mom_21d": momentum[21],
+            "mom_63d": momentum[63],
+            "mom_126d": momentum[126],
+            "mom_252_21": _lag(log_close, 21) - _lag(log_close, 252),
+            "vol_21d": rolling_std(returns, 21),
+            "vol_63d": rolling_std(returns, 63),
+            "sma_50_gap": log_close - np.log(sma(close, 50)),
+            "sma_200_gap": log_close - np.log(sma(close, 200)),
+            "rsi_14": rsi(close) / 100.0 - 0.5,
+            "volume_ratio_21d": volume_ratio,
+            "rel_mom_21d": momentum[21] - market,
+            "market_mom_21d": np.broadcast_to(market, close.shape)
+        }
+    features = np.stack([columns[name] for name in FEATURES], axis=-1)
+    features[~np.isfinite(features)] = np.nan
+    return features
+
+def build_dataset(matrix: PriceMatrix, horizon: int = HORIZON_DAYS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Training rows (X, y, date index) for every (date, symbol) with full features and a known target."""
+    close = np.asarray(matrix.field("adj_close"))
+    features = build_features(close, np.asarray(matrix.field("volume")))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        target = np.log(_lead(close, horizon) / close)
+    dates = np.broadcast_to(np.arange(len(close))[:, None], close.shape)
+    X = features.reshape(-1, len(FEATURES))
+    y = target.reshape(-1)
+    valid = np.isfinite(X).all(axis=1) & np.isfinite(y)
+    return X[valid], y[valid], dates.reshape(-1)[valid]
+
+class RidgeModel:
+    """Ridge regression on standardized features, solved in closed form."""
+    kind = "ridge"
+
+    def __init__(self, alpha: float = RIDGE_ALPHA, mean=None, scale=None, coef=None, intercept: float = 0.0):
+        self.alpha = alpha
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float64)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+        self.coef = None if coef is None else np.asarray(coef, dtype=np.float64)
+        self.intercept = intercept
+
+    def fit(self, X: np.ndarray, y: np.ndarray) -> "RidgeModel":
+        self.mean = X.mean(axis=0)
+        self.scale = np.where(X.std(axis=0) > 0, X.std(axis=0), 1.0)
+        Z = (X - self.mean) / self.scale
+        self.intercept = float(y.mean())
+        gram = Z.T @ Z / len(Z) + self.alpha * np.eye(Z.shape[1])
+        self.coef = np.linalg.solve(gram, Z.T @ (y - self.intercept) / len(Z))
+        return self
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return ((X - self.mean) / self.scale) @ self.coef + self.intercept
+
+    def save(self, path: Path) -> Dict:
+        return {"alpha": self.alpha, "mean": self.mean.tolist(), "scale": self.scale.tolist(),
+                "coef": self.coef.tolist(), "intercept": self.intercept}
+
+    @classmethod
+    def load(cls, path: Path, state: Dict) -> "RidgeModel":
+        return cls(**state)
+
+class LightGBMModel:
+    """Gradient-boosted trees; requires the optional ``lightgbm`` package."""
+    kind = "lightgbm"
+
+    def __init__(self, booster=None):
+        self.booster = booster
+
+    def fit(self, X: np.ndarray, y: np.ndarray) -> "LightGBMModel":
+        import lightgbm
+        params = {**LIGHTGBM_PARAMS, "num_threads": os.cpu_count() or 1, "device_type": "cpu"}
+        self.booster = lightgbm.train(params, lightgbm.Dataset(X, y, feature_name=FEATURES), LIGHTGBM_ROUNDS)
+        return self
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.booster.predict(X)
+
+    def save(self, path: Path) -> Dict:
+        self.booster.save_model(str(path / LIGHTGBM_FILE))
+        return {"file": LIGHTGBM_FILE}
+
+    @classmethod
+    def load(cls, path: Path, state: Dict) -> "LightGBMModel":
+        import lightgbm
+        return cls(lightgbm.Booster(model_file=str(path / state["file"])))
+
+MODELS = {model.kind: model for model in (RidgeModel, LightGBMModel)}
+
+def lightgbm_available() -> bool:
+    return importlib.util.find_spec("lightgbm") is not None
+
+def _evaluate(predicted: np.ndarray, actual: np.ndarray, dates: np.ndarray) -> Dict:
+    """Validation metrics: mean daily rank IC, hit rate and RMSE against a zero forecast."""
+    frame = pd.DataFrame({"predicted": predicted, "actual": actual, "date": dates})
+    by_date = frame.groupby("date")
+    # Spearman correlation per date: Pearson on within-date ranks, centered per date
+    ranks = by_date[["predicted", "actual"]].rank()
+    ranks = ranks - ranks.groupby(frame["date"]).transform("mean")
+    sums = pd.DataFrame({
+        "cross": ranks["predicted"] * ranks["actual"],
+        "predicted": ranks["predicted"] ** 2,
+        "actual": ranks["actual"] ** 2
+    }).groupby(frame["date"]).sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        daily_ic = (sums["cross"] / np.sqrt(sums["predicted"] * sums["actual"]))[by_date.size() > 2]
+    return {
+        "rows": int(len(actual)),
+        "rank_ic": float(daily_ic.mean()) if daily_ic.notna().any() else None,
+        "hit_rate": float(np.mean(np.sign(predicted) == np.sign(actual))),
+        "rmse": float(np.sqrt(np.mean((predicted - actual) ** 2))),
+        "rmse_zero": float(np.sqrt(np.mean(actual ** 2)))
+    }
+
+def train(matrix_path=DEFAULT_PATH, model_path=MODEL_PATH, kind: str = "auto", holdout: float = 0.2) -> Dict:
+    """Fit a model on the exported matrix, validate it on the last dates and save it to ``model_path``.
+
+    ``kind`` is "lightgbm", "ridge" or "auto" (LightGBM when installed). The
+    saved model is refit on all rows after validation. Returns the model metadata.
+    """
+    matrix = open_matrix(matrix_path)
+    if matrix is None:
+        raise ValueError("No price matrix; run `python -m analytics.price_matrix build`")
+    if kind == "auto":
+        kind = "lightgbm" if lightgbm_available() else "ridge"
+    X, y, dates = build_dataset(matrix)
+    if len(np.unique(dates)) < 2 * HORIZON_DAYS:
+        raise ValueError(f"Not enough history to train: {len(np.unique(dates))} dates with full features")
+    # Winsorize targets so a few extreme moves do not dominate the fit
+    low, high = np.percentile(y, [1, 99])
+    y = np.clip(y, low, high)
+
+    cutoff = np.quantile(np.unique(dates), 1.0 - holdout)
+    train_rows = dates < cutoff - HORIZON_DAYS
+    valid_rows = dates >= cutoff
+    model = MODELS[kind]().fit(X[train_rows], y[train_rows])
+    validation = _evaluate(model.predict(X[valid_rows]), y[valid_rows], dates[valid_rows])
+    logger.info(f"Validated {kind} forecast model: {validation}")
+    model = MODELS[kind]().fit(X, y)
+
+    model_path = Path(model_path)
+    model_path.mkdir(parents=True, exist_ok=True)
+    metadata = {
+        "kind": kind,
+        "features": FEATURES,
+        "horizon_days": HORIZON_DAYS,
+        "matrix_version": matrix.version,
+        "data_end": str(matrix.dates[-1]),
+        "train_rows": int(len(y)),
+        "validation": validation,
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "state": model.save(model_path)
+    }
+    tmp = model_path / f"{MODEL_FILE}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(metadata, f)
+    os.replace(tmp, model_path / MODEL_FILE)
+    return metadata
+
+def load_model(model_path=MODEL_PATH) -> Tuple[Optional[object], Optional[Dict]]:
+    """The saved model and its metadata, or (None, None) if none is trained or it cannot be loaded."""
+    model_path = Path(model_path)
+    try:
+        with open(model_path / MODEL_FILE) as f:
+            metadata = json.load(f)
+    except FileNotFoundError:
+        return None, None
+    if metadata.get("features") != FEATURES:
+        logger.warning("Forecast model was trained on different features; retrain with `python -m analytics.forecast train`")
+        return None, None
+    try:
+        return MODELS[metadata["kind"]].load(model_path, metadata["state"]), metadata
+    except ImportError:
+        logger.warning(f"Forecast model needs {metadata['kind']}, which is not installed")
+        return None, None
+
+def predict_latest(matrix: PriceMatrix, model) -> pd.DataFrame:
+    """Forecast for every symbol from its latest features, scored in one batched predict.
+
+    Columns: expected_return (simple return over ``HORIZON_DAYS``), vol_21d,
+    z_score (forecast over the horizon's volatility), rank_pct (0-100,
+    across symbols) and signal (up / down / flat). Symbols without full
+    features have NaN and signal "n/a".
+    """
+    rows = slice(max(matrix.shape[0] - LOOKBACK, 0), None)
+    features = build_features(np.asarray(matrix.field("adj_close")[rows]), np.asarray(matrix.field("volume")[rows]))
+    latest = features[-1] if len(features) else np.empty((0, len(FEATURES)))
+    usable = np.isfinite(latest).all(axis=1)
+    predicted = np.full(len(latest), np.nan)
+    if usable.any():
+        predicted[usable] = model.predict(latest[usable])
+    forecasts = pd.DataFrame({
+        "expected_return": np.expm1(predicted),
+        "vol_21d": latest[:, FEATURES.index("vol_21d")]
+    }, index=pd.Index(matrix.symbols, name="symbol"))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        forecasts["z_score"] = predicted / (forecasts["vol_21d"] * np.sqrt(HORIZON_DAYS))
+    forecasts["rank_pct"] = forecasts["expected_return"].rank(pct=True) * 100
+    forecasts["signal"] = np.select(
+        [~usable, forecasts["z_score"] > FLAT_Z, forecasts["z_score"] < -FLAT_Z], ["n/a", "up", "down"], "flat"
+    )
+    return forecasts
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def get_forecasts(path=DEFAULT_PATH, model_path=MODEL_PATH) -> Optional[pd.DataFrame]:
+    """Cached ``predict_latest`` for the exported matrix, or None without a matrix or a trained model.
+
+    Recomputed only when the matrix gains a trading day or the model is retrained.
+    """
+    matrix = open_matrix(path)
+    if matrix is None:
+        return None
+    try:
+        saved_at = os.stat(Path(model_path) / MODEL_FILE).st_mtime
+    except FileNotFoundError:
+        return None
+    key = (str(path), matrix.version, matrix.shape[0], str(model_path), saved_at)
+    with _cache_lock:
+        if key not in _cache:
+            model, metadata = load_model(model_path)
+            if model is None:
+                return None
+            _cache.clear()
+            forecasts = predict_latest(matrix, model)
+            forecasts.attrs.update({
+                "as_of": str(matrix.dates[-1]) if len(matrix.dates) else None,
+                "model": metadata["kind"],
+                "horizon_days": metadata["horizon_days"],
+                "trained_at": metadata["trained_at"],
+                "rank_ic": metadata["validation"].get("rank_ic")
+            })
+            _cache[key] = forecasts
+        return _cache[key]
+
+def forecast_inputs(symbols: Iterable[str], forecasts: Optional[pd.DataFrame] = None) -> Dict:
+    """Structured forecasts for ``symbols`` for agent prompts; {} without a trained model."""
+    forecasts = get_forecasts() if forecasts is None else forecasts
+    if forecasts is None:
+        return {}
+    by_symbol = {}
+    for symbol in symbols:
+        if symbol not in forecasts.index or forecasts.at[symbol, "signal"] == "n/a":
+            continue
+        row = forecasts.loc[symbol]
+        by_symbol[symbol] = {
+            "expected_return_pct": round(float(row["expected_return"]) * 100, 2),
+            "signal": row["signal"],
+            "z_score": round(float(row["z_score"]), 2),
+            "rank_pct": round(float(row["rank_pct"]), 1)
+        }
+    rank_ic = forecasts.attrs.get("rank_ic")
+    return {
+        "model": forecasts.attrs.get("model"),
+        "horizon_trading_days": forecasts.attrs.get("horizon_days"),
+        "as_of": forecasts.attrs.get("as_of"),
+        "validation_rank_ic": round(rank_ic, 3) if rank_ic is not None else None,
+        "forecasts": by_symbol
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and run the forward-return forecast model.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fit = commands.add_parser("train", help="Fit and validate a model on the exported price matrix")
+    fit.add_argument("--model", choices=["auto", "lightgbm", "ridge"], default="auto")
+    fit.add_argument("--holdout", type=float, default=0.2, help="Share of the latest dates held out for validation")
+    fit.add_argument("--path", default=str(DEFAULT_PATH))
+    fit.add_argument("--model-path", default=str(MODEL_PATH))
+    show = commands.add_parser("predict", help="Print the latest forecasts for every symbol")
+    show.add_argument("--path", default=str(DEFAULT_PATH))
+    show.add_argument("--model-path", default=str(MODEL_PATH))
+    args = parser.parse_args()
+
+    if args.command == "train":
+        metadata = train(args.path, args.model_path, kind=args.model, holdout=args.holdout)
+        print(f"Trained {metadata['kind']} on {metadata['train_rows']} rows to {metadata['data_end']}; "
+              f"validation {metadata['validation']}")
+        return
+    forecasts = get_forecasts(args.path, args.model_path)
+    if forecasts is None:
+        print("No forecasts: build the price matrix and run `python -m analytics.forecast train` first")
+        return
+    print(f"{forecasts.attrs['model']} forecasts over {forecasts.attrs['horizon_days']} trading days "
+          f"as of {forecasts.attrs['as_of']}")
+    print(forecasts.sort_values("expected_return", ascending=False).to_string(float_format=lambda v: f"{v:.4f}"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Technical indicators for the whole universe in one vectorized pass.
+
+Works on the dates x symbols arrays of the price matrix
+(analytics/price_matrix.py), so every indicator is computed for every symbol
+at once, over the last ``LOOKBACK`` trading days. Rolling means are
+differences of one cumulative sum. Exponential averages (EMA, Wilder's RSI
+and ATR smoothing) are a single loop over dates that updates all symbols
+together. Trend indicators use adjusted closes.
+High and low are scaled by the same adjustment factor for ATR, so splits do
+not show up as volatility.
+
+Missing bars (NaN) are skipped: a rolling window containing one is NaN, and
+exponential averages carry their last value over the gap.
+
+``get_indicators()`` computes the latest values once per exported trading
+day and caches them; ``summary_line()`` renders one symbol compactly for
+LLM prompts.
+"""
+import threading
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from analytics.price_matrix import DEFAULT_PATH, PriceMatrix, open_matrix
+
+SMA_WINDOWS = (20, 50, 200)
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+BOLLINGER_WINDOW, BOLLINGER_WIDTH = 20, 2.0
+# Rows needed: SMA200 plus enough for the slowest EMA's seed to decay below 1e-12
+LOOKBACK = 400
+
+def sma(values: np.ndarray, window: int, min_periods: Optional[int] = None) -> np.ndarray:
+    """Simple moving average along axis 0, skipping NaNs.
+
+    NaN wherever fewer than ``min_periods`` (default ``window``) of the
+    window's rows are valid.
+    """
+    valid = ~np.isnan(values)
+    sums = np.cumsum(np.where(valid, values, 0.0), axis=0)
+    counts = np.cumsum(valid, axis=0)
+    out = np.full(values.shape, np.nan)
+    if len(values) < window:
+        return out
+    window_sums = sums[window - 1:].copy()
+    window_sums[1:] -= sums[:-window]
+    window_counts = counts[window - 1:].copy()
+    window_counts[1:] -= counts[:-window]
+    min_periods = window if min_periods is None else min_periods
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[window - 1:] = np.where(window_counts >= min_periods, window_sums / window_counts, np.nan)
+    return out
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """Population standard deviation over ``window`` rows, from the rolling mean of squares."""
+    mean = sma(values, window)
+    variance = sma(values * values, window) - mean * mean
+    return np.sqrt(np.maximum(variance, 0.0))
+
+def ema(values: np.ndarray, alpha: float) -> np.ndarray:
+    """Exponential average along axis 0, seeded with each column's first valid value."""
+    out = np.empty(values.shape)
+    state = np.full(values.shape[1:], np.nan)
+    for t in range(len(values)):
+        row = values[t]
+        np.copyto(state, row, where=np.isnan(state))
+        step = alpha * (row - state)
+        np.add(state, step, out=state, where=~np.isnan(step))
+        out[t] = state
+    return out
+
+def rsi(close: np.ndarray, period: int = RSI_PERIOD) -> np.ndarray:
+    """Wilder's RSI in [0, 100]."""
+    change = np.full(close.shape, np.nan)
+    change[1:] = np.diff(close, axis=0)
+    gains = ema(np.where(change > 0, change, np.where(np.isnan(change), np.nan, 0.0)), 1.0 / period)
+    losses = ema(np.where(change < 0, -change, np.where(np.isnan(change), np.nan, 0.0)), 1.0 / period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(losses == 0, np.where(gains > 0, 100.0, 50.0), 100.0 - 100.0 / (1.0 + gains / losses))
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = ATR_PERIOD) -> np.ndarray:
+    """Average true range with Wilder smoothing."""
+    previous = np.full(close.shape, np.nan)
+    previous[1:] = close[:-1]
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - previous), np.abs(low - previous)))
+    return ema(true_range, 1.0 / period)
+
+def compute_indicators(matrix: PriceMatrix) -> pd.DataFrame:
+    """Latest indicator values per symbol, from the last ``LOOKBACK`` rows of the matrix.
+
+    Columns: close, sma_20/50/200, ema_12/26, rsi_14, macd, macd_signal,
+    macd_hist, bb_upper, bb_lower, bb_pct_b, atr_14, atr_pct and
+    return_20d. NaN where a symbol has too little history.
+    """
+    rows = slice(max(matrix.shape[0] - LOOKBACK, 0), None)
+    close = np.asarray(matrix.field("adj_close")[rows])
+    raw_close = np.asarray(matrix.field("close")[rows])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factor = close / raw_close
+    high = np.asarray(matrix.field("high")[rows]) * factor
+    low = np.asarray(matrix.field("low")[rows]) * factor
+
+    columns = {}
+    # Last valid close per symbol, since a symbol may have no bar on the last date
+    last_valid = np.where(~np.isnan(close), np.arange(len(close))[:, None], -1).max(axis=0, initial=-1)
+
+    def last(values):
+        if not len(values):
+            return np.full(values.shape[1], np.nan)
+        taken = values[np.maximum(last_valid, 0), np.arange(values.shape[1])]
+        return np.where(last_valid >= 0, taken, np.nan)
+
+    columns["close"] = last(close)
+    for window in SMA_WINDOWS:
+        columns[f"sma_{window}"] = last(sma(close, window))
+    fast = ema(close, 2.0 / (MACD_FAST + 1))
+    slow = ema(close, 2.0 / (MACD_SLOW + 1))
+    macd_line = fast - slow
+    signal = ema(macd_line, 2.0 / (MACD_SIGNAL + 1))
+    columns[f"ema_{MACD_FAST}"] = last(fast)
+    columns[f"ema_{MACD_SLOW}"] = last(slow)
+    columns[f"rsi_{RSI_PERIOD}"] = last(rsi(close))
+    columns["macd"] = last(macd_line)
+    columns["macd_signal"] = last(signal)
+    columns["macd_hist"] = columns["macd"] - columns["macd_signal"]
+    middle = sma(close, BOLLINGER_WINDOW)
+    width = BOLLINGER_WIDTH * rolling_std(close, BOLLINGER_WINDOW)
+    columns["bb_upper"] = last(middle + width)
+    columns["bb_lower"] = last(middle - width)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        columns["bb_pct_b"] = (columns["close"] - columns["bb_lower"]) / (columns["bb_upper"] - columns["bb_lower"])
+        columns[f"atr_{ATR_PERIOD}"] = last(atr(high, low, close))
+        columns["atr_pct"] = columns[f"atr_{ATR_PERIOD}"] / columns["close"]
+        lagged = np.full(close.shape, np.nan)
+        lagged[20:] = close[:-20]
+        columns["return_20d"] = columns["close"] / last(lagged) - 1.0
+    return pd.DataFrame(columns, index=pd.Index(matrix.symbols, name="symbol"))
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def get_indicators(path=DEFAULT_PATH) -> Optional[pd.DataFrame]:
+    """Cached ``compute_indicators`` for the exported matrix, or None if there is none.
+
+    Recomputed only when the matrix gains a trading day or is rebuilt.
+    """
+    matrix = open_matrix(path)
+    if matrix is None:
+        return None
+    key = (str(path), matrix.version, matrix.shape[0])
+    with _cache_lock:
+        if key not in _cache:
+            _cache.clear()
+            indicators = compute_indicators(matrix)
+            indicators.attrs["as_of"] = str(matrix.dates[-1]) if len(matrix.dates) else None
+            _cache[key] = indicators
+        return _cache[key]
+
+def _signed_gap(price: float, average: float) -> str:
+    return f"{(price / average - 1.0) * 100:+.1f}%"
+
+def summary_line(symbol: str, row: pd.Series) -> str:
+    """One compact line, e.g. ``AAPL close 189.20 | vs SMA50 +3.9%, SMA200 +8.1% | RSI 61 | ...``."""
+    if np.isnan(row["close"]):
+        return f"{symbol}: no price history"
+    parts = [f"{symbol} close {row['close']:.2f}"]
+    averages = [f"SMA{window} {_signed_gap(row['close'], row[f'sma_{window}'])}"
+                for window in SMA_WINDOWS if not np.isnan(row[f"sma_{window}"])]
+    if averages:
+        parts.append("vs " + ", ".join(averages))
+    if not np.isnan(row[f"rsi_{RSI_PERIOD}"]):
+        parts.append(f"RSI{RSI_PERIOD} {row[f'rsi_{RSI_PERIOD}']:.0f}")
+    if not np.isnan(row["macd_hist"]):
+        parts.append(f"MACD {row['macd']:.2f}/{row['macd_signal']:.2f} ({'bullish' if row['macd_hist'] > 0 else 'bearish'})")
+    if not np.isnan(row["bb_pct_b"]):
+        parts.append(f"Bollinger %B {row['bb_pct_b']:.2f}")
+    if not np.isnan(row["atr_pct"]):
+        parts.append(f"ATR{ATR_PERIOD} {row['atr_pct'] * 100:.1f}%")
+    if not np.isnan(row["return_20d"]):
+        parts.append(f"20d {row['return_20d'] * 100:+.1f}%")
+    return " | ".join(parts)
+
+def summarize(symbols: Iterable[str], indicators: Optional[pd.DataFrame] = None) -> Dict[str, str]:
+    """Summary lines for ``symbols`` (from the cached indicators by default); {} without history."""
+    indicators = get_indicators() if indicators is None else indicators
+    if indicators is None:
+        return {}
+    return {symbol: summary_line(symbol, indicators.loc[symbol]) for symbol in symbols if symbol in indicators.index}
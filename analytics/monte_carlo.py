@@ -0,0 +1,219 @@
+"""Monte Carlo simulation of a buy-and-hold portfolio's value.
+
+Two models of correlated asset log returns, both fitted to daily history
+from the price matrix:
+
+- ``gbm``: geometric Brownian motion. The drift vector and covariance matrix
+  are estimated from daily log returns. Increments are correlated through
+  the covariance's Cholesky factor.
+- ``bootstrap``: moving block bootstrap of the historical return rows.
+  Whole ``BLOCK_DAYS``-day blocks are resampled across all assets at once, so
+  cross-asset correlation, fat tails and short-term autocorrelation are kept.
+
+Only year-end values are reported, so neither model steps day by day. A
+GBM year's increment is exactly Normal(252 mu, 252 Sigma) and is drawn in
+one step. For the bootstrap, the summed return of every possible block is
+precomputed once from a cumulative sum, so drawing a block is a single
+gather and a year is the sum of ``BLOCKS_PER_YEAR`` of them. 100k paths
+over 10 years is therefore 10 or 120 draws per path, not 2520.
+
+Paths are simulated in chunks sized to ``max_chunk_bytes``, so memory stays
+bounded whatever the path count. Each chunk keeps only the year-end values.
+Every chunk gets its own generator spawned from one ``SeedSequence``, so a
+given seed produces the same result in-process or on a process pool with
+any number of workers.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from analytics.price_matrix import DEFAULT_PATH, open_matrix
+
+TRADING_DAYS = 252
+BLOCK_DAYS = 21
+BLOCKS_PER_YEAR = TRADING_DAYS // BLOCK_DAYS
+PERCENTILES = (5, 25, 50, 75, 95)
+DEFAULT_PATHS = 20_000
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+HISTORY_YEARS = 10
+# Agents simulate with a fixed seed so the same portfolio gives the same prompt (and LLM cache hits)
+DEFAULT_SEED = 20240101
+TIME_HORIZON_YEARS = {"short": 2, "medium": 5, "long": 10, "very_long": 20}
+
+def horizon_years(time_horizon) -> int:
+    """Years for a ``time_horizon`` preference ("short", "long", "7", 7 ...), between 1 and 30."""
+    value = str(time_horizon).strip().lower()
+    try:
+        years = int(float(value))
+    except ValueError:
+        years = TIME_HORIZON_YEARS.get(value, 5)
+    return max(1, min(30, years))
+
+@dataclass
+class SimulationResult:
+    """Year-end value percentiles of the simulated portfolio."""
+    method: str
+    symbols: List[str]
+    weights: np.ndarray
+    initial_value: float
+    years: int
+    n_paths: int
+    # percentile -> values at the end of years 1..years
+    bands: Dict[int, np.ndarray]
+    final_values: np.ndarray = field(repr=False)
+    seconds: float = 0.0
+
+    @property
+    def prob_loss(self) -> float:
+        return float(np.mean(self.final_values < self.initial_value))
+
+    @property
+    def expected_value(self) -> float:
+        return float(np.mean(self.final_values))
+
+    def tail_mean(self, level: float = 0.05) -> float:
+        """Average final value of the worst ``level`` share of paths."""
+        cutoff = np.quantile(self.final_values, level)
+        return float(self.final_values[self.final_values <= cutoff].mean())
+
+    def bands_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({f"p{p}": values for p, values in self.bands.items()},
+                            index=pd.RangeIndex(1, self.years + 1, name="year"))
+
+    def summary(self) -> str:
+        """Compact text for prompts and reasoning steps."""
+        final = {p: values[-1] for p, values in self.bands.items()}
+        return (f"Monte Carlo ({self.method}, {self.n_paths:,} paths, {self.years}y) on ${self.initial_value:,.2f}: "
+                f"median ${final[50]:,.2f}, 5th-95th pct ${final[5]:,.2f}-${final[95]:,.2f}, "
+                f"25th-75th ${final[25]:,.2f}-${final[75]:,.2f}, P(loss) {self.prob_loss:.1%}, "
+                f"worst-5% average ${self.tail_mean():,.2f}")
+
+    def to_dict(self) -> Dict:
+        return {
+            "method": self.method,
+            "symbols": list(self.symbols),
+            "weights": [float(w) for w in self.weights],
+            "initial_value": self.initial_value,
+            "years": self.years,
+            "n_paths": self.n_paths,
+            "bands": {str(p): [float(v) for v in values] for p, values in self.bands.items()},
+            "prob_loss": self.prob_loss,
+            "expected_value": self.expected_value,
+            "tail_mean_5": self.tail_mean()
+        }
+
+def historical_log_returns(symbols: Sequence[str], years: float = HISTORY_YEARS, path=DEFAULT_PATH) -> np.ndarray:
+    """Daily log returns (days, symbols) from the price matrix over the last ``years``.
+
+    Only days on which every symbol has a return are kept. Raises ValueError
+    if the matrix is missing or a symbol is not in it.
+    """
+    matrix = open_matrix(path)
+    if matrix is None:
+        raise ValueError("No price matrix; run `python -m analytics.price_matrix build`")
+    missing = [symbol for symbol in symbols if symbol not in matrix.column]
+    if missing:
+        raise ValueError(f"No price history for {missing}")
+    prices = matrix.field("adj_close")[-int(years * TRADING_DAYS) - 1:, [matrix.column[s] for s in symbols]]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.diff(np.log(prices), axis=0)
+    return returns[np.isfinite(returns).all(axis=1)]
+
+def _cholesky(covariance: np.ndarray) -> np.ndarray:
+    """Cholesky factor, adding a tiny ridge if the estimate is not positive definite."""
+    ridge = 0.0
+    scale = max(np.trace(covariance) / len(covariance), 1e-12)
+    for _ in range(8):
+        try:
+            return np.linalg.cholesky(covariance + ridge * np.eye(len(covariance)))
+        except np.linalg.LinAlgError:
+            ridge = scale * 1e-10 if ridge == 0.0 else ridge * 100
+    raise ValueError("Covariance matrix is not positive definite")
+
+def _simulate_chunk(task) -> np.ndarray:
+    """Year-end portfolio values (paths, years) for one chunk; module-level so process pools can pickle it."""
+    method, n_paths, years, weights, params, seed = task
+    rng = np.random.default_rng(seed)
+    if method == "gbm":
+        drift, factor = params
+        yearly = rng.standard_normal((n_paths, years, len(weights))) @ factor.T
+        yearly += drift
+    else:
+        block_sums = params
+        blocks = block_sums[rng.integers(0, len(block_sums), size=(n_paths, years * BLOCKS_PER_YEAR))]
+        yearly = blocks.reshape(n_paths, years, BLOCKS_PER_YEAR, -1).sum(axis=2)
+    # Each asset's cumulative log return at each year end
+    np.cumsum(yearly, axis=1, out=yearly)
+    return np.exp(yearly, out=yearly) @ weights
+
+def simulate(returns: np.ndarray, weights: Sequence[float], initial_value: float, years: int,
+             method: str = "gbm", n_paths: int = DEFAULT_PATHS, seed: Optional[int] = None,
+             workers: int = 1, max_chunk_bytes: int = MAX_CHUNK_BYTES,
+             percentiles: Iterable[int] = PERCENTILES, symbols: Optional[Sequence[str]] = None) -> SimulationResult:
+    """Simulate ``n_paths`` buy-and-hold paths of a portfolio over ``years``.
+
+    ``returns`` are daily log returns (days, assets) as from
+    ``historical_log_returns``; ``weights`` are the initial value shares and
+    are normalized to sum to 1. ``workers > 1`` runs chunks on a process pool.
+    """
+    started = time.perf_counter()
+    returns = np.asarray(returns, dtype=np.float64)
+    if returns.ndim != 2 or len(returns) < 2 * BLOCK_DAYS:
+        raise ValueError(f"Need at least {2 * BLOCK_DAYS} days of returns, got {len(returns)}")
+    weights = np.asarray(weights, dtype=np.float64)
+    weights = weights / weights.sum()
+    if method == "gbm":
+        covariance = np.cov(returns, rowvar=False).reshape(len(weights), -1) * TRADING_DAYS
+        params = (returns.mean(axis=0) * TRADING_DAYS, _cholesky(covariance))
+    elif method == "bootstrap":
+        cumulative = np.vstack([np.zeros(returns.shape[1]), np.cumsum(returns, axis=0)])
+        params = cumulative[BLOCK_DAYS:] - cumulative[:-BLOCK_DAYS]
+    else:
+        raise ValueError(f"Unknown simulation method: {method}")
+
+    # The largest intermediates are (paths, draws, assets) float64 arrays, about two at once
+    draws = years * (1 if method == "gbm" else BLOCKS_PER_YEAR)
+    chunk = max(1, min(n_paths, max_chunk_bytes // (2 * 8 * draws * len(weights))))
+    sizes = [min(chunk, n_paths - start) for start in range(0, n_paths, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(method, size, years, weights, params, child) for size, child in zip(sizes, seeds)]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            values = list(pool.map(_simulate_chunk, tasks))
+    else:
+        values = [_simulate_chunk(task) for task in tasks]
+    values = np.concatenate(values) * initial_value
+
+    percentiles = tuple(percentiles)
+    quantiles = np.percentile(values, percentiles, axis=0)
+    return SimulationResult(
+        method=method,
+        symbols=list(symbols) if symbols is not None else [str(i) for i in range(len(weights))],
+        weights=weights,
+        initial_value=float(initial_value),
+        years=years,
+        n_paths=n_paths,
+        bands={p: quantiles[i] for i, p in enumerate(percentiles)},
+        final_values=values[:, -1],
+        seconds=time.perf_counter() - started
+    )
+
+def simulate_portfolio(allocations: Dict[str, float], time_horizon, method: str = "gbm",
+                       n_paths: int = DEFAULT_PATHS, seed: Optional[int] = DEFAULT_SEED, workers: int = 1,
+                       path=DEFAULT_PATH) -> SimulationResult:
+    """Simulate a portfolio given as {symbol: dollars} over a ``time_horizon`` preference.
+
+    Uses the last ``HISTORY_YEARS`` of the price matrix; raises ValueError
+    if the matrix is missing or lacks one of the symbols.
+    """
+    symbols = [symbol for symbol, amount in allocations.items() if amount > 0]
+    if not symbols:
+        raise ValueError("Portfolio has no positive allocations")
+    amounts = np.array([allocations[symbol] for symbol in symbols], dtype=np.float64)
+    returns = historical_log_returns(symbols, path=path)
+    return simulate(returns, amounts, float(amounts.sum()), horizon_years(time_horizon), method=method,
+                    n_paths=n_paths, seed=seed, workers=workers, symbols=symbols)
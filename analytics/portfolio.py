@@ -0,0 +1,243 @@
+"""Vectorized average-cost portfolio accounting.
+
+Computes holdings, cost basis, realized and unrealized P&L for a whole trade
+history with grouped NumPy/pandas operations instead of a per-trade loop. The
+results match ``gamification.virtual_currency.apply_trade_to_position`` applied
+to the same trades in order, including ignoring sells that exceed the shares held.
+
+Under average-cost accounting a buy adds its amount to the cost basis and a sell
+scales it by ``quantity_after / quantity_before``. The cost basis is therefore
+the linear recurrence ``C_k = f_k * C_{k-1} + a_k``, which between two full
+closes has the closed form ``C_k = P_k * cumsum(a_j / P_j)`` with
+``P_k = cumprod(f_j)``. A full close resets the position, so each run of trades
+between closes is evaluated as one grouped cumulative sum. Long runs of partial
+sells shrink ``P_k`` past the float range, so the product is renormalized every
+``RESCALE_LOG`` of log decay (see ``_decayed_cumsum``).
+"""
+import numpy as np
+import pandas as pd
+
+from gamification.virtual_currency import QUANTITY_EPSILON
+
+POSITION_COLUMNS = ["quantity", "cost_basis", "avg_cost", "realized_pnl"]
+# Log decay (about 1e-200) after which the running cost scale is renormalized
+RESCALE_LOG = 460.0
+
+def trades_frame(trades) -> pd.DataFrame:
+    """Normalize trade rows (list of dicts or DataFrame) into the engine's input.
+
+    Rows with a non-numeric or non-positive amount or price, or an unknown
+    trade type, are dropped. Quantity is derived as ``amount / price`` like the
+    rest of the app. Extra columns such as user_id or timestamp are kept.
+    """
+    df = trades.copy() if isinstance(trades, pd.DataFrame) else pd.DataFrame(list(trades))
+    if df.empty:
+        return pd.DataFrame(columns=["symbol", "trade_type", "amount", "price", "quantity"])
+    df["amount"] = pd.to_numeric(df["amount"], errors="coerce").astype(float)
+    df["price"] = pd.to_numeric(df["price"], errors="coerce").astype(float)
+    valid = (df["amount"] > 0) & (df["price"] > 0) & df["trade_type"].isin(["buy", "sell"])
+    if not valid.all():
+        df = df.loc[valid].reset_index(drop=True)
+    df["quantity"] = df["amount"] / df["price"]
+    return df
+
+def _grouped_cumsum(values: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """Cumulative sum restarting wherever ``groups`` changes value.
+
+    Groups must be contiguous. This is a single ``np.cumsum`` rather than a
+    pandas groupby: each segment's first value is offset by the previous
+    segment's sum, so the running total stays at the scale of one segment and
+    subtracting it back out at the boundary does not lose precision.
+    """
+    starts = np.ones(len(values), dtype=bool)
+    starts[1:] = groups[1:] != groups[:-1]
+    start_positions = np.flatnonzero(starts)
+    adjusted = np.array(values, dtype=float)
+    adjusted[start_positions[1:]] -= np.add.reduceat(values, start_positions)[:-1]
+    total = np.cumsum(adjusted)
+    lengths = np.diff(np.append(start_positions, len(values)))
+    return total - np.repeat(total[start_positions] - values[start_positions], lengths)
+
+def _decayed_cumsum(values: np.ndarray, log_scale: np.ndarray, runs: np.ndarray) -> np.ndarray:
+    """``sum(values_j * exp(log_scale_k - log_scale_j))`` over j <= k within each run.
+
+    ``log_scale`` is the running log product of the cost factors; it starts at
+    0 and never increases within a run. Each run is cut into segments spanning
+    less than ``RESCALE_LOG`` of decay and each segment is scaled from its own
+    first log scale, so neither the scale nor its reciprocal leaves the float
+    range. The scaled values of adjacent segments can differ by up to 1e200, so
+    they are summed with a groupby cumsum, which restarts exactly, rather than
+    ``_grouped_cumsum``, whose offsets would cancel the smaller segment away.
+    Each segment's final sum is then carried into the later segments of its run.
+    """
+    band = np.floor(-log_scale / RESCALE_LOG)
+    new_segment = np.ones(len(values), dtype=bool)
+    new_segment[1:] = (runs[1:] != runs[:-1]) | (band[1:] != band[:-1])
+    segments = np.cumsum(new_segment) - 1
+    starts = np.flatnonzero(new_segment)
+    local_log = log_scale - log_scale[starts][segments]
+    scaled = pd.Series(values * np.exp(-local_log)).groupby(segments).cumsum().to_numpy()
+    sums = np.exp(local_log) * scaled
+    if len(starts) == len(np.unique(runs)):
+        return sums
+
+    # Position of each segment within its run: 0 for the first segment. A run
+    # only needs another segment once its cost has decayed by another 1e-200,
+    # so the loop is short.
+    ends = np.r_[starts[1:], len(values)] - 1
+    continues = np.zeros(len(starts), dtype=bool)
+    continues[1:] = runs[starts[1:]] == runs[starts[:-1]]
+    positions = np.arange(len(starts))
+    rank = positions - np.maximum.accumulate(np.where(continues, 0, positions))
+    carried = sums[ends]
+    for level in range(1, int(rank.max()) + 1):
+        later = np.flatnonzero(rank == level)
+        carried[later] += carried[later - 1] * np.exp(log_scale[ends[later]] - log_scale[ends[later - 1]])
+    has_carry = rank[segments] > 0
+    previous = segments[has_carry] - 1
+    sums[has_carry] += carried[previous] * np.exp(log_scale[has_carry] - log_scale[ends[previous]])
+    return sums
+
+def _runs(signed: np.ndarray, groups: np.ndarray, is_sell: np.ndarray) -> tuple:
+    """Split each group into runs of trades separated by full closes.
+
+    Returns (quantity_after, closes, runs): the running quantity restarting at
+    zero in every run, a mask of the closing sells and the run label per trade.
+    """
+    closes = is_sell & (_grouped_cumsum(signed, groups) <= QUANTITY_EPSILON)
+    new_run = np.ones(len(signed), dtype=bool)
+    new_run[1:] = (groups[1:] != groups[:-1]) | closes[:-1]
+    runs = np.cumsum(new_run)
+    return _grouped_cumsum(signed, runs), closes, runs
+
+def _valid_trades(quantity: np.ndarray, is_sell: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """Mask of trades to apply, skipping each sell that exceeds the shares held.
+
+    Every pass drops the first oversell in each group and recomputes only the
+    groups that had one, so the work shrinks as groups come out clean.
+    """
+    keep = np.ones(len(quantity), dtype=bool)
+    rows = np.arange(len(quantity))
+    while len(rows):
+        sub_sell = is_sell[rows] & keep[rows]
+        signed = np.where(keep[rows], np.where(is_sell[rows], -quantity[rows], quantity[rows]), 0.0)
+        running, _, _ = _runs(signed, groups[rows], sub_sell)
+        oversold = rows[sub_sell & (running < -QUANTITY_EPSILON)]
+        if not len(oversold):
+            break
+        first = np.ones(len(oversold), dtype=bool)
+        first[1:] = groups[oversold[1:]] != groups[oversold[:-1]]
+        keep[oversold[first]] = False
+        rows = rows[np.isin(groups[rows], groups[oversold])]
+    return keep
+
+def compute_positions(trades, by=("symbol",)) -> pd.DataFrame:
+    """Compute positions from a trade history in one vectorized pass.
+
+    ``trades`` is anything ``trades_frame`` accepts. Trades are applied in
+    timestamp order when a timestamp column is present, otherwise in the given
+    order. ``by`` lists the columns that identify a position, e.g.
+    ``("user_id", "symbol")`` to process many users at once.
+
+    Returns a DataFrame indexed by ``by`` with quantity, cost_basis (cost of the
+    shares still held), avg_cost and realized_pnl. Closed positions are kept
+    with zero quantity so their realized P&L is still reported.
+    """
+    by = list(by)
+    df = trades_frame(trades)
+    if df.empty:
+        return pd.DataFrame(columns=by + POSITION_COLUMNS).set_index(by)
+
+    if len(by) == 1:
+        codes, uniques = pd.factorize(df[by[0]], sort=True)
+        group_index = pd.Index(uniques, name=by[0])
+    else:
+        grouper = df.groupby(by, sort=True)
+        codes = grouper.ngroup().to_numpy()
+        group_index = grouper.size().index
+    order = np.arange(len(df))
+    if "timestamp" in df.columns:
+        timestamps = df["timestamp"].to_numpy()
+        if not (timestamps[1:] >= timestamps[:-1]).all():
+            order = np.argsort(timestamps, kind="stable")
+    # Small integer codes let numpy use a radix sort for the stable group sort
+    codes = codes.astype(np.min_scalar_type(max(len(group_index) - 1, 0)))
+    order = order[np.argsort(codes[order], kind="stable")]
+    groups = codes[order]
+    is_sell = (df["trade_type"].to_numpy() == "sell")[order]
+    quantity = df["quantity"].to_numpy()[order]
+    amount = df["amount"].to_numpy()[order]
+    price = df["price"].to_numpy()[order]
+
+    keep = _valid_trades(quantity, is_sell, groups)
+    if not keep.all():
+        groups, is_sell, quantity, amount, price = (
+            groups[keep], is_sell[keep], quantity[keep], amount[keep], price[keep]
+        )
+        if not len(groups):
+            return pd.DataFrame(columns=by + POSITION_COLUMNS).set_index(by)
+
+    signed = np.where(is_sell, -quantity, quantity)
+    held, closes, runs = _runs(signed, groups, is_sell)
+    held_before = np.where(is_sell, held + quantity, held - quantity)
+    held[closes] = 0.0
+
+    # Per-trade cost scaling factor; the closing sell is handled separately so
+    # the running product never hits zero inside a run
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factor = np.where(is_sell & ~closes, held / held_before, 1.0)
+    cost = _decayed_cumsum(np.where(is_sell, 0.0, amount), _grouped_cumsum(np.log(factor), runs), runs)
+    cost[closes] = 0.0
+
+    cost_before = np.zeros(len(cost))
+    cost_before[1:] = cost[:-1]
+    run_start = np.ones(len(cost), dtype=bool)
+    run_start[1:] = runs[1:] != runs[:-1]
+    cost_before[run_start] = 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_before = np.where(held_before > 0, cost_before / held_before, price)
+    realized = np.where(is_sell, (price - avg_before) * quantity, 0.0)
+
+    # Groups whose trades were all skipped as oversells have no position
+    first = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    last = np.r_[first[1:], len(groups)] - 1
+    positions = pd.DataFrame({
+        "quantity": held[last],
+        "cost_basis": cost[last],
+        "realized_pnl": np.add.reduceat(realized, first),
+    }, index=group_index[groups[first]])
+    quantity_held = positions["quantity"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        positions["avg_cost"] = np.where(quantity_held > 0, positions["cost_basis"].to_numpy() / quantity_held, 0.0)
+    return positions[POSITION_COLUMNS]
+
+def positions_frame(rows) -> pd.DataFrame:
+    """Build a positions frame from materialized rows such as ``get_positions`` returns."""
+    positions = pd.DataFrame(list(rows), columns=["symbol", "quantity", "cost_basis", "realized_pnl"])
+    positions = positions.astype({"quantity": float, "cost_basis": float, "realized_pnl": float}).set_index("symbol")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        positions["avg_cost"] = np.where(
+            positions["quantity"] > 0, positions["cost_basis"] / positions["quantity"], 0.0
+        )
+    return positions[POSITION_COLUMNS]
+
+def value_positions(positions: pd.DataFrame, prices) -> pd.DataFrame:
+    """Value positions against current prices in one call.
+
+    ``prices`` is either a mapping/Series keyed by symbol or an array aligned
+    with ``positions``. Symbols without a price are valued at 0 with zero
+    unrealized P&L. Adds current_price, market_value and unrealized_pnl columns.
+    """
+    valued = positions.copy()
+    if isinstance(prices, (dict, pd.Series)):
+        symbols = valued.index.get_level_values("symbol")
+        current = pd.Series(prices, dtype=float).reindex(symbols).to_numpy()
+    else:
+        current = np.asarray(prices, dtype=float)
+    priced = np.isfinite(current) & (current > 0)
+    current = np.where(priced, current, 0.0)
+    quantity = valued["quantity"].to_numpy()
+    valued["current_price"] = current
+    valued["market_value"] = current * quantity
+    valued["unrealized_pnl"] = np.where(priced, current * quantity - valued["cost_basis"].to_numpy(), 0.0)
+    return valued
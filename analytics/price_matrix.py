@@ -0,0 +1,223 @@
+"""Dense dates x symbols price matrix exported from price_history to disk.
+
+Each field (adj_close, close, high, low, volume) is one raw float64 file, one row per
+trading date and one column per symbol, with missing bars as NaN. A JSON
+metadata file holds the symbol -> column index, the dates, the shape and the
+data file for each field. Readers memory-map the files read-only, so opening
+the matrix copies nothing, and slicing a window or a symbol is a view onto
+the page cache that every process shares.
+
+Rows are in date order. Appending new days therefore only appends bytes to
+each file and then swaps in the metadata, which is written atomically. The
+file is written before the metadata, so a reader holding the old metadata
+still sees a consistent, shorter matrix. New symbols, or a backfill of days
+before the last exported one, need a full rebuild (``--full``). It writes
+new versioned files and switches to them in the same way.
+
+    python -m analytics.price_matrix build [--full]
+    python -m analytics.price_matrix info
+"""
+import argparse
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PATH = Path("finance_simulator/price_matrix")
+METADATA_FILE = "metadata.json"
+FIELDS = ("adj_close", "close", "high", "low", "volume")
+DTYPE = np.float64
+
+class PriceMatrix:
+    """Read-only view of an exported matrix; arrays are memory maps, not copies."""
+
+    def __init__(self, path: Path, metadata: Dict):
+        self.path = Path(path)
+        self.metadata = metadata
+        self.version = metadata["version"]
+        self.symbols: List[str] = metadata["symbols"]
+        self.dates = np.array(metadata["dates"], dtype="datetime64[D]")
+        self.column = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.shape = tuple(metadata["shape"])
+        self._fields = {}
+
+    def field(self, name: str = "adj_close") -> np.ndarray:
+        """The full (dates, symbols) array for ``name`` as a read-only memmap."""
+        if name not in self._fields:
+            if not self.shape[0]:
+                self._fields[name] = np.empty(self.shape, dtype=DTYPE)
+            else:
+                self._fields[name] = np.memmap(self.path / self.metadata["files"][name], dtype=DTYPE,
+                                               mode="r", shape=self.shape)
+        return self._fields[name]
+
+    def window(self, name: str = "adj_close", start=None, end=None, symbols: Optional[Iterable[str]] = None) -> np.ndarray:
+        """Rows between ``start`` and ``end`` (inclusive). A view unless ``symbols`` selects columns."""
+        rows = slice(
+            np.searchsorted(self.dates, np.datetime64(start, "D")) if start is not None else 0,
+            np.searchsorted(self.dates, np.datetime64(end, "D"), side="right") if end is not None else None
+        )
+        values = self.field(name)[rows]
+        if symbols is not None:
+            values = values[:, [self.column[symbol] for symbol in symbols]]
+        return values
+
+    def series(self, symbol: str, name: str = "adj_close") -> np.ndarray:
+        """One symbol's column (a strided view)."""
+        return self.field(name)[:, self.column[symbol]]
+
+    def frame(self, name: str = "adj_close") -> pd.DataFrame:
+        """The field as a DataFrame backed by the memmap."""
+        return pd.DataFrame(self.field(name), index=pd.DatetimeIndex(self.dates, name="date"),
+                            columns=pd.Index(self.symbols, name="symbol"), copy=False)
+
+    def returns(self, name: str = "adj_close", log: bool = True) -> np.ndarray:
+        """Daily returns, shape (dates - 1, symbols); NaN wherever either day is missing."""
+        prices = self.field(name)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.diff(np.log(prices), axis=0) if log else prices[1:] / prices[:-1] - 1.0
+
+def _read_metadata(path: Path) -> Optional[Dict]:
+    try:
+        with open(path / METADATA_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_metadata(path: Path, metadata: Dict):
+    tmp = path / f"{METADATA_FILE}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(metadata, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path / METADATA_FILE)
+
+_open_matrices = {}
+_open_lock = threading.Lock()
+
+def open_matrix(path=DEFAULT_PATH) -> Optional[PriceMatrix]:
+    """Open the exported matrix, or None if it has not been built.
+
+    Opened matrices are reused until a build publishes a new version or
+    appends days.
+    """
+    path = Path(path)
+    metadata = _read_metadata(path)
+    if metadata is None:
+        return None
+    key = (metadata["version"], metadata["shape"][0])
+    with _open_lock:
+        cached = _open_matrices.get(path)
+        if cached is None or (cached.version, cached.shape[0]) != key:
+            cached = _open_matrices[path] = PriceMatrix(path, metadata)
+        return cached
+
+def _pivot(history: pd.DataFrame, symbols: List[str], field: str) -> pd.DataFrame:
+    return history.pivot(index="date", columns="symbol", values=field).reindex(columns=symbols)
+
+def _full_build(path: Path, history: pd.DataFrame, symbols: List[str], fields, version: int) -> Dict:
+    dates = sorted(history["date"].unique())
+    files = {}
+    for field in fields:
+        values = _pivot(history, symbols, field).reindex(dates).to_numpy(dtype=DTYPE)
+        files[field] = f"{field}.v{version}.f64"
+        values.tofile(path / files[field])
+    return {
+        "version": version,
+        "symbols": symbols,
+        "dates": [str(pd.Timestamp(day).date()) for day in dates],
+        "shape": [len(dates), len(symbols)],
+        "files": files,
+        "built_at": datetime.now(timezone.utc).isoformat()
+    }
+
+def build_matrix(path=DEFAULT_PATH, symbols: Optional[List[str]] = None, fields=FIELDS, full: bool = False) -> Dict:
+    """Export price_history to ``path``, appending only new days when possible.
+
+    ``symbols`` defaults to every symbol in price_history. A full rebuild
+    happens on first build, with ``full=True``, or when the symbols or fields
+    changed. Returns a summary with the mode, the rows added and the shape.
+
+    The history readers log DB errors and return nothing. An empty symbol
+    list or an empty history for a full rebuild therefore raises ValueError,
+    and the published matrix is kept; it is never replaced by an empty one.
+    """
+    from data.price_history import get_history, latest_dates
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    metadata = _read_metadata(path)
+    symbols = sorted(symbols or latest_dates())
+    if not symbols:
+        raise ValueError("No symbols in price_history (or it could not be read); keeping the current matrix")
+    fields = list(fields)
+
+    if metadata and not full and metadata["symbols"] == symbols and sorted(metadata["files"]) == sorted(fields):
+        last_date = metadata["dates"][-1] if metadata["dates"] else None
+        start = pd.Timestamp(last_date) + pd.Timedelta(days=1) if last_date else None
+        history = get_history(symbols, start=start)
+        if history.empty:
+            return {"mode": "incremental", "rows_added": 0, "shape": metadata["shape"]}
+        dates = sorted(history["date"].unique())
+        # Bytes past the published shape are left over from an interrupted append
+        published = metadata["shape"][0] * metadata["shape"][1] * np.dtype(DTYPE).itemsize
+        for field in fields:
+            values = _pivot(history, symbols, field).reindex(dates).to_numpy(dtype=DTYPE)
+            with open(path / metadata["files"][field], "r+b") as f:
+                f.truncate(published)
+                f.seek(published)
+                values.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        metadata = {
+            **metadata,
+            "dates": metadata["dates"] + [str(pd.Timestamp(day).date()) for day in dates],
+            "shape": [metadata["shape"][0] + len(dates), len(symbols)],
+            "built_at": datetime.now(timezone.utc).isoformat()
+        }
+        _write_metadata(path, metadata)
+        return {"mode": "incremental", "rows_added": len(dates), "shape": metadata["shape"]}
+
+    history = get_history(symbols)
+    if history.empty:
+        raise ValueError(f"No price history for {len(symbols)} symbols (or it could not be read); keeping the current matrix")
+    previous = metadata["files"].values() if metadata else []
+    metadata = _full_build(path, history, symbols, fields, (metadata["version"] + 1) if metadata else 1)
+    _write_metadata(path, metadata)
+    # Readers that already mapped the old files keep them until they close them
+    for name in previous:
+        if name not in metadata["files"].values():
+            (path / name).unlink(missing_ok=True)
+    return {"mode": "full", "rows_added": metadata["shape"][0], "shape": metadata["shape"]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Export price_history to a memory-mapped price matrix.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Append new days, or rebuild with --full")
+    build.add_argument("--full", action="store_true", help="Rebuild from scratch (after a backfill or new symbols)")
+    build.add_argument("--symbols", nargs="+", default=None)
+    build.add_argument("--path", default=str(DEFAULT_PATH))
+    info = commands.add_parser("info", help="Show what the exported matrix holds")
+    info.add_argument("--path", default=str(DEFAULT_PATH))
+    args = parser.parse_args()
+
+    if args.command == "build":
+        try:
+            print(build_matrix(args.path, symbols=args.symbols, full=args.full))
+        except ValueError as e:
+            parser.exit(1, f"{e}\n")
+        return
+    matrix = open_matrix(args.path)
+    if matrix is None:
+        print(f"No price matrix at {args.path}; run `python -m analytics.price_matrix build`")
+        return
+    first, last = (matrix.dates[0], matrix.dates[-1]) if len(matrix.dates) else ("-", "-")
+    print(f"Version {matrix.version}: {matrix.shape[0]} dates ({first} to {last}) x {matrix.shape[1]} symbols, "
+          f"fields {sorted(matrix.metadata['files'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Finance-lexicon headline sentiment scoring.
+
+Scores batches of headlines in-process so only ambiguous symbols need an LLM
+call. Headlines are tokenized once, then every token is looked up in a sorted
+vocabulary with a single ``np.searchsorted``. Negators within
+``NEGATION_WINDOW`` tokens flip and damp a word's valence, and an intensifier
+directly before it scales it. A headline's summed valence ``s`` is squashed to
+``s / sqrt(s**2 + ALPHA)`` so it falls in (-1, 1) like the LLM scores.
+
+A symbol's confidence is the share of its headlines carrying any sentiment
+word, times how much those headlines agree in sign, times how far the score
+sits from the Positive/Negative threshold. Low-confidence symbols are the
+ones worth sending to the LLM.
+"""
+import re
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+LABEL_THRESHOLD = 0.3
+ALPHA = 1.0
+NEGATION_WINDOW = 3
+NEGATION_SCALAR = -0.75
+BORDERLINE_MARGIN = 0.1
+
+FINANCE_LEXICON = {
+    # Positive
+    "beat": 0.7, "beats": 0.7, "surge": 0.8, "surges": 0.8, "surged": 0.8, "soar": 0.9, "soars": 0.9,
+    "soared": 0.9, "rally": 0.7, "rallies": 0.7, "rallied": 0.7, "jump": 0.6, "jumps": 0.6, "jumped": 0.6,
+    "gain": 0.5, "gains": 0.5, "gained": 0.5, "rise": 0.4, "rises": 0.4, "rose": 0.4, "climb": 0.5,
+    "climbs": 0.5, "climbed": 0.5, "rebound": 0.5, "rebounds": 0.5, "upgrade": 0.8, "upgrades": 0.8,
+    "upgraded": 0.8, "outperform": 0.7, "outperforms": 0.7, "bullish": 0.8, "record": 0.5, "profit": 0.5,
+    "profits": 0.5, "profitable": 0.6, "growth": 0.5, "grows": 0.5, "strong": 0.5, "stronger": 0.5,
+    "robust": 0.5, "boost": 0.5, "boosts": 0.5, "raises": 0.4, "raised": 0.4, "tops": 0.6, "topped": 0.6,
+    "exceeds": 0.6, "exceeded": 0.6, "expands": 0.4, "expansion": 0.4, "wins": 0.6, "win": 0.5,
+    "approval": 0.6, "approved": 0.6, "breakthrough": 0.8, "dividend": 0.3, "buyback": 0.4,
+    "optimistic": 0.6, "optimism": 0.6, "upbeat": 0.6, "positive": 0.5, "higher": 0.3, "high": 0.2,
+    "buy": 0.4, "overweight": 0.5, "partnership": 0.3, "innovation": 0.3, "recovery": 0.4,
+    # Negative
+    "miss": -0.7, "misses": -0.7, "missed": -0.7, "plunge": -0.9, "plunges": -0.9, "plunged": -0.9,
+    "tumble": -0.8, "tumbles": -0.8, "tumbled": -0.8, "slump": -0.7, "slumps": -0.7, "slumped": -0.7,
+    "drop": -0.5, "drops": -0.5, "dropped": -0.5, "fall": -0.5, "falls": -0.5, "fell": -0.5,
+    "decline": -0.5, "declines": -0.5, "declined": -0.5, "sink": -0.6, "sinks": -0.6, "sank": -0.6,
+    "slide": -0.5, "slides": -0.5, "crash": -0.9, "crashes": -0.9, "downgrade": -0.8, "downgrades": -0.8,
+    "downgraded": -0.8, "underperform": -0.7, "bearish": -0.8, "loss": -0.6, "losses": -0.6,
+    "lawsuit": -0.6, "sued": -0.6, "sues": -0.5, "fraud": -1.0, "probe": -0.5, "investigation": -0.5,
+    "recall": -0.6, "recalls": -0.6, "layoffs": -0.6, "layoff": -0.6, "cuts": -0.4, "cut": -0.4,
+    "warns": -0.6, "warning": -0.5, "weak": -0.5, "weaker": -0.5, "weakness": -0.5, "bankruptcy": -1.0,
+    "default": -0.8, "fine": -0.4, "fined": -0.6, "penalty": -0.5, "halt": -0.5, "halts": -0.5,
+    "delay": -0.4, "delays": -0.4, "delayed": -0.4, "concern": -0.4, "concerns": -0.4, "fears": -0.5,
+    "risk": -0.3, "risks": -0.3, "volatile": -0.3, "volatility": -0.3, "selloff": -0.7, "sell": -0.4,
+    "underweight": -0.5, "lower": -0.3, "low": -0.2, "negative": -0.5, "pessimistic": -0.6,
+    "slowdown": -0.5, "shortage": -0.4, "disappointing": -0.7, "disappoints": -0.7, "scandal": -0.8,
+    "antitrust": -0.4, "breach": -0.6, "hack": -0.6, "outage": -0.5, "resigns": -0.4,
+}
+
+NEGATIONS = {
+    "not", "no", "never", "neither", "nor", "without", "isn't", "aren't", "wasn't", "weren't",
+    "don't", "doesn't", "didn't", "won't", "can't", "cannot", "fails", "failed", "fail", "unlikely",
+}
+
+INTENSIFIERS = {
+    "sharply": 1.5, "significantly": 1.4, "strongly": 1.4, "massive": 1.5, "huge": 1.4, "major": 1.3,
+    "big": 1.2, "steep": 1.4, "deep": 1.3, "record": 1.3, "very": 1.3, "highly": 1.3, "biggest": 1.5,
+    "slightly": 0.5, "modestly": 0.6, "marginally": 0.5, "somewhat": 0.7, "mildly": 0.6,
+}
+
+_TOKEN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+def _build_vocabulary():
+    words = sorted(set(FINANCE_LEXICON) | NEGATIONS | set(INTENSIFIERS))
+    vocabulary = np.array(words)
+    valence = np.array([FINANCE_LEXICON.get(word, 0.0) for word in words])
+    boost = np.array([INTENSIFIERS.get(word, 1.0) for word in words])
+    negator = np.array([word in NEGATIONS for word in words])
+    return vocabulary, valence, boost, negator
+
+_VOCABULARY, _VALENCE, _BOOST, _NEGATOR = _build_vocabulary()
+
+def sentiment_label(score: float) -> str:
+    if score >= LABEL_THRESHOLD:
+        return "Positive"
+    if score <= -LABEL_THRESHOLD:
+        return "Negative"
+    return "Neutral"
+
+def score_headlines(headlines: Sequence[str]) -> tuple:
+    """Score each headline; returns (scores, hits) arrays aligned with ``headlines``.
+
+    ``hits`` counts the sentiment-bearing words found in each headline, so a
+    zero score with no hits means "no signal" rather than "balanced".
+    """
+    n = len(headlines)
+    token_lists = [_TOKEN.findall(str(headline).lower()) for headline in headlines]
+    counts = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=n)
+    tokens = np.array([token for tokens in token_lists for token in tokens], dtype=_VOCABULARY.dtype)
+    if not len(tokens):
+        return np.zeros(n), np.zeros(n, dtype=np.int64)
+    headline_ids = np.repeat(np.arange(n), counts)
+
+    index = np.minimum(np.searchsorted(_VOCABULARY, tokens), len(_VOCABULARY) - 1)
+    known = _VOCABULARY[index] == tokens
+    valence = np.where(known, _VALENCE[index], 0.0)
+    boost = np.where(known, _BOOST[index], 1.0)
+    negator = known & _NEGATOR[index]
+
+    # Look back within the same headline for negators and an intensifier
+    negated = np.zeros(len(tokens), dtype=bool)
+    for offset in range(1, NEGATION_WINDOW + 1):
+        negated[offset:] |= negator[:-offset] & (headline_ids[offset:] == headline_ids[:-offset])
+    scale = np.ones(len(tokens))
+    same_headline = headline_ids[1:] == headline_ids[:-1]
+    scale[1:] = np.where(same_headline, boost[:-1], 1.0)
+    valence = valence * scale * np.where(negated, NEGATION_SCALAR, 1.0)
+
+    raw = np.bincount(headline_ids, weights=valence, minlength=n)
+    hits = np.bincount(headline_ids, weights=valence != 0, minlength=n).astype(np.int64)
+    return raw / np.sqrt(raw * raw + ALPHA), hits
+
+def score_symbols(headlines: Dict[str, List[str]]) -> pd.DataFrame:
+    """Score every symbol's headlines in one batch.
+
+    Returns a DataFrame indexed by symbol with score (mean over headlines that
+    carry sentiment), sentiment label, confidence in [0, 1], headlines and hits.
+    """
+    symbols = list(headlines)
+    flat = [headline for symbol in symbols for headline in headlines[symbol]]
+    counts = np.array([len(headlines[symbol]) for symbol in symbols], dtype=np.int64)
+    groups = np.repeat(np.arange(len(symbols)), counts)
+    scores, hits = score_headlines(flat)
+
+    has_signal = hits > 0
+    signal_count = np.bincount(groups, weights=has_signal, minlength=len(symbols))
+    signal_sum = np.bincount(groups, weights=np.where(has_signal, scores, 0.0), minlength=len(symbols))
+    sign_sum = np.bincount(groups, weights=np.sign(scores), minlength=len(symbols))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = np.where(signal_count > 0, signal_sum / signal_count, 0.0)
+        coverage = np.where(counts > 0, signal_count / counts, 0.0)
+        agreement = np.where(signal_count > 0, np.abs(sign_sum) / signal_count, 0.0)
+    margin = np.minimum(1.0, np.abs(np.abs(score) - LABEL_THRESHOLD) / BORDERLINE_MARGIN)
+
+    result = pd.DataFrame({
+        "score": score,
+        "confidence": coverage * agreement * margin,
+        "headlines": counts,
+        "hits": np.bincount(groups, weights=hits, minlength=len(symbols)).astype(np.int64),
+    }, index=pd.Index(symbols, name="symbol"))
+    result.insert(1, "sentiment", [sentiment_label(value) for value in score])
+    return result
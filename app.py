@@ -2,30 +2,27 @@ import streamlit as st
 import os
 import sys
 from pathlib import Path
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 import pandas as pd
-import finnhub
-import pytz
-from decimal import Decimal
-from cachetools import TTLCache
 import time
 import mysql.connector
 from scripts.fetch_stock_prices import fetch_stock_prices
 # from utils.config import FINNHUB_API_KEY, GNEWS_API_KEY
 from utils.logger import logger
-from agents import EducatorAgent, StrategistAgent, MarketAnalystAgent, ExecutorAgent, MonitorGuardrailAgent, run_workflow
+from utils.finnhub_quota import INTERACTIVE
+from utils.singleflight import coalesced
+from agents import ExecutorAgent, MonitorGuardrailAgent, stream_workflow, get_agent
 from auth.auth import sign_up, sign_in, get_user
 from gamification.leaderboard import update_leaderboard, get_leaderboard
-from gamification.virtual_currency import get_balance, add_trade, get_portfolio
-from data.mysql_db import get_db_connection
+from gamification.virtual_currency import get_balance, add_trade, get_portfolio, get_positions
+from analytics.portfolio import positions_frame, value_positions
+from data.price_cache import get_price_cache
+from data.migrations import check_schema_version
 import requests
 import json
 import decimal
 import bcrypt
 from utils.config import *
-from agents.market_analyst import MarketAnalystAgent
-from agents.educator import EducatorAgent
-from agents.strategist import StrategistAgent
 from agents.preference_parser import PreferenceParserAgent
 
 def show_investment_assistant_page():
@@ -62,11 +59,10 @@ def show_investment_assistant_page():
             
         # Get bot response
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                educator = EducatorAgent()
-                response = educator.provide_education(prompt)
-                st.markdown(response)
-                st.session_state.messages.append({"role": "assistant", "content": response})
+            educator = get_agent("educator")
+            # Render tokens as Ollama produces them instead of waiting for the full answer
+            response = st.write_stream(educator.stream_education(prompt))
+            st.session_state.messages.append({"role": "assistant", "content": response})
 
 # Project setup
 project_root = str(Path(__file__).parent)
@@ -317,81 +313,42 @@ st.markdown("""
 STOCK_LIST = ["UNH", "TSLA", "QCOM", "ORCL", "NVDA", "NFLX", "MSFT", "META", "LLY", "JNJ", 
               "INTC", "IBM", "GOOGL", "GM", "F", "CSCO", "AMZN", "AMD", "ADBE", "AAPL"]
 
-# Initialize Finnhub client
-try:
-    finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
-except Exception as e:
-    logger.error(f"Failed to initialize Finnhub client: {str(e)}")
-    st.error(f"Finnhub initialization failed: {str(e)}")
-    raise
+# Every price read goes through the shared memory -> DB -> Finnhub cache
+price_cache = get_price_cache()
+# While the market is open, trades are priced from a quote at most this many seconds old
+TRADE_PRICE_MAX_AGE = 15
 
-# Cache for stock prices (1-hour TTL)
-price_cache = TTLCache(maxsize=100, ttl=3600)
+def run_workflow_streaming(preferences: dict, user_id: str, is_trade: bool = False) -> dict:
+    """Run the workflow while streaming the agent's thinking and insights into the page.
 
-def get_stock_price_from_db(symbol: str) -> dict:
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT open_price, close_price, high_price, low_price, current_price, last_updated
-            FROM stock_prices
-            WHERE symbol = %s
-        """, (symbol,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+    Returns the same result dict as run_workflow once every node has finished.
+    """
+    outcome = {}
+    status = st.status("Analyzing investment scenario...", expanded=True)
 
-        if result:
-            last_updated = result["last_updated"]
-            if last_updated:
-                # If last_updated is naive, assume it's in UTC and make it offset-aware
-                if last_updated.tzinfo is None:
-                    last_updated = pytz.timezone("UTC").localize(last_updated)
-                # Compare with current UTC time minus 1 hour
-                if last_updated >= datetime.now(timezone.utc) - timedelta(hours=1):
-                    logger.info(f"Fetched recent price for {symbol} from DB")
-                    return {
-                        "o": result["open_price"],
-                        "c": result["current_price"],
-                        "h": result["high_price"],
-                        "l": result["low_price"],
-                        "pc": result["close_price"]
-                    }
-            logger.info(f"No recent or valid price for {symbol} in DB")
-        else:
-            logger.info(f"No price data found for {symbol} in DB")
-        return None
-    except Exception as e:
-        logger.error(f"Failed to fetch price from DB for {symbol}: {str(e)}")
-        return None
+    def stream_text():
+        for event in stream_workflow(preferences, user_id, is_trade=is_trade):
+            if event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "node":
+                status.update(label=f"Analyzing investment scenario... ({event['name'].replace('_', ' ')} done)")
+                if event["name"] == "main_analysis" and event["update"].get("market_insights"):
+                    yield f"\n\n**Market insights:** {event['update']['market_insights']}\n\n"
+            elif event["type"] == "result":
+                outcome["result"] = event["content"]
 
-def update_stock_price_in_db(symbol: str, quote: dict):
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO stock_prices (symbol, open_price, close_price, high_price, low_price, current_price, timestamp, last_updated)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                open_price = %s,
-                close_price = %s,
-                high_price = %s,
-                low_price = %s,
-                current_price = %s,
-                timestamp = %s,
-                last_updated = %s
-        """, (
-            symbol, quote["o"], quote["pc"], quote["h"], quote["l"], quote["c"], datetime.now(timezone.utc), datetime.now(timezone.utc),
-            quote["o"], quote["pc"], quote["h"], quote["l"], quote["c"], datetime.now(timezone.utc), datetime.now(timezone.utc)
-        ))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        logger.info(f"Updated price for {symbol} in DB")
-    except Exception as e:
-        logger.error(f"Failed to update price in DB for {symbol}: {str(e)}")
+    with status:
+        st.write_stream(stream_text())
+    status.update(label="Analysis finished", state="complete", expanded=False)
+    return outcome.get("result", {
+        "recommendations": [],
+        "market_insights": "Analysis failed before producing a result.",
+        "reasoning_steps": [],
+        "thinking_process": []
+    })
 
-# News fetching function for server-side API
+# News fetching function for server-side API; concurrent sessions share one GNews call per symbol
+@coalesced("gnews", key=lambda symbol: symbol.upper())
 def fetch_news(symbol: str):
     try:
         url = f"https://gnews.io/api/v4/search?q={symbol}&lang=en&max=5&apikey={GNEWS_API_KEY}"
@@ -421,6 +378,9 @@ def news_endpoint():
     news_data = fetch_news(symbol)
     st.json(news_data)
 
+# Verify the schema version once per process; migrations run via `python -m data.migrations`
+check_schema_version()
+
 # Initialize session state
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
@@ -684,8 +644,7 @@ else:
                     st.info("Starting investment analysis...")
                     logger.info("Starting recommendation workflow")
                     
-                    with st.spinner("Analyzing investment scenario..."):
-                        result = run_workflow(preferences, st.session_state.user_id)
+                    result = run_workflow_streaming(preferences, st.session_state.user_id)
                     
                     if result["recommendations"]:
                         st.success("Analysis complete!")
@@ -742,8 +701,8 @@ else:
                             logger.info(f"Starting automated trade execution for {recommendation['Symbol']}")
                             
                             # Get current price
-                            quote = finnhub_client.quote(recommendation["Symbol"])
-                            price = float(quote["c"])
+                            # Price the trade from a quote no older than TRADE_PRICE_MAX_AGE
+                            price = price_cache.get(recommendation["Symbol"], priority=INTERACTIVE, max_age=TRADE_PRICE_MAX_AGE)["current_price"]
                             quantity = float(recommendation["Quantity"])
                             amount = price * quantity
                             
@@ -802,15 +761,6 @@ else:
                                             3. The trade has been recorded and will be reflected in your account history
                                             """)
                                             
-                                            # Update stock price in DB
-                                            update_stock_price_in_db(trade['symbol'], {
-                                                "o": quote["o"],
-                                                "c": quote["c"],
-                                                "h": quote["h"],
-                                                "l": quote["l"],
-                                                "pc": quote["pc"]
-                                            })
-                                            logger.info(f"Updated stock price in DB for {trade['symbol']}")
                                             break
                                         else:
                                             logger.warning(f"add_trade returned False on attempt {attempt + 1}")
@@ -867,8 +817,7 @@ else:
                                 st.error(f"Invalid stock symbol: {symbol}")
                                 logger.error(f"Invalid stock symbol: {symbol}")
                             else:
-                                stock_data = fetch_stock_prices()
-                                price = stock_data.get(symbol, {"current_price": 0.0})["current_price"]
+                                price = price_cache.get(symbol, priority=INTERACTIVE, max_age=TRADE_PRICE_MAX_AGE)["current_price"]
                                 if price <= 0:
                                     st.error(f"No valid price available for {symbol}")
                                     logger.error(f"No valid price for {symbol}")
@@ -985,8 +934,7 @@ else:
                             }
                             logger.info(f"Agent-based trade preferences: {preferences}")
                             
-                            with st.spinner("Analyzing trade scenario..."):
-                                result = run_workflow(preferences, st.session_state.user_id, is_trade=True)
+                            result = run_workflow_streaming(preferences, st.session_state.user_id, is_trade=True)
                             
                             if result["recommendations"]:
                                 st.success("Analysis complete!")
@@ -1043,8 +991,8 @@ else:
                                     logger.info(f"Starting automated trade execution for {recommendation['Symbol']}")
                                     
                                     # Get current price
-                                    quote = finnhub_client.quote(recommendation["Symbol"])
-                                    price = float(quote["c"])
+                                    # Price the trade from a quote no older than TRADE_PRICE_MAX_AGE
+                                    price = price_cache.get(recommendation["Symbol"], priority=INTERACTIVE, max_age=TRADE_PRICE_MAX_AGE)["current_price"]
                                     quantity = float(recommendation["Quantity"])
                                     amount = price * quantity
                                     
@@ -1103,15 +1051,6 @@ else:
                                                     3. The trade has been recorded and will be reflected in your account history
                                                     """)
                                                     
-                                                    # Update stock price in DB
-                                                    update_stock_price_in_db(trade['symbol'], {
-                                                        "o": quote["o"],
-                                                        "c": quote["c"],
-                                                        "h": quote["h"],
-                                                        "l": quote["l"],
-                                                        "pc": quote["pc"]
-                                                    })
-                                                    logger.info(f"Updated stock price in DB for {trade['symbol']}")
                                                     break
                                                 else:
                                                     logger.warning(f"add_trade returned False on attempt {attempt + 1}")
@@ -1182,118 +1121,33 @@ else:
 
                 with st.spinner("Loading portfolio data..."):
                     try:
-                        trades = get_portfolio(st.session_state.user_id)
+                        positions = get_positions(st.session_state.user_id)
                     except Exception as e:
                         logger.error(f"Failed to fetch portfolio from database: {str(e)}")
                         st.error(f"Failed to fetch portfolio: {str(e)}")
-                        trades = None
+                        positions = None
 
-                    if not trades:
+                    if not positions:
                         st.info("No trades in your portfolio yet.")
                         logger.info(f"No trades found for user {st.session_state.user_id}")
                     else:
-                        holdings = {}
-                        transaction_history = {}
-                        for trade in trades:
-                            symbol = trade["symbol"]
-                            try:
-                                # Convert Decimal to float for calculations
-                                trade_amount = float(trade["amount"]) if isinstance(trade["amount"], (Decimal, float, int)) else 0.0
-                                trade_price = float(trade["price"]) if isinstance(trade["price"], (Decimal, float, int)) else 0.0
-                                
-                                if trade_amount <= 0 or trade_price <= 0:
-                                    logger.warning(f"Skipping invalid trade for {symbol}: amount={trade_amount}, price={trade_price}")
-                                    continue
-                                
-                                quantity = trade_amount / trade_price
-                                
-                                if symbol not in holdings:
-                                    holdings[symbol] = {"quantity": 0.0, "total_cost": 0.0, "buy_trades": 0, "realized_profit": 0.0}
-                                    transaction_history[symbol] = []
-                                
-                                if trade["trade_type"] == "buy":
-                                    holdings[symbol]["quantity"] += quantity
-                                    holdings[symbol]["total_cost"] += trade_amount
-                                    holdings[symbol]["buy_trades"] += 1
-                                else:  # sell
-                                    if holdings[symbol]["quantity"] >= quantity:
-                                        avg_buy_price = holdings[symbol]["total_cost"] / holdings[symbol]["quantity"] if holdings[symbol]["quantity"] > 0 else trade_price
-                                        holdings[symbol]["quantity"] -= quantity
-                                        holdings[symbol]["total_cost"] -= avg_buy_price * quantity
-                                        holdings[symbol]["buy_trades"] = max(0, holdings[symbol]["buy_trades"] - 1)
-                                        realized_profit = (trade_price - avg_buy_price) * quantity
-                                        holdings[symbol]["realized_profit"] += realized_profit
-                                    else:
-                                        logger.warning(f"Cannot sell {quantity} shares of {symbol}: only {holdings[symbol]['quantity']} available")
-                                        continue
-                                
-                                transaction_history[symbol].append({
-                                    "trade_type": trade["trade_type"].capitalize(),
-                                    "Quantity": float(quantity),
-                                    "Price ($)": float(trade_price),
-                                    "Amount ($)": float(trade_amount),
-                                    "Timestamp": trade["timestamp"]
-                                })
-                            except (TypeError, ValueError, decimal.InvalidOperation) as e:
-                                logger.error(f"Error processing trade for {symbol}: {str(e)}")
-                                continue
+                        held_symbols = [position["symbol"] for position in positions if position["quantity"] > 0]
+                        held_prices, _ = price_cache.get_many(held_symbols, priority=INTERACTIVE)
+                        current_prices = {symbol: price["current_price"] for symbol, price in held_prices.items()}
 
-                        stock_data = fetch_stock_prices()
-                        portfolio_data = []
-                        for symbol, data in holdings.items():
-                            if data["quantity"] > 0:
-                                try:
-                                    cache_key = f"price_{symbol}"
-                                    if cache_key in price_cache:
-                                        current_price = price_cache[cache_key]["current_price"]
-                                    else:
-                                        db_quote = get_stock_price_from_db(symbol)
-                                        if db_quote:
-                                            current_price = db_quote["c"]
-                                        else:
-                                            for attempt in range(3):
-                                                try:
-                                                    quote = finnhub_client.quote(symbol)
-                                                    current_price = quote.get("c", stock_data.get(symbol, {"current_price": 0.0})["current_price"])
-                                                    price_cache[cache_key] = {"current_price": current_price}
-                                                    update_stock_price_in_db(symbol, quote)
-                                                    break
-                                                except Exception as e:
-                                                    if "429" in str(e):
-                                                        logger.warning(f"Rate limit for {symbol}, retrying in {10 * (2 ** attempt)}s")
-                                                        time.sleep(10 * (2 ** attempt))
-                                                        if attempt == 2:
-                                                            logger.error(f"Rate limit exceeded for {symbol}, falling back to DB")
-                                                            db_quote = get_stock_price_from_db(symbol)
-                                                            if db_quote:
-                                                                current_price = db_quote["c"]
-                                                            else:
-                                                                current_price = stock_data.get(symbol, {"current_price": 0.0})["current_price"]
-                                                            break
-                                                    else:
-                                                        current_price = stock_data.get(symbol, {"current_price": 0.0})["current_price"]
-                                                        break
-                                    
-                                    avg_buy_price = float(data["total_cost"]) / float(data["quantity"]) if data["quantity"] > 0 else 0
-                                    unrealized_profit = (float(current_price) - avg_buy_price) * float(data["quantity"])
-                                    portfolio_data.append({
-                                        "Symbol": symbol,
-                                        "Quantity": float(data["quantity"]),
-                                        "Avg Buy Price ($)": float(avg_buy_price),
-                                        "Current Price ($)": float(current_price),
-                                        "Unrealized Profit ($)": float(unrealized_profit),
-                                        "Realized Profit ($)": float(data["realized_profit"])
-                                    })
-                                except Exception as e:
-                                    logger.error(f"Failed to fetch price for {symbol}: {str(e)}")
-                                    portfolio_data.append({
-                                        "Symbol": symbol,
-                                        "Quantity": float(data["quantity"]),
-                                        "Avg Buy Price ($)": float(data["total_cost"]) / float(data["quantity"]) if data["quantity"] > 0 else 0,
-                                        "Current Price ($)": float(stock_data.get(symbol, {"current_price": 0.0})["current_price"]),
-                                        "Unrealized Profit ($)": 0.0,
-                                        "Realized Profit ($)": float(data["realized_profit"])
-                                    })
+                        valued = value_positions(positions_frame(positions), current_prices)
+                        valued = valued[valued["quantity"] > 0]
+                        portfolio_data = [
+                            {
+                                "Symbol": symbol,
+                                "Quantity": row.quantity,
+                                "Avg Buy Price ($)": row.avg_cost,
+                                "Current Price ($)": row.current_price,
+                                "Unrealized Profit ($)": row.unrealized_pnl,
+                                "Realized Profit ($)": row.realized_pnl
+                            }
+                            for symbol, row in valued.iterrows()
+                        ]
 
                         if portfolio_data:
                             # Format the numeric columns
@@ -1305,9 +1159,28 @@ else:
                             st.info("No active holdings in your portfolio.")
 
                         st.markdown("<h3 style='color: #ffffff;'>Transaction History</h3>", unsafe_allow_html=True)
-                        for symbol, transactions in transaction_history.items():
-                            with st.expander(f"Transactions for {symbol}"):
-                                st.table(pd.DataFrame(transactions))
+                        # Full history is O(trades), so only load it on demand
+                        if st.checkbox("Show transaction history", value=False):
+                            transaction_history = {}
+                            for trade in get_portfolio(st.session_state.user_id):
+                                try:
+                                    trade_amount = float(trade["amount"])
+                                    trade_price = float(trade["price"])
+                                except (TypeError, ValueError, decimal.InvalidOperation) as e:
+                                    logger.error(f"Error processing trade for {trade['symbol']}: {str(e)}")
+                                    continue
+                                if trade_amount <= 0 or trade_price <= 0:
+                                    continue
+                                transaction_history.setdefault(trade["symbol"], []).append({
+                                    "trade_type": trade["trade_type"].capitalize(),
+                                    "Quantity": trade_amount / trade_price,
+                                    "Price ($)": trade_price,
+                                    "Amount ($)": trade_amount,
+                                    "Timestamp": trade["timestamp"]
+                                })
+                            for symbol, transactions in transaction_history.items():
+                                with st.expander(f"Transactions for {symbol}"):
+                                    st.table(pd.DataFrame(transactions))
             except Exception as e:
                 logger.error(f"Failed to load portfolio: {str(e)}")
                 st.error(f"Failed to load portfolio: {str(e)}")
@@ -0,0 +1,259 @@
+"""Versioned schema migrations for the MySQL database.
+
+Migrations run once per deploy rather than on every import:
+
+    python -m data.migrations            # apply pending migrations
+    python -m data.migrations --status   # show current and latest version
+
+Each migration is a list of steps. A step is either a SQL string or a callable
+taking a cursor. MySQL commits DDL implicitly, so steps are written to be
+idempotent and a partially applied migration can simply be re-run.
+"""
+import argparse
+from data.mysql_db import db_connection
+from utils.logger import logger
+
+MIGRATION_LOCK = "thinkinvest_schema_migrations"
+
+def _add_column_if_missing(table, column, definition):
+    def step(cursor):
+        cursor.execute(f"SHOW COLUMNS FROM {table} LIKE %s", (column,))
+        if not cursor.fetchone():
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+def _backfill_positions(cursor):
+    from analytics.portfolio import compute_positions
+    cursor.execute("SELECT COUNT(*) FROM positions")
+    if cursor.fetchone()[0]:
+        return
+    cursor.execute("SELECT user_id, symbol, amount, price, trade_type, timestamp FROM trades")
+    trades = [
+        {"user_id": user_id, "symbol": symbol, "amount": amount, "price": price, "trade_type": trade_type, "timestamp": timestamp}
+        for user_id, symbol, amount, price, trade_type, timestamp in cursor.fetchall()
+    ]
+    if not trades:
+        return
+    positions = compute_positions(trades, by=("user_id", "symbol"))
+    last_trade = {(t["user_id"], t["symbol"]): t["timestamp"] for t in sorted(trades, key=lambda t: t["timestamp"])}
+    rows = [
+        (user_id, symbol, float(row.quantity), float(row.cost_basis), float(row.realized_pnl), last_trade[(user_id, symbol)])
+        for (user_id, symbol), row in positions.iterrows()
+    ]
+    cursor.executemany("""
+        INSERT INTO positions (user_id, symbol, quantity, cost_basis, realized_pnl, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, rows)
+    logger.info(f"Backfilled {len(rows)} positions from {len(trades)} trades")
+
+MIGRATIONS = [
+    (1, "Core user, preference and trade tables", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id VARCHAR(36) PRIMARY KEY,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            username VARCHAR(100) NOT NULL,
+            balance FLOAT NOT NULL DEFAULT 100000.0,
+            badges VARCHAR(255) DEFAULT 'None'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS preferences (
+            id VARCHAR(36) PRIMARY KEY,
+            user_id VARCHAR(36) NOT NULL,
+            risk_appetite VARCHAR(50),
+            investment_goals VARCHAR(50),
+            time_horizon VARCHAR(50),
+            investment_amount FLOAT,
+            investment_style VARCHAR(50),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        _add_column_if_missing("preferences", "investment_goals", "VARCHAR(50)"),
+        _add_column_if_missing("preferences", "investment_style", "VARCHAR(50)"),
+        """
+        CREATE TABLE IF NOT EXISTS preference_history (
+            id VARCHAR(36) PRIMARY KEY,
+            user_id VARCHAR(36) NOT NULL,
+            preferences JSON NOT NULL,
+            timestamp DATETIME NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS trades (
+            id VARCHAR(255) PRIMARY KEY,
+            user_id VARCHAR(36) NOT NULL,
+            symbol VARCHAR(10) NOT NULL,
+            amount FLOAT NOT NULL,
+            price FLOAT NOT NULL,
+            trade_type VARCHAR(10) NOT NULL,
+            timestamp DATETIME NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """
+    ]),
+    (2, "stock_prices table and trades.quantity", [
+        """
+        CREATE TABLE IF NOT EXISTS stock_prices (
+            symbol VARCHAR(10) PRIMARY KEY,
+            open_price FLOAT,
+            close_price FLOAT,
+            high_price FLOAT,
+            low_price FLOAT,
+            current_price FLOAT,
+            timestamp DATETIME,
+            last_updated DATETIME
+        )
+        """,
+        _add_column_if_missing("trades", "quantity", "FLOAT NOT NULL DEFAULT 0"),
+    ]),
+    (3, "Materialized positions maintained by add_trade", [
+        """
+        CREATE TABLE IF NOT EXISTS positions (
+            user_id VARCHAR(36) NOT NULL,
+            symbol VARCHAR(10) NOT NULL,
+            quantity DOUBLE NOT NULL DEFAULT 0,
+            cost_basis DOUBLE NOT NULL DEFAULT 0,
+            realized_pnl DOUBLE NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL,
+            PRIMARY KEY (user_id, symbol),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        _backfill_positions,
+    ]),
+    (4, "Heartbeats of background services such as the price daemon", [
+        """
+        CREATE TABLE IF NOT EXISTS service_heartbeats (
+            name VARCHAR(64) PRIMARY KEY,
+            host VARCHAR(255) NOT NULL,
+            pid INT NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            started_at DATETIME NOT NULL,
+            last_beat DATETIME NOT NULL,
+            details JSON
+        )
+        """,
+    ]),
+    (5, "Append-only daily price history clustered by (symbol, date)", [
+        """
+        CREATE TABLE IF NOT EXISTS price_history (
+            symbol VARCHAR(10) NOT NULL,
+            date DATE NOT NULL,
+            open DOUBLE,
+            high DOUBLE,
+            low DOUBLE,
+            close DOUBLE NOT NULL,
+            adj_close DOUBLE,
+            volume BIGINT,
+            source VARCHAR(20) NOT NULL,
+            PRIMARY KEY (symbol, date)
+        ) ENGINE=InnoDB
+        """,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def _ensure_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    """)
+
+def get_schema_version() -> int:
+    """Return the highest applied migration version, or 0 for an unmanaged schema."""
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT MAX(version) FROM schema_version")
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] is not None else 0
+        except Exception as e:
+            logger.warning(f"Could not read schema version: {str(e)}")
+            return 0
+        finally:
+            cursor.close()
+
+_schema_checked = False
+
+def check_schema_version() -> bool:
+    """Single cheap check, once per process, that the schema is up to date.
+
+    Does not run any DDL; it only logs a warning pointing at the CLI.
+    """
+    global _schema_checked
+    if _schema_checked:
+        return True
+    _schema_checked = True
+    try:
+        version = get_schema_version()
+    except Exception as e:
+        logger.error(f"Schema version check failed: {str(e)}")
+        return False
+    if version < LATEST_VERSION:
+        logger.warning(f"Database schema is at version {version}, latest is {LATEST_VERSION}. "
+                       f"Run `python -m data.migrations` to upgrade.")
+        return False
+    return True
+
+def migrate(target: int = None) -> int:
+    """Apply pending migrations up to ``target`` (default: latest) and return the new version."""
+    target = LATEST_VERSION if target is None else target
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            # Serialize concurrent runners (e.g. several workers deploying at once)
+            cursor.execute("SELECT GET_LOCK(%s, 60)", (MIGRATION_LOCK,))
+            if cursor.fetchone()[0] != 1:
+                raise RuntimeError("Timed out waiting for the schema migration lock")
+            try:
+                _ensure_version_table(cursor)
+                cursor.execute("SELECT version FROM schema_version")
+                applied = {row[0] for row in cursor.fetchall()}
+                version = max(applied, default=0)
+                for number, description, steps in MIGRATIONS:
+                    if number in applied or number > target:
+                        continue
+                    logger.info(f"Applying migration {number}: {description}")
+                    for step in steps:
+                        if callable(step):
+                            step(cursor)
+                        else:
+                            cursor.execute(step)
+                    cursor.execute("""
+                        INSERT INTO schema_version (version, description, applied_at)
+                        VALUES (%s, %s, UTC_TIMESTAMP())
+                    """, (number, description))
+                    connection.commit()
+                    version = max(version, number)
+                logger.info(f"Database schema at version {version}")
+                return version
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+                cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Schema migration failed: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database schema migrations.")
+    parser.add_argument("--status", action="store_true", help="Show the current schema version and exit")
+    parser.add_argument("--target", type=int, default=None, help="Migrate up to this version (default: latest)")
+    args = parser.parse_args()
+
+    if args.status:
+        print(f"Schema version: {get_schema_version()} (latest: {LATEST_VERSION})")
+        return
+    version = migrate(args.target)
+    print(f"Schema migrated to version {version}")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,21 @@
 import mysql.connector
 # from utils.config import MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE
 from utils.config import AZURE_USER, AZURE_PASSWORD, AZURE_HOSTNAME, AZURE_PORT, AZURE_DATABASE
+from utils.config import DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
 from utils.logger import logger
+from utils.market_calendar import quote_ttls
 import json
 import uuid
 import os
 import tempfile
 import base64
+import queue
+import socket
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
 
 def get_ssl_cert():
     try:
@@ -21,7 +30,7 @@ def get_ssl_cert():
         logger.error(f"Failed to create SSL certificate: {str(e)}")
         raise
 
-def get_db_connection():
+def _connect():
     try:
         connection = mysql.connector.connect(
             user=AZURE_USER, 
@@ -36,179 +45,438 @@ def get_db_connection():
         logger.error(f"MySQL connection failed: {str(e)}")
         raise
 
-def initialize_db():
+class PooledConnection:
+    """Proxy for a pooled MySQL connection.
+
+    Behaves like the underlying connection, except that ``close()`` hands it
+    back to the pool instead of tearing down the TLS session. A proxy that is
+    garbage-collected without ``close()`` still gives its slot back, so a
+    caller that leaks one cannot exhaust the pool.
+    """
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+        self._released = False
+        self._finalizer = weakref.finalize(self, pool.reclaim, connection)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def is_connected(self):
+        return not self._released and self._connection.is_connected()
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._finalizer.detach()
+            self._pool.release(self._connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class ConnectionPool:
+    """Thread-safe pool of MySQL connections shared by the whole process."""
+
+    def __init__(self, size, timeout, recycle, pre_ping=True):
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._opened_at = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "connections_opened": 0,
+            "connections_recycled": 0,
+            "ping_failures": 0,
+            "timeouts": 0,
+            "leaked": 0
+        }
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _open(self):
+        connection = _connect()
+        self._count("connections_opened")
+        return connection, time.monotonic()
+
+    @staticmethod
+    def _discard(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _validate(self, connection, opened_at):
+        """Return a usable (connection, opened_at), replacing stale or dead connections."""
+        if self.recycle and time.monotonic() - opened_at > self.recycle:
+            self._count("connections_recycled")
+            self._discard(connection)
+            return self._open()
+        if self.pre_ping:
+            try:
+                connection.ping(reconnect=False)
+            except Exception as e:
+                logger.warning(f"Pooled MySQL connection failed pre-ping, reconnecting: {str(e)}")
+                self._count("ping_failures")
+                self._discard(connection)
+                return self._open()
+        return connection, opened_at
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=timeout):
+            self._count("timeouts")
+            raise mysql.connector.errors.PoolError(f"No MySQL connection available within {timeout}s (pool size {self.size})")
+        waited = time.monotonic() - started
+        with self._stats_lock:
+            self._stats["checkouts"] += 1
+            self._stats["wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+            if waited > 0.001:
+                self._stats["waits"] += 1
+        try:
+            try:
+                connection, opened_at = self._idle.get_nowait()
+            except queue.Empty:
+                connection, opened_at = self._open()
+            else:
+                connection, opened_at = self._validate(connection, opened_at)
+        except Exception:
+            self._slots.release()
+            raise
+        self._opened_at[id(connection)] = opened_at
+        return PooledConnection(self, connection)
+
+    def release(self, connection):
+        opened_at = self._opened_at.pop(id(connection), time.monotonic())
+        try:
+            # End any open transaction so the next borrower does not read a stale snapshot
+            if connection.is_connected():
+                if connection.unread_result:
+                    connection.consume_results()
+                if connection.in_transaction:
+                    connection.rollback()
+                self._idle.put((connection, opened_at))
+            else:
+                self._discard(connection)
+        except Exception as e:
+            logger.warning(f"Discarding MySQL connection that could not be reset: {str(e)}")
+            self._discard(connection)
+        finally:
+            self._slots.release()
+
+    def reclaim(self, connection):
+        """Free the slot of a connection whose proxy was collected without close().
+
+        The connection is closed rather than reused: finalizers can run on any
+        thread at any point, so this does not try to reset its session.
+        """
+        self._opened_at.pop(id(connection), None)
+        self._count("leaked")
+        logger.warning("Pooled MySQL connection was never closed; reclaiming its slot")
+        self._discard(connection)
+        self._slots.release()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["size"] = self.size
+        stats["idle"] = self._idle.qsize()
+        stats["avg_wait_seconds"] = stats["wait_seconds"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+    def close_all(self):
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(connection)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING)
+                logger.info(f"Created MySQL connection pool (size {DB_POOL_SIZE})")
+    return _pool
+
+def get_pool_stats():
+    """Checkout and wait metrics for the process-wide pool."""
+    return get_pool().stats()
+
+def get_db_connection():
+    """Borrow a connection from the pool. Calling close() on it returns it to the pool."""
+    return get_pool().acquire()
+
+@contextmanager
+def db_connection():
+    """Context manager that borrows a pooled connection and always returns it."""
     connection = get_db_connection()
-    cursor = connection.cursor()
     try:
-        # Create users table if not exists
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id VARCHAR(36) PRIMARY KEY,
-                email VARCHAR(255) UNIQUE NOT NULL,
-                password VARCHAR(255) NOT NULL,
-                username VARCHAR(100) NOT NULL,
-                balance FLOAT NOT NULL DEFAULT 100000.0,
-                badges VARCHAR(255) DEFAULT 'None'
-            )
-        """)
-        # Create preferences table if not exists
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS preferences (
-                id VARCHAR(36) PRIMARY KEY,
-                user_id VARCHAR(36) NOT NULL,
-                risk_appetite VARCHAR(50),
-                investment_goals VARCHAR(50),
-                time_horizon VARCHAR(50),
-                investment_amount FLOAT,
-                investment_style VARCHAR(50),
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        """)
-        # Migrate preferences table to add new columns if missing
-        cursor.execute("SHOW COLUMNS FROM preferences LIKE 'investment_goals'")
-        if not cursor.fetchone():
-            cursor.execute("ALTER TABLE preferences ADD COLUMN investment_goals VARCHAR(50)")
-        cursor.execute("SHOW COLUMNS FROM preferences LIKE 'investment_style'")
-        if not cursor.fetchone():
-            cursor.execute("ALTER TABLE preferences ADD COLUMN investment_style VARCHAR(50)")
-        # Create preference_history table if not exists
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS preference_history (
-                id VARCHAR(36) PRIMARY KEY,
-                user_id VARCHAR(36) NOT NULL,
-                preferences JSON NOT NULL,
-                timestamp DATETIME NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        """)
-        # Create trades table if not exists
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS trades (
-                id VARCHAR(255) PRIMARY KEY,
-                user_id VARCHAR(36) NOT NULL,
-                symbol VARCHAR(10) NOT NULL,
-                amount FLOAT NOT NULL,
-                price FLOAT NOT NULL,
-                trade_type VARCHAR(10) NOT NULL,
-                timestamp DATETIME NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        """)
-        connection.commit()
-        logger.info("MySQL tables initialized and migrated")
-    except Exception as e:
-        logger.error(f"Failed to initialize MySQL tables: {str(e)}")
-        raise
+        yield connection
     finally:
-        cursor.close()
         connection.close()
 
-# Initialize database tables
-initialize_db()
+def initialize_db():
+    """Create or upgrade tables. Kept for callers that used the old import-time setup;
+    prefer running `python -m data.migrations` once per deploy."""
+    from data.migrations import migrate
+    return migrate()
 
 def save_user_preferences(user_id, preferences):
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    try:
-        # Save latest preferences
-        pref_id = f"pref_{user_id}"[:36]  # Ensure ID is within 36 characters
-        cursor.execute("""
-            INSERT INTO preferences (id, user_id, risk_appetite, investment_goals, time_horizon, investment_amount, investment_style)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                risk_appetite=%s, investment_goals=%s, time_horizon=%s, investment_amount=%s, investment_style=%s
-        """, (
-            pref_id, user_id,
-            preferences["risk_appetite"], preferences["investment_goals"], preferences["time_horizon"],
-            preferences["investment_amount"], preferences["investment_style"],
-            preferences["risk_appetite"], preferences["investment_goals"], preferences["time_horizon"],
-            preferences["investment_amount"], preferences["investment_style"]
-        ))
-        # Save to preference history with UUID
-        hist_id = str(uuid.uuid4())  # Generates a 36-character UUID
-        cursor.execute("""
-            INSERT INTO preference_history (id, user_id, preferences, timestamp)
-            VALUES (%s, %s, %s, NOW())
-        """, (
-            hist_id, user_id, json.dumps(preferences)
-        ))
-        connection.commit()
-        logger.info(f"Saved preferences for user {user_id}")
-    except Exception as e:
-        logger.error(f"Failed to save preferences for user {user_id}: {str(e)}")
-        raise
-    finally:
-        cursor.close()
-        connection.close()
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            # Save latest preferences
+            pref_id = f"pref_{user_id}"[:36]  # Ensure ID is within 36 characters
+            cursor.execute("""
+                INSERT INTO preferences (id, user_id, risk_appetite, investment_goals, time_horizon, investment_amount, investment_style)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    risk_appetite=%s, investment_goals=%s, time_horizon=%s, investment_amount=%s, investment_style=%s
+            """, (
+                pref_id, user_id,
+                preferences["risk_appetite"], preferences["investment_goals"], preferences["time_horizon"],
+                preferences["investment_amount"], preferences["investment_style"],
+                preferences["risk_appetite"], preferences["investment_goals"], preferences["time_horizon"],
+                preferences["investment_amount"], preferences["investment_style"]
+            ))
+            # Save to preference history with UUID
+            hist_id = str(uuid.uuid4())  # Generates a 36-character UUID
+            cursor.execute("""
+                INSERT INTO preference_history (id, user_id, preferences, timestamp)
+                VALUES (%s, %s, %s, NOW())
+            """, (
+                hist_id, user_id, json.dumps(preferences)
+            ))
+            connection.commit()
+            logger.info(f"Saved preferences for user {user_id}")
+        except Exception as e:
+            logger.error(f"Failed to save preferences for user {user_id}: {str(e)}")
+            raise
+        finally:
+            cursor.close()
 
 def get_user_preferences(user_id):
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-    try:
-        cursor.execute("""
-            SELECT risk_appetite, investment_goals, time_horizon, investment_amount, investment_style
-            FROM preferences
-            WHERE user_id = %s
-        """, (user_id,))
-        result = cursor.fetchone()
-        return result if result else None
-    except Exception as e:
-        logger.error(f"Failed to get preferences for user {user_id}: {str(e)}")
-        return None
-    finally:
-        cursor.close()
-        connection.close()
+    with db_connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute("""
+                SELECT risk_appetite, investment_goals, time_horizon, investment_amount, investment_style
+                FROM preferences
+                WHERE user_id = %s
+            """, (user_id,))
+            result = cursor.fetchone()
+            return result if result else None
+        except Exception as e:
+            logger.error(f"Failed to get preferences for user {user_id}: {str(e)}")
+            return None
+        finally:
+            cursor.close()
 
 def get_preference_history(user_id):
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-    try:
-        cursor.execute("""
-            SELECT preferences, timestamp
-            FROM preference_history
-            WHERE user_id = %s
-            ORDER BY timestamp DESC
-        """, (user_id,))
-        history = cursor.fetchall()
-        # Parse JSON preferences
-        for entry in history:
-            entry["preferences"] = json.loads(entry["preferences"])
-        return history
-    except Exception as e:
-        logger.error(f"Failed to get preference history for user {user_id}: {str(e)}")
-        return []
-    finally:
-        cursor.close()
-        connection.close()
+    with db_connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute("""
+                SELECT preferences, timestamp
+                FROM preference_history
+                WHERE user_id = %s
+                ORDER BY timestamp DESC
+            """, (user_id,))
+            history = cursor.fetchall()
+            # Parse JSON preferences
+            for entry in history:
+                entry["preferences"] = json.loads(entry["preferences"])
+            return history
+        except Exception as e:
+            logger.error(f"Failed to get preference history for user {user_id}: {str(e)}")
+            return []
+        finally:
+            cursor.close()
 
 def save_trade(user_id, trade):
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    try:
-        cursor.execute("""
-            INSERT INTO trades (id, user_id, symbol, amount, price, trade_type, timestamp)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (
-            trade["id"], user_id, trade["symbol"], trade["amount"], trade["price"], trade["trade_type"],
-            trade["timestamp"], trade["trade_type"]
-        ))
-        connection.commit()
-    except Exception as e:
-        logger.error(f"Failed to save trade for user {user_id}: {str(e)}")
-        raise
-    finally:
-        cursor.close()
-        connection.close()
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO trades (id, user_id, symbol, amount, price, trade_type, timestamp)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (
+                trade["id"], user_id, trade["symbol"], trade["amount"], trade["price"], trade["trade_type"],
+                trade["timestamp"], trade["trade_type"]
+            ))
+            connection.commit()
+        except Exception as e:
+            logger.error(f"Failed to save trade for user {user_id}: {str(e)}")
+            raise
+        finally:
+            cursor.close()
 
 def get_user_trades(user_id):
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-    try:
-        cursor.execute("SELECT symbol, amount, price, trade_type, timestamp FROM trades WHERE user_id = %s", (user_id,))
-        return cursor.fetchall()
-    except Exception as e:
-        logger.error(f"Failed to get trades for user {user_id}: {str(e)}")
-        return []
-    finally:
-        cursor.close()
-        connection.close()
\ No newline at end of file
+    with db_connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT symbol, amount, price, trade_type, timestamp FROM trades WHERE user_id = %s", (user_id,))
+            return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Failed to get trades for user {user_id}: {str(e)}")
+            return []
+        finally:
+            cursor.close()
+def get_stock_price_rows(symbols) -> dict:
+    """Return the stored quote and its age for many symbols with a single query.
+
+    Maps symbol -> (Finnhub-style quote dict {"o", "c", "h", "l", "pc"},
+    last_updated as an aware UTC datetime), whatever the row's age. Symbols
+    without a row are omitted.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    with db_connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            placeholders = ", ".join(["%s"] * len(symbols))
+            cursor.execute(f"""
+                SELECT symbol, open_price, close_price, high_price, low_price, current_price, last_updated
+                FROM stock_prices
+                WHERE symbol IN ({placeholders})
+            """, tuple(symbols))
+            rows = {}
+            for row in cursor.fetchall():
+                last_updated = row["last_updated"]
+                if last_updated is None:
+                    continue
+                if last_updated.tzinfo is None:
+                    last_updated = last_updated.replace(tzinfo=timezone.utc)
+                rows[row["symbol"]] = ({
+                    "o": float(row["open_price"]),
+                    "c": float(row["current_price"]),
+                    "h": float(row["high_price"]),
+                    "l": float(row["low_price"]),
+                    "pc": float(row["close_price"])
+                }, last_updated)
+            return rows
+        except Exception as e:
+            logger.error(f"Failed to fetch prices from DB for {symbols}: {str(e)}")
+            return {}
+        finally:
+            cursor.close()
+
+def get_stock_prices_from_db(symbols, max_age: timedelta = None) -> dict:
+    """Return fresh quotes for many symbols with a single query.
+
+    Maps symbol -> Finnhub-style quote dict ({"o", "c", "h", "l", "pc"}) for every
+    row updated within ``max_age``. Symbols with no row or a stale row are omitted.
+    ``max_age`` defaults to the market-hours freshness from utils/market_calendar.py.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if max_age is None:
+        max_age = timedelta(seconds=quote_ttls().fresh)
+    cutoff = datetime.now(timezone.utc) - max_age
+    quotes = {
+        symbol: quote
+        for symbol, (quote, last_updated) in get_stock_price_rows(symbols).items()
+        if last_updated >= cutoff
+    }
+    if symbols:
+        logger.info(f"Fetched {len(quotes)}/{len(symbols)} recent prices from DB")
+    return quotes
+
+def update_stock_prices_in_db(quotes: dict):
+    """Upsert many Finnhub-style quotes ({symbol: {"o", "c", "h", "l", "pc"}}) in one batch."""
+    if not quotes:
+        return
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            now = datetime.now(timezone.utc)
+            rows = [
+                (symbol, quote["o"], quote["pc"], quote["h"], quote["l"], quote["c"], now, now)
+                for symbol, quote in quotes.items()
+            ]
+            cursor.executemany("""
+                INSERT INTO stock_prices (symbol, open_price, close_price, high_price, low_price, current_price, timestamp, last_updated)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    open_price = VALUES(open_price),
+                    close_price = VALUES(close_price),
+                    high_price = VALUES(high_price),
+                    low_price = VALUES(low_price),
+                    current_price = VALUES(current_price),
+                    timestamp = VALUES(timestamp),
+                    last_updated = VALUES(last_updated)
+            """, rows)
+            connection.commit()
+            logger.info(f"Updated {len(rows)} prices in DB")
+        except Exception as e:
+            logger.error(f"Failed to update prices in DB for {list(quotes)}: {str(e)}")
+        finally:
+            cursor.close()
+
+def record_heartbeat(name: str, status: str, started_at: datetime, details: dict = None):
+    """Upsert the liveness row of a background service (e.g. the price daemon)."""
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO service_heartbeats (name, host, pid, status, started_at, last_beat, details)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    host = VALUES(host),
+                    pid = VALUES(pid),
+                    status = VALUES(status),
+                    started_at = VALUES(started_at),
+                    last_beat = VALUES(last_beat),
+                    details = VALUES(details)
+            """, (name, socket.gethostname(), os.getpid(), status, started_at,
+                  datetime.now(timezone.utc), json.dumps(details or {})))
+            connection.commit()
+        except Exception as e:
+            logger.error(f"Failed to record heartbeat for {name}: {str(e)}")
+        finally:
+            cursor.close()
+
+def get_heartbeat(name: str):
+    """Return a service's heartbeat row (last_beat as aware UTC), or None."""
+    with db_connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute("""
+                SELECT name, host, pid, status, started_at, last_beat, details
+                FROM service_heartbeats
+                WHERE name = %s
+            """, (name,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            for column in ("started_at", "last_beat"):
+                if row[column] is not None and row[column].tzinfo is None:
+                    row[column] = row[column].replace(tzinfo=timezone.utc)
+            row["details"] = json.loads(row["details"]) if row["details"] else {}
+            return row
+        except Exception as e:
+            logger.error(f"Failed to read heartbeat for {name}: {str(e)}")
+            return None
+        finally:
+            cursor.close()
@@ -0,0 +1,326 @@
+"""Tiered stock price cache shared by the app, the agents and the fetch script.
+
+Lookups go L1 (process memory) -> L2 (the ``stock_prices`` table) -> Finnhub.
+
+- An entry that is still fresh is served as is. Freshness follows the NYSE
+  calendar (``utils.market_calendar.quote_ttls``): ``PRICE_FRESH_TTL``
+  seconds during a session, and from the close until the next open any quote
+  taken after the close, so nights, weekends and holidays cost no calls.
+- An entry older than that but within the stale window is served
+  immediately while one background refresh per symbol fetches a new quote
+  (stale-while-revalidate).
+- Anything older, or missing, is fetched from Finnhub before returning. New
+  quotes are written to L1 and upserted into L2 in one batch.
+- A failed fetch is remembered for ``negative_ttl`` seconds only. Meanwhile
+  the last known price is served if there is one, or a zero price if not,
+  without calling Finnhub again.
+- While the price daemon (``python -m scripts.fetch_stock_prices --daemon``)
+  has a recent heartbeat it owns the Finnhub refreshes. Readers then serve
+  the L1/L2 snapshot as is and never wait on Finnhub. They only fall back to
+  fetching inline when the heartbeat goes stale.
+
+DB errors never reach the caller: a failed L2 read counts as a miss, a
+failed heartbeat read as the daemon being down, and both are counted in
+``stats()``, which exports hit, miss and staleness counters.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from data.mysql_db import get_heartbeat, get_stock_price_rows, update_stock_prices_in_db
+from utils.config import PRICE_NEGATIVE_TTL, PRICE_DAEMON_STALE_AFTER
+from utils.finnhub_quota import BACKGROUND, FinnhubRateLimited, get_finnhub_quota
+from utils.logger import logger
+from utils.market_calendar import QuoteTTLs, quote_ttls
+
+ORIGIN_MAX_WORKERS = 8
+REFRESH_MAX_WORKERS = 2
+# Heartbeat row written by the price daemon, and how often readers re-check it
+PRICE_DAEMON = "price_daemon"
+DAEMON_CHECK_INTERVAL = 15
+
+EMPTY_PRICE = {
+    "current_price": 0.0,
+    "high_price": 0.0,
+    "low_price": 0.0,
+    "previous_close": 0.0
+}
+
+def quote_to_price(quote: Dict) -> Dict:
+    """Convert a Finnhub-style quote ({"c", "h", "l", "pc"}) to the app's price dict."""
+    return {
+        "current_price": float(quote["c"]),
+        "high_price": float(quote["h"]),
+        "low_price": float(quote["l"]),
+        "previous_close": float(quote["pc"])
+    }
+
+class PriceCache:
+    def __init__(self, ttls: Callable[[], QuoteTTLs] = quote_ttls, negative_ttl: float = PRICE_NEGATIVE_TTL):
+        # Called on every lookup so the lifetimes follow market hours
+        self.ttls = ttls
+        self.negative_ttl = negative_ttl
+        # symbol -> (price dict, fetched_at epoch seconds)
+        self._entries = {}
+        # symbol -> epoch seconds until which Finnhub is not retried
+        self._failures = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=REFRESH_MAX_WORKERS, thread_name_prefix="price-refresh")
+        # (checked_at monotonic, alive)
+        self._daemon_state = (float("-inf"), False)
+        self._stats = {
+            "l1_hits": 0, "l2_hits": 0, "stale_hits": 0, "misses": 0, "negative_hits": 0,
+            "snapshot_misses": 0, "origin_fetches": 0, "origin_errors": 0, "refreshes": 0,
+            "l2_errors": 0, "heartbeat_errors": 0,
+            "stale_age_total": 0.0, "stale_age_max": 0.0
+        }
+
+    def _count(self, event: str, amount: float = 1):
+        with self._lock:
+            self._stats[event] += amount
+
+    def _count_stale(self, age: float):
+        with self._lock:
+            self._stats["stale_hits"] += 1
+            self._stats["stale_age_total"] += age
+            self._stats["stale_age_max"] = max(self._stats["stale_age_max"], age)
+
+    def _store(self, prices: Dict[str, Tuple[Dict, float]]):
+        with self._lock:
+            self._entries.update(prices)
+            for symbol in prices:
+                self._failures.pop(symbol, None)
+
+    def daemon_alive(self) -> bool:
+        """Whether the price daemon beat within ``PRICE_DAEMON_STALE_AFTER`` seconds (re-read every 15s)."""
+        checked_at, alive = self._daemon_state
+        if time.monotonic() - checked_at < DAEMON_CHECK_INTERVAL:
+            return alive
+        try:
+            heartbeat = get_heartbeat(PRICE_DAEMON)
+        except Exception as e:
+            # Without a readable heartbeat, fetch inline as if the daemon were down
+            logger.error(f"Failed to read the price daemon heartbeat: {str(e)}")
+            self._count("heartbeat_errors")
+            heartbeat = None
+        alive = bool(heartbeat) and heartbeat["status"] == "running" and \
+            (datetime.now(timezone.utc) - heartbeat["last_beat"]).total_seconds() <= PRICE_DAEMON_STALE_AFTER
+        if alive != self._daemon_state[1]:
+            logger.info(f"Price daemon {'is running' if alive else 'is not running'}; "
+                        f"{'serving DB snapshots' if alive else 'fetching prices inline'}")
+        self._daemon_state = (time.monotonic(), alive)
+        return alive
+
+    def get(self, symbol: str, priority: str = BACKGROUND, max_age: Optional[float] = None) -> Dict:
+        return self.get_many([symbol], priority=priority, max_age=max_age)[0][symbol]
+
+    def get_many(self, symbols: Iterable[str], priority: str = BACKGROUND, max_age: Optional[float] = None,
+                 max_workers: Optional[int] = None, origin: Optional[bool] = None) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+        """Resolve prices for ``symbols``; returns (prices, report).
+
+        ``max_age`` tightens freshness for this call while the market is
+        open, e.g. to price a trade from a quote no older than a minute;
+        stale entries beyond it are re-fetched rather than served. While the
+        market is closed the post-close quote is already current, so it is
+        ignored. ``report`` maps each symbol to its
+        source (cache, db, stale, api or default), its age in seconds,
+        latency in milliseconds, retries and rate limiter wait.
+
+        ``origin`` says whether Finnhub may be called. By default it may,
+        unless the price daemon is alive and no ``max_age`` was asked for.
+        In that case prices come from L1/L2 only, whatever their age.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        ttls = self.ttls()
+        fresh_ttl, stale_ttl = ttls.fresh, max(ttls.stale, ttls.fresh)
+        if max_age is not None and ttls.live:
+            fresh_ttl = stale_ttl = min(fresh_ttl, max_age)
+        now = time.time()
+        prices, report, stale, missing = {}, {}, [], []
+
+        def serve(symbol, price, fetched_at, source):
+            prices[symbol] = dict(price)
+            report[symbol] = {"source": source, "age": now - fetched_at, "retries": 0,
+                              "rate_limit_wait": 0.0, "latency_ms": 0.0}
+
+        with self._lock:
+            entries = {symbol: self._entries.get(symbol) for symbol in symbols}
+        for symbol, entry in entries.items():
+            if entry and now - entry[1] <= fresh_ttl:
+                serve(symbol, entry[0], entry[1], "cache")
+                self._count("l1_hits")
+            else:
+                missing.append(symbol)
+
+        if missing:
+            started = time.monotonic()
+            try:
+                rows = get_stock_price_rows(missing)
+            except Exception as e:
+                # Treat an unreachable DB as an L2 miss for every symbol
+                logger.error(f"Failed to read cached prices from the DB: {str(e)}")
+                self._count("l2_errors")
+                rows = {}
+            latency = (time.monotonic() - started) * 1000
+            l2 = {symbol: (quote_to_price(quote), last_updated.timestamp()) for symbol, (quote, last_updated) in rows.items()}
+            fresher = {symbol: entry for symbol, entry in l2.items()
+                       if not entries[symbol] or entry[1] > entries[symbol][1]}
+            self._store(fresher)
+            for symbol, entry in fresher.items():
+                entries[symbol] = entry
+            still_missing = []
+            for symbol in missing:
+                entry = entries[symbol]
+                if entry and now - entry[1] <= fresh_ttl:
+                    serve(symbol, entry[0], entry[1], "db")
+                    report[symbol]["latency_ms"] = latency
+                    self._count("l2_hits")
+                elif entry and now - entry[1] <= stale_ttl:
+                    serve(symbol, entry[0], entry[1], "stale")
+                    self._count_stale(now - entry[1])
+                    stale.append(symbol)
+                else:
+                    still_missing.append(symbol)
+            missing = still_missing
+
+        if origin is None:
+            origin = max_age is not None or not self.daemon_alive()
+        if missing and not origin:
+            for symbol in missing:
+                entry = entries[symbol]
+                serve(symbol, entry[0] if entry else EMPTY_PRICE, entry[1] if entry else now, "stale" if entry else "default")
+            self._count("snapshot_misses", len(missing))
+            missing = []
+
+        if missing:
+            with self._lock:
+                blocked = {symbol for symbol in missing if self._failures.get(symbol, 0) > now}
+            for symbol in blocked:
+                entry = entries[symbol]
+                serve(symbol, entry[0] if entry else EMPTY_PRICE, entry[1] if entry else now, "stale" if entry else "default")
+                self._count("negative_hits")
+            missing = [symbol for symbol in missing if symbol not in blocked]
+
+        if missing:
+            self._count("misses", len(missing))
+            fetched = self._fetch_origin(missing, priority, max_workers)
+            for symbol in missing:
+                price, fetched_at, entry_report = fetched[symbol]
+                if price is None:
+                    last_known = entries[symbol]
+                    serve(symbol, last_known[0] if last_known else EMPTY_PRICE,
+                          last_known[1] if last_known else now, "stale" if last_known else "default")
+                else:
+                    serve(symbol, price, fetched_at, "api")
+                report[symbol].update(entry_report)
+
+        if stale and origin:
+            self._schedule_refresh(stale)
+        return prices, report
+
+    def _fetch_one(self, quota, symbol: str, priority: str):
+        started = time.monotonic()
+        report = {"retries": 0, "rate_limit_wait": 0.0}
+        price = None
+        try:
+            quote = quota.quote(symbol, priority=priority, report=report)
+            if isinstance(quote.get("c"), (int, float)) and quote["c"] > 0:
+                price = quote
+            else:
+                logger.warning(f"Invalid price data for {symbol}: {quote}")
+        except FinnhubRateLimited:
+            logger.error(f"Rate limit exceeded for {symbol}")
+        except Exception as e:
+            logger.error(f"Failed to fetch Finnhub price for {symbol}: {str(e)}")
+        report["latency_ms"] = (time.monotonic() - started) * 1000
+        return price, report
+
+    def _fetch_origin(self, symbols, priority: str, max_workers: Optional[int] = None) -> Dict:
+        """Fetch quotes from Finnhub concurrently and write successes to L1 and L2."""
+        quota = get_finnhub_quota()
+        workers = max(1, min(max_workers or ORIGIN_MAX_WORKERS, len(symbols)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="finnhub") as executor:
+            futures = {symbol: executor.submit(self._fetch_one, quota, symbol, priority) for symbol in symbols}
+            results = {symbol: future.result() for symbol, future in futures.items()}
+
+        now = time.time()
+        quotes = {symbol: quote for symbol, (quote, _) in results.items() if quote is not None}
+        failed = [symbol for symbol in symbols if symbol not in quotes]
+        self._count("origin_fetches", len(symbols))
+        if failed:
+            self._count("origin_errors", len(failed))
+            with self._lock:
+                for symbol in failed:
+                    self._failures[symbol] = now + self.negative_ttl
+        self._store({symbol: (quote_to_price(quote), now) for symbol, quote in quotes.items()})
+        try:
+            update_stock_prices_in_db(quotes)
+        except Exception as e:
+            logger.error(f"Failed to write fetched prices to the DB: {str(e)}")
+            self._count("l2_errors")
+        return {
+            symbol: (quote_to_price(quote) if quote is not None else None, now, report)
+            for symbol, (quote, report) in results.items()
+        }
+
+    def _schedule_refresh(self, symbols):
+        with self._lock:
+            now = time.time()
+            pending = [symbol for symbol in symbols
+                       if symbol not in self._refreshing and self._failures.get(symbol, 0) <= now]
+            self._refreshing.update(pending)
+        if pending:
+            self._refresher.submit(self._refresh, pending)
+
+    def _refresh(self, symbols):
+        try:
+            self._count("refreshes")
+            self._fetch_origin(symbols, BACKGROUND)
+        except Exception as e:
+            logger.error(f"Background price refresh failed for {symbols}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(symbols)
+
+    def invalidate(self, symbol: Optional[str] = None):
+        """Drop one symbol (or everything) from L1; L2 is left alone."""
+        with self._lock:
+            if symbol is None:
+                self._entries.clear()
+                self._failures.clear()
+            else:
+                self._entries.pop(symbol, None)
+                self._failures.pop(symbol, None)
+
+    def stats(self) -> Dict:
+        """Hit/miss counters per tier, hit rate and how stale the stale hits were."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["negative_entries"] = sum(1 for until in self._failures.values() if until > time.time())
+            stats["refreshing"] = len(self._refreshing)
+        stats["daemon_alive"] = self._daemon_state[1]
+        lookups = (stats["l1_hits"] + stats["l2_hits"] + stats["stale_hits"] + stats["negative_hits"]
+                   + stats["snapshot_misses"] + stats["misses"])
+        stats["hit_rate"] = (stats["l1_hits"] + stats["l2_hits"] + stats["stale_hits"]) / lookups if lookups else 0.0
+        stats["stale_age_avg"] = stats["stale_age_total"] / stats["stale_hits"] if stats["stale_hits"] else 0.0
+        return stats
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_price_cache() -> PriceCache:
+    """Return the process-wide price cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PriceCache()
+    return _cache
+
+def get_prices(symbols: Iterable[str], priority: str = BACKGROUND, max_age: Optional[float] = None) -> Dict[str, Dict]:
+    """Prices for ``symbols`` in the ``fetch_stock_prices()`` shape."""
+    return get_price_cache().get_many(symbols, priority=priority, max_age=max_age)[0]
@@ -0,0 +1,258 @@
+"""Append-only daily OHLCV history in the ``price_history`` table.
+
+Bars are keyed by (symbol, date). That is the table's InnoDB primary key and
+therefore its clustered index, so one symbol's bars are stored together in
+date order and a date-range read for a symbol is a single sequential scan.
+Rows are inserted with INSERT IGNORE, so an existing bar is never
+overwritten, with one exception: bars built from post-close Finnhub quotes
+(source ``PROVISIONAL_SOURCE``) have no volume and an unadjusted close, and
+``upgrade_history`` replaces them once Yahoo Finance has the final bar.
+
+    python -m data.price_history backfill --csv bars/AAPL.csv bars/MSFT.csv
+    python -m data.price_history backfill --yahoo --start 2015-01-01
+    python -m data.price_history status
+
+New sessions are appended daily by ``scripts/fetch_stock_prices.py``.
+"""
+import argparse
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from data.mysql_db import db_connection
+from utils.logger import logger
+
+HISTORY_COLUMNS = ["symbol", "date", "open", "high", "low", "close", "adj_close", "volume"]
+INSERT_BATCH_SIZE = 5000
+DEFAULT_BACKFILL_START = "2015-01-01"
+PROVISIONAL_SOURCE = "finnhub"
+
+def normalize_history(frame: pd.DataFrame, symbol: Optional[str] = None, source: str = "csv") -> pd.DataFrame:
+    """Coerce raw bars into ``HISTORY_COLUMNS`` plus ``source``.
+
+    Column names are matched case-insensitively ("Adj Close" -> adj_close).
+    ``symbol`` fills a missing symbol column and adj_close defaults to close.
+    Rows without a date or a positive close are dropped, and for duplicate
+    (symbol, date) pairs the last row wins.
+    """
+    if frame.empty:
+        return pd.DataFrame(columns=HISTORY_COLUMNS + ["source"])
+    df = frame.rename(columns=lambda column: str(column).strip().lower().replace(" ", "_")).copy()
+    if "symbol" not in df.columns:
+        if symbol is None:
+            raise ValueError("Bars have no symbol column and no symbol was given")
+        df["symbol"] = symbol
+    if "adj_close" not in df.columns and "close" in df.columns:
+        df["adj_close"] = df["close"]
+    for column in HISTORY_COLUMNS:
+        if column not in df.columns:
+            df[column] = None
+    df = df[HISTORY_COLUMNS].copy()
+    df["symbol"] = df["symbol"].astype(str).str.upper().str.strip()
+    df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.date
+    for column in ("open", "high", "low", "close", "adj_close", "volume"):
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype(float)
+    df = df[df["date"].notna() & (df["close"] > 0)]
+    df = df.drop_duplicates(["symbol", "date"], keep="last").sort_values(["symbol", "date"], ignore_index=True)
+    df["source"] = source
+    return df
+
+def read_csv(path, symbol: Optional[str] = None) -> pd.DataFrame:
+    """Bars from a CSV file, e.g. a Yahoo Finance export (Date, Open, ..., Volume).
+
+    Files without a symbol column take ``symbol`` or, failing that, the file
+    name stem (``AAPL.csv`` -> AAPL).
+    """
+    return normalize_history(pd.read_csv(path), symbol=symbol or Path(path).stem.upper(), source="csv")
+
+def _rows(bars: pd.DataFrame) -> List[tuple]:
+    """Normalized bars as DB parameter tuples in ``HISTORY_COLUMNS`` + source order."""
+    columns = HISTORY_COLUMNS + ["source"]
+    values = bars[columns].astype(object).where(bars[columns].notna(), None)
+    return [
+        (symbol, day, open_, high, low, close, adj_close, int(volume) if volume is not None else None, source)
+        for symbol, day, open_, high, low, close, adj_close, volume, source in values.itertuples(index=False)
+    ]
+
+def append_history(bars: pd.DataFrame) -> int:
+    """Insert normalized bars in batches, skipping (symbol, date) pairs already stored.
+
+    Returns the number of new rows.
+    """
+    if bars.empty:
+        return 0
+    rows = _rows(bars)
+    inserted = 0
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            for start in range(0, len(rows), INSERT_BATCH_SIZE):
+                cursor.executemany("""
+                    INSERT IGNORE INTO price_history (symbol, date, open, high, low, close, adj_close, volume, source)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, rows[start:start + INSERT_BATCH_SIZE])
+                inserted += max(cursor.rowcount, 0)
+                connection.commit()
+            logger.info(f"Appended {inserted}/{len(rows)} bars to price_history")
+            return inserted
+        except Exception as e:
+            logger.error(f"Failed to append price history: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+def upgrade_history(bars: pd.DataFrame) -> int:
+    """Overwrite stored provisional bars with the matching final ``bars``.
+
+    Only rows whose stored source is ``PROVISIONAL_SOURCE`` are touched, so
+    final bars stay first write wins. Returns the number of bars replaced.
+    """
+    bars = bars[bars["source"] != PROVISIONAL_SOURCE]
+    if bars.empty:
+        return 0
+    rows = [(*row[2:], *row[:2]) for row in _rows(bars)]
+    upgraded = 0
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            for start in range(0, len(rows), INSERT_BATCH_SIZE):
+                cursor.executemany(f"""
+                    UPDATE price_history
+                    SET open = %s, high = %s, low = %s, close = %s, adj_close = %s, volume = %s, source = %s
+                    WHERE symbol = %s AND date = %s AND source = '{PROVISIONAL_SOURCE}'
+                """, rows[start:start + INSERT_BATCH_SIZE])
+                upgraded += max(cursor.rowcount, 0)
+                connection.commit()
+            if upgraded:
+                logger.info(f"Replaced {upgraded} provisional bars in price_history")
+            return upgraded
+        except Exception as e:
+            logger.error(f"Failed to upgrade provisional price history: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+def latest_dates(symbols: Optional[Iterable[str]] = None) -> Dict[str, date]:
+    """Date of the newest stored bar per symbol (all symbols if None)."""
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            if symbols is None:
+                cursor.execute("SELECT symbol, MAX(date) FROM price_history GROUP BY symbol")
+            else:
+                symbols = list(dict.fromkeys(symbols))
+                if not symbols:
+                    return {}
+                placeholders = ", ".join(["%s"] * len(symbols))
+                cursor.execute(f"""
+                    SELECT symbol, MAX(date) FROM price_history
+                    WHERE symbol IN ({placeholders})
+                    GROUP BY symbol
+                """, tuple(symbols))
+            return {symbol: latest for symbol, latest in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"Failed to read latest history dates: {str(e)}")
+            return {}
+        finally:
+            cursor.close()
+
+def stored_sources(symbols: Iterable[str], start) -> Dict[str, Dict[date, str]]:
+    """{symbol: {date: source}} for the bars stored on or after ``start``."""
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    placeholders = ", ".join(["%s"] * len(symbols))
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT symbol, date, source FROM price_history
+                WHERE symbol IN ({placeholders}) AND date >= %s
+            """, (*symbols, pd.Timestamp(start).date()))
+            stored = {}
+            for symbol, day, source in cursor.fetchall():
+                stored.setdefault(symbol, {})[day] = source
+            return stored
+        except Exception as e:
+            logger.error(f"Failed to read stored history dates: {str(e)}")
+            return {}
+        finally:
+            cursor.close()
+
+def get_history(symbols: Iterable[str], start=None, end=None) -> pd.DataFrame:
+    """Stored bars for ``symbols`` between ``start`` and ``end`` (inclusive), sorted by symbol and date."""
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+    placeholders = ", ".join(["%s"] * len(symbols))
+    query = f"""
+        SELECT symbol, date, open, high, low, close, adj_close, volume
+        FROM price_history
+        WHERE symbol IN ({placeholders})
+    """
+    params = list(symbols)
+    if start is not None:
+        query += " AND date >= %s"
+        params.append(pd.Timestamp(start).date())
+    if end is not None:
+        query += " AND date <= %s"
+        params.append(pd.Timestamp(end).date())
+    query += " ORDER BY symbol, date"
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query, tuple(params))
+            frame = pd.DataFrame(cursor.fetchall(), columns=HISTORY_COLUMNS)
+            for column in ("open", "high", "low", "close", "adj_close", "volume"):
+                frame[column] = pd.to_numeric(frame[column], errors="coerce").astype(float)
+            return frame
+        except Exception as e:
+            logger.error(f"Failed to read price history for {symbols}: {str(e)}")
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+        finally:
+            cursor.close()
+
+def backfill(symbols: Optional[List[str]] = None, start=DEFAULT_BACKFILL_START, end=None,
+             csv_paths: Optional[List[str]] = None) -> int:
+    """Bulk-load history from CSV files or, without any, from Yahoo Finance.
+
+    Safe to re-run: bars that are already stored are skipped.
+    """
+    if csv_paths:
+        bars = pd.concat([read_csv(path) for path in csv_paths], ignore_index=True)
+        if symbols:
+            bars = bars[bars["symbol"].isin([symbol.upper() for symbol in symbols])]
+    else:
+        from data.yahoo_finance import get_price_history
+        if not symbols:
+            from scripts.fetch_stock_prices import STOCK_LIST
+            symbols = STOCK_LIST
+        bars = normalize_history(get_price_history(symbols, start, end), source="yahoo")
+    logger.info(f"Backfilling {len(bars)} bars for {bars['symbol'].nunique()} symbols")
+    return append_history(bars)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and inspect the daily price history.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("backfill", help="Bulk-load bars from CSV files or Yahoo Finance")
+    load.add_argument("--csv", nargs="+", default=None, help="CSV files to load (one symbol per file or a symbol column)")
+    load.add_argument("--yahoo", action="store_true", help="Download bars from Yahoo Finance (the default without --csv)")
+    load.add_argument("--symbols", nargs="+", default=None, help="Symbols to load (default: all in the CSVs, or STOCK_LIST)")
+    load.add_argument("--start", default=DEFAULT_BACKFILL_START)
+    load.add_argument("--end", default=None)
+    commands.add_parser("status", help="Show the newest stored bar per symbol")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        for symbol, latest in sorted(latest_dates().items()):
+            print(f"{symbol}: {latest}")
+        return
+    if args.csv and args.yahoo:
+        parser.error("use either --csv or --yahoo")
+    inserted = backfill(args.symbols, start=args.start, end=args.end, csv_paths=args.csv)
+    print(f"Inserted {inserted} new bars")
+
+if __name__ == "__main__":
+    main()
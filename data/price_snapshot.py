@@ -0,0 +1,92 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional
+
+from utils.logger import logger
+
+EMPTY_QUOTE = MappingProxyType({
+    "current_price": 0.0,
+    "high_price": 0.0,
+    "low_price": 0.0,
+    "previous_close": 0.0
+})
+
+def _freeze(prices: Mapping[str, Mapping]) -> Mapping[str, Mapping]:
+    return MappingProxyType({
+        symbol: MappingProxyType({key: float(value) for key, value in quote.items()})
+        for symbol, quote in prices.items()
+    })
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    """Immutable set of prices shared by every step of one workflow run.
+
+    ``prices`` has the same shape as ``fetch_stock_prices()``; ``sources`` maps
+    each symbol to where its price came from (cache, db, stale, api or default) and
+    ``taken_at`` is when the snapshot was captured, in UTC.
+    """
+    prices: Mapping[str, Mapping] = field(default_factory=dict)
+    sources: Mapping[str, str] = field(default_factory=dict)
+    taken_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    def __post_init__(self):
+        object.__setattr__(self, "prices", _freeze(self.prices))
+        object.__setattr__(self, "sources", MappingProxyType(dict(self.sources)))
+
+    @classmethod
+    def capture(cls, symbols: Optional[Iterable[str]] = None) -> "PriceSnapshot":
+        """Fetch prices once (cache, then DB, then Finnhub) and freeze them."""
+        from scripts.fetch_stock_prices import fetch_stock_prices_with_report
+        taken_at = datetime.now(timezone.utc)
+        try:
+            stock_data, report = fetch_stock_prices_with_report(symbols)
+        except Exception as e:
+            logger.error(f"Failed to capture price snapshot: {str(e)}")
+            stock_data, report = {}, {}
+        snapshot = cls(
+            prices=stock_data,
+            sources={symbol: entry["source"] for symbol, entry in report.items()},
+            taken_at=taken_at
+        )
+        logger.info(f"Captured price snapshot of {len(snapshot.prices)} symbols at {taken_at.isoformat()} ({snapshot.source_summary()})")
+        return snapshot
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PriceSnapshot":
+        """Rebuild a snapshot saved with ``to_dict``, e.g. to replay a past run."""
+        return cls(
+            prices=data.get("prices", {}),
+            sources=data.get("sources", {}),
+            taken_at=datetime.fromisoformat(data["taken_at"])
+        )
+
+    def quote(self, symbol: str) -> Mapping:
+        return self.prices.get(symbol, EMPTY_QUOTE)
+
+    def price(self, symbol: str) -> float:
+        """Current price for ``symbol``, or 0.0 if it is not in the snapshot."""
+        return self.quote(symbol)["current_price"]
+
+    def source(self, symbol: str) -> str:
+        return self.sources.get(symbol, "missing")
+
+    def as_stock_data(self) -> Dict[str, Dict]:
+        """Mutable copy in the ``fetch_stock_prices()`` shape for existing callers."""
+        return {symbol: dict(quote) for symbol, quote in self.prices.items()}
+
+    def source_summary(self) -> str:
+        counts = {}
+        for source in self.sources.values():
+            counts[source] = counts.get(source, 0) + 1
+        return ", ".join(f"{count} {source}" for source, count in sorted(counts.items())) or "no prices"
+
+    def describe(self) -> str:
+        return f"Prices as of {self.taken_at.strftime('%Y-%m-%d %H:%M:%S')} UTC ({self.source_summary()})"
+
+    def to_dict(self) -> Dict:
+        return {
+            "prices": self.as_stock_data(),
+            "sources": dict(self.sources),
+            "taken_at": self.taken_at.isoformat()
+        }
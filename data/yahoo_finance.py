@@ -1,5 +1,36 @@
 import yfinance as yf
+import pandas as pd
 
 def get_stock_data(symbol):
     stock = yf.Ticker(symbol)
-    return stock.info
\ No newline at end of file
+    return stock.info
+
+def get_price_history(symbols, start, end=None) -> pd.DataFrame:
+    """Daily OHLCV bars for ``symbols`` from ``start`` up to and including ``end``.
+
+    Returns one long frame with columns symbol, date, open, high, low, close,
+    adj_close and volume (empty if Yahoo returned nothing); symbols Yahoo has
+    no data for are left out.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    # yfinance treats ``end`` as exclusive
+    end = pd.Timestamp(end) + pd.Timedelta(days=1) if end is not None else None
+    frame = yf.download(symbols, start=start, end=end, auto_adjust=False, group_by="ticker",
+                        progress=False, threads=True)
+    if frame is None or frame.empty:
+        return pd.DataFrame()
+    parts = []
+    for symbol in symbols:
+        if isinstance(frame.columns, pd.MultiIndex):
+            if symbol not in frame.columns.get_level_values(0):
+                continue
+            bars = frame[symbol]
+        else:
+            bars = frame
+        bars = bars.dropna(how="all")
+        if bars.empty:
+            continue
+        bars = bars.rename(columns=lambda column: str(column).lower().replace(" ", "_")).rename_axis("date").reset_index()
+        bars.insert(0, "symbol", symbol)
+        parts.append(bars)
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
@@ -1,4 +1,4 @@
-from data.mysql_db import get_db_connection
+from data.mysql_db import db_connection
 from utils.logger import logger
 import mysql.connector
 
@@ -19,16 +19,17 @@ def mask_balance(balance: float) -> str:
 
 def update_leaderboard(user_id: str, username: str, balance: float):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE users 
-            SET balance = %s
-            WHERE id = %s
-        """, (balance, user_id))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    UPDATE users 
+                    SET balance = %s
+                    WHERE id = %s
+                """, (balance, user_id))
+                conn.commit()
+            finally:
+                cursor.close()
         logger.info(f"Leaderboard updated for user {user_id}: Balance ${balance}")
     except mysql.connector.Error as e:
         logger.error(f"Failed to update leaderboard for user {user_id}: SQL Error: {str(e)}")
@@ -36,36 +37,29 @@ def update_leaderboard(user_id: str, username: str, balance: float):
     except Exception as e:
         logger.error(f"Unexpected error updating leaderboard for user {user_id}: {str(e)}")
         raise
-    finally:
-        if 'conn' in locals() and conn.is_connected():
-            cursor.close()
-            conn.close()
 
 def get_leaderboard():
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-
-        cursor.execute("""
-            SELECT u.username, u.balance
-            FROM users u
-            WHERE EXISTS (
-                SELECT 1 FROM trades t WHERE t.user_id = u.id
-            )
-            ORDER BY u.balance DESC
-            LIMIT 10
-        """)
-
-        leaderboard = cursor.fetchall()
+        with db_connection() as connection:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute("""
+                    SELECT u.username, u.balance
+                    FROM users u
+                    WHERE EXISTS (
+                        SELECT 1 FROM trades t WHERE t.user_id = u.id
+                    )
+                    ORDER BY u.balance DESC
+                    LIMIT 10
+                """)
+                leaderboard = cursor.fetchall()
+            finally:
+                cursor.close()
 
         for user in leaderboard:
             user["masked_balance"] = mask_balance(user["balance"])
 
         return leaderboard
     except Exception as e:
-        logging.error("Error getting leaderboard: %s", e)
+        logger.error(f"Error getting leaderboard: {str(e)}")
         return []
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
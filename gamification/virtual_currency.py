@@ -1,4 +1,4 @@
-from data.mysql_db import get_db_connection
+from data.mysql_db import db_connection, get_db_connection
 from utils.logger import logger
 import mysql.connector
 from datetime import datetime
@@ -6,18 +6,64 @@ import decimal
 
 def get_balance(user_id: str) -> float:
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
+                result = cursor.fetchone()
+            finally:
+                cursor.close()
         return float(result["balance"]) if result else 100000.0
     except Exception as e:
         logger.error(f"Failed to get balance for user {user_id}: {str(e)}")
         return 100000.0
 
+# Quantities below this are treated as a closed position
+QUANTITY_EPSILON = 1e-9
+
+def apply_trade_to_position(position, trade_type: str, quantity: float, price: float, amount: float):
+    """Apply one trade to a position using average-cost accounting.
+
+    ``position`` is a dict with quantity, cost_basis (total cost of the shares
+    still held) and realized_pnl, or None for a new position. Returns the updated
+    position, or None if a sell exceeds the shares held.
+    """
+    position = dict(position or {"quantity": 0.0, "cost_basis": 0.0, "realized_pnl": 0.0})
+    if trade_type == "buy":
+        position["quantity"] += quantity
+        position["cost_basis"] += amount
+        return position
+
+    if position["quantity"] + QUANTITY_EPSILON < quantity:
+        return None
+    avg_cost = position["cost_basis"] / position["quantity"] if position["quantity"] > 0 else price
+    position["quantity"] -= quantity
+    position["cost_basis"] -= avg_cost * quantity
+    position["realized_pnl"] += (price - avg_cost) * quantity
+    if position["quantity"] <= QUANTITY_EPSILON:
+        position["quantity"] = 0.0
+        position["cost_basis"] = 0.0
+    return position
+
+def replay_trades(trades: list) -> dict:
+    """Rebuild positions by replaying trades in order. Returns {symbol: position}."""
+    positions = {}
+    for trade in trades:
+        try:
+            amount = float(trade["amount"])
+            price = float(trade["price"])
+        except (TypeError, ValueError, decimal.InvalidOperation):
+            continue
+        if amount <= 0 or price <= 0:
+            continue
+        symbol = trade["symbol"]
+        updated = apply_trade_to_position(positions.get(symbol), trade["trade_type"], amount / price, price, amount)
+        if updated is not None:
+            positions[symbol] = updated
+    return positions
+
 def add_trade(user_id: str, trade: dict) -> bool:
+    conn = cursor = None
     try:
         # Validate trade dictionary
         required_keys = ["id", "symbol", "amount", "price", "trade_type", "timestamp", "quantity"]
@@ -57,15 +103,35 @@ def add_trade(user_id: str, trade: dict) -> bool:
             logger.error(f"Invalid timestamp format: {trade['timestamp']}")
             return False
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Check balance for buy trades
+        # Check balance for buy trades before borrowing a connection (get_balance borrows its own)
         current_balance = get_balance(user_id)
         if trade["trade_type"] == "buy" and trade["amount"] > current_balance:
             logger.error(f"Insufficient balance for user {user_id}: {trade['amount']} > {current_balance}")
             return False
 
+        # Shares are amount / price everywhere (replay_trades, the positions
+        # backfill), so the materialized position matches a rebuild
+        trade["quantity"] = trade["amount"] / trade["price"]
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        # Lock and check the position first so an oversell changes nothing
+        cursor.execute("""
+            SELECT quantity, cost_basis, realized_pnl
+            FROM positions
+            WHERE user_id = %s AND symbol = %s
+            FOR UPDATE
+        """, (user_id, trade["symbol"]))
+        row = cursor.fetchone()
+        position = {"quantity": float(row[0]), "cost_basis": float(row[1]), "realized_pnl": float(row[2])} if row else None
+        updated = apply_trade_to_position(position, trade["trade_type"], trade["quantity"], trade["price"], trade["amount"])
+        if updated is None:
+            logger.error(f"Cannot sell {trade['quantity']} shares of {trade['symbol']} for user {user_id}: "
+                         f"only {position['quantity'] if position else 0.0} held")
+            conn.rollback()
+            return False
+
         # Insert trade
         cursor.execute("""
             INSERT INTO trades (id, user_id, symbol, amount, price, trade_type, timestamp, quantity)
@@ -89,34 +155,74 @@ def add_trade(user_id: str, trade: dict) -> bool:
             WHERE id = %s
         """, (balance_change, user_id))
 
+        # Update the materialized position in the same transaction
+        cursor.execute("""
+            INSERT INTO positions (user_id, symbol, quantity, cost_basis, realized_pnl, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                quantity = VALUES(quantity),
+                cost_basis = VALUES(cost_basis),
+                realized_pnl = VALUES(realized_pnl),
+                updated_at = VALUES(updated_at)
+        """, (user_id, trade["symbol"], updated["quantity"], updated["cost_basis"], updated["realized_pnl"], trade["timestamp"]))
+
         conn.commit()
         logger.info(f"Trade added for user {user_id}: {trade['symbol']}, ${trade['amount']}, Type: {trade['trade_type']}, Quantity: {trade['quantity']}")
         return True
     except mysql.connector.Error as e:
         logger.error(f"Failed to add trade for user {user_id}: SQL Error: {str(e)}, Trade: {trade}")
-        if 'conn' in locals() and conn.is_connected():
+        if conn is not None and conn.is_connected():
             conn.rollback()
         return False
     except Exception as e:
         logger.error(f"Unexpected error adding trade for user {user_id}: {str(e)}, Trade: {trade}")
-        if 'conn' in locals() and conn.is_connected():
+        if conn is not None and conn.is_connected():
             conn.rollback()
         return False
     finally:
-        if 'conn' in locals() and conn.is_connected():
-            cursor.close()
-            conn.close()
+        # Always hand the connection back, even if it died mid-trade
+        try:
+            if cursor is not None:
+                cursor.close()
+        finally:
+            if conn is not None:
+                conn.close()
 
 def get_portfolio(user_id: str) -> list:
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM trades WHERE user_id = %s", (user_id,))
-        trades = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("SELECT * FROM trades WHERE user_id = %s", (user_id,))
+                trades = cursor.fetchall()
+            finally:
+                cursor.close()
         logger.info(f"Retrieved portfolio for user {user_id}: {len(trades)} trades")
         return trades
     except Exception as e:
         logger.error(f"Failed to get portfolio for user {user_id}: {str(e)}")
-        return []
\ No newline at end of file
+        return []
+
+def get_positions(user_id: str) -> list:
+    """Return the user's materialized positions, one row per symbol ever traded."""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("""
+                    SELECT symbol, quantity, cost_basis, realized_pnl, updated_at
+                    FROM positions
+                    WHERE user_id = %s
+                    ORDER BY symbol
+                """, (user_id,))
+                positions = cursor.fetchall()
+            finally:
+                cursor.close()
+        for position in positions:
+            for key in ("quantity", "cost_basis", "realized_pnl"):
+                position[key] = float(position[key])
+        logger.info(f"Retrieved {len(positions)} positions for user {user_id}")
+        return positions
+    except Exception as e:
+        logger.error(f"Failed to get positions for user {user_id}: {str(e)}")
+        return []
@@ -0,0 +1,60 @@
+"""Benchmark the vectorized portfolio engine against the per-trade replay.
+
+    python -m scripts.benchmark_portfolio --trades 100000 --symbols 50
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from analytics.portfolio import compute_positions, value_positions
+from gamification.virtual_currency import replay_trades
+
+def synthetic_trades(n_trades: int, n_symbols: int, seed: int = 7) -> pd.DataFrame:
+    """Random buy-heavy trade history, including some sells larger than the holding."""
+    rng = np.random.default_rng(seed)
+    symbols = np.array([f"SYM{i:03d}" for i in range(n_symbols)])
+    price = rng.uniform(5, 500, n_trades).round(2)
+    quantity = rng.uniform(0.1, 20, n_trades)
+    return pd.DataFrame({
+        "symbol": symbols[rng.integers(0, n_symbols, n_trades)],
+        "trade_type": np.where(rng.random(n_trades) < 0.6, "buy", "sell"),
+        "amount": quantity * price,
+        "price": price,
+        "timestamp": pd.Timestamp("2020-01-01") + pd.to_timedelta(np.arange(n_trades), unit="s"),
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark portfolio accounting.")
+    parser.add_argument("--trades", type=int, default=100_000)
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    trades = synthetic_trades(args.trades, args.symbols)
+    prices = dict(zip(trades["symbol"], trades["price"]))
+
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        positions = value_positions(compute_positions(trades), prices)
+        timings.append(time.perf_counter() - started)
+    print(f"Vectorized: {args.trades} trades, {args.symbols} symbols -> "
+          f"best {min(timings) * 1000:.1f}ms, median {np.median(timings) * 1000:.1f}ms")
+
+    records = trades.to_dict("records")
+    started = time.perf_counter()
+    reference = replay_trades(records)
+    loop_time = time.perf_counter() - started
+    print(f"Per-trade replay: {loop_time * 1000:.1f}ms ({loop_time / min(timings):.1f}x slower)")
+
+    worst = max(
+        abs(reference[symbol][column] - positions.loc[symbol, column])
+        for symbol in reference
+        for column in ("quantity", "cost_basis", "realized_pnl")
+    )
+    print(f"Max absolute difference vs replay: {worst:.3e}")
+
+if __name__ == "__main__":
+    main()
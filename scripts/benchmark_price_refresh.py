@@ -0,0 +1,53 @@
+"""Benchmark page-render price loading: inline Finnhub fetch vs the daemon's DB snapshot.
+
+Runs against the configured database and Finnhub account:
+
+    python -m scripts.benchmark_price_refresh --repeat 5
+
+"inline" is what a page rerun paid before the daemon whenever the cached
+prices had expired: every symbol is fetched from Finnhub through the shared
+quota, with its retries and rate limiter waits. "snapshot" is what a page
+pays while the daemon is alive: one stock_prices query. Each run uses a
+fresh cache so nothing is served from process memory.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from data.price_cache import PriceCache
+from scripts.fetch_stock_prices import STOCK_LIST
+from utils.finnhub_quota import INTERACTIVE
+from utils.market_calendar import QuoteTTLs
+
+# Treat every quote as expired, as on a page rerun right after the TTL ran out
+EXPIRED = lambda: QuoteTTLs(True, 0.0, 0.0)
+
+def time_loads(symbols, repeat: int, inline: bool):
+    timings, sources = [], {}
+    for _ in range(repeat):
+        cache = PriceCache(ttls=EXPIRED) if inline else PriceCache()
+        started = time.perf_counter()
+        _, report = cache.get_many(symbols, priority=INTERACTIVE, origin=inline)
+        timings.append(time.perf_counter() - started)
+        for entry in report.values():
+            sources[entry["source"]] = sources.get(entry["source"], 0) + 1
+    return np.array(timings) * 1000, sources
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inline price fetches against DB snapshot reads.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--symbols", nargs="+", default=STOCK_LIST)
+    args = parser.parse_args()
+
+    results = {}
+    for name, inline in (("inline", True), ("snapshot", False)):
+        timings, sources = time_loads(args.symbols, args.repeat, inline)
+        results[name] = timings
+        print(f"{name:>8}: {len(args.symbols)} symbols -> median {np.median(timings):.1f}ms, "
+              f"p95 {np.percentile(timings, 95):.1f}ms, max {timings.max():.1f}ms (sources: {sources})")
+    speedup = np.median(results["inline"]) / max(np.median(results["snapshot"]), 1e-9)
+    print(f"Snapshot reads are {speedup:.1f}x faster at the median")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark the lexicon sentiment scorer, and its agreement with LLM labels.
+
+    python -m scripts.benchmark_sentiment --headlines 100000
+    python -m scripts.benchmark_sentiment --labels labeled.jsonl
+    python -m scripts.benchmark_sentiment --llm 200
+
+``--labels`` reads JSON lines with "headline" and "label" (Positive, Negative
+or Neutral), e.g. exported LLM decisions. ``--llm N`` labels N synthetic
+headlines with the Groq model instead, 25 per prompt, through the shared
+response cache so repeated runs do not re-bill the same prompts.
+"""
+import argparse
+import json
+import re
+import time
+
+import numpy as np
+
+from analytics.sentiment import LABEL_THRESHOLD, score_headlines, score_symbols, sentiment_label
+
+SUBJECTS = ["Apple", "Microsoft", "Tesla", "Nvidia", "Amazon", "Meta", "Alphabet", "Netflix", "AMD", "Intel"]
+TEMPLATES = [
+    "{s} shares surge after earnings beat estimates",
+    "{s} stock plunges as revenue misses expectations",
+    "{s} upgraded to buy by analysts on strong growth",
+    "{s} downgraded amid concerns over slowing demand",
+    "{s} announces new product lineup at annual event",
+    "{s} faces antitrust probe in Europe",
+    "{s} did not miss guidance despite supply shortage",
+    "{s} shares slightly lower ahead of Fed decision",
+    "{s} reports record profit, raises dividend",
+    "{s} layoffs deepen as sales decline sharply",
+    "{s} CEO to speak at industry conference",
+    "{s} stock rebounds after steep selloff",
+]
+
+def synthetic_headlines(n: int, seed: int = 11) -> list:
+    rng = np.random.default_rng(seed)
+    subjects = rng.integers(0, len(SUBJECTS), n)
+    templates = rng.integers(0, len(TEMPLATES), n)
+    return [TEMPLATES[t].format(s=SUBJECTS[s]) for s, t in zip(subjects, templates)]
+
+def llm_labels(headlines: list, batch_size: int = 25) -> tuple:
+    """Label headlines with the Groq model; returns (labels, seconds spent)."""
+    from langchain_groq import ChatGroq
+    from utils.config import GROQ_API_KEY
+    from utils.llm_cache import CachedLLM
+
+    llm = CachedLLM(ChatGroq(api_key=GROQ_API_KEY, model_name="llama-3.3-70b-versatile"), namespace="market_analyst", ttl=600)
+    labels = []
+    started = time.perf_counter()
+    for start in range(0, len(headlines), batch_size):
+        batch = {f"h{i}": headline for i, headline in enumerate(headlines[start:start + batch_size])}
+        prompt = f"""
+Score the sentiment of each news headline below from -1 (negative) to 1 (positive):
+{json.dumps(batch, indent=2)}
+Return ONLY one JSON object mapping every key to its score.
+"""
+        match = re.search(r'\{[\s\S]*\}', llm.invoke(prompt).content)
+        scores = json.loads(match.group(0)) if match else {}
+        labels.extend(sentiment_label(float(scores.get(key, 0.0))) for key in batch)
+    return labels, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lexicon headline sentiment.")
+    parser.add_argument("--headlines", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--labels", help="JSON lines of {headline, label} to measure agreement against")
+    parser.add_argument("--llm", type=int, default=0, help="Label this many headlines with the LLM for agreement")
+    args = parser.parse_args()
+
+    headlines = synthetic_headlines(args.headlines)
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        score_headlines(headlines)
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    print(f"Lexicon: {args.headlines} headlines in best {best * 1000:.1f}ms "
+          f"({args.headlines / best:,.0f} headlines/s)")
+
+    grouped = {f"SYM{i:03d}": headlines[i * 5:(i + 1) * 5] for i in range(min(1000, args.headlines // 5))}
+    started = time.perf_counter()
+    symbols = score_symbols(grouped)
+    elapsed = time.perf_counter() - started
+    print(f"Lexicon: {len(grouped)} symbols x 5 headlines in {elapsed * 1000:.1f}ms, "
+          f"{(symbols['confidence'] >= 0.6).mean():.0%} confident at the default threshold")
+
+    if args.labels:
+        with open(args.labels) as f:
+            labeled = [json.loads(line) for line in f if line.strip()]
+        sample = [row["headline"] for row in labeled]
+        reference = [row["label"] for row in labeled]
+    elif args.llm:
+        sample = synthetic_headlines(args.llm, seed=23)
+        reference, llm_time = llm_labels(sample)
+        print(f"LLM: {len(sample)} headlines in {llm_time:.1f}s ({len(sample) / llm_time:,.1f} headlines/s)")
+    else:
+        return
+
+    scores, hits = score_headlines(sample)
+    predicted = np.array([sentiment_label(score) for score in scores])
+    reference = np.array(reference)
+    print(f"Agreement with reference labels: {(predicted == reference).mean():.1%} over {len(sample)} headlines "
+          f"(threshold ±{LABEL_THRESHOLD})")
+    with_signal = hits > 0
+    if with_signal.any():
+        print(f"  on headlines with lexicon hits: {(predicted[with_signal] == reference[with_signal]).mean():.1%} "
+              f"({with_signal.sum()} headlines)")
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,24 @@
-import finnhub
-import mysql.connector
-from mysql.connector import Error
 from datetime import datetime, timezone, timedelta
+import argparse
+import pandas as pd
+import random
+import signal
+import threading
 import time
 import logging
 from logging.handlers import RotatingFileHandler
 import os
 from dotenv import load_dotenv
-from cachetools import TTLCache
 from pathlib import Path
 
-from utils.config import AZURE_USER, AZURE_PASSWORD, AZURE_HOSTNAME, AZURE_PORT, AZURE_DATABASE
+from analytics.price_matrix import build_matrix
+from utils.singleflight import coalesced
+from data.mysql_db import get_stock_price_rows, record_heartbeat
+from data.price_cache import PRICE_DAEMON, get_price_cache
+from data.price_history import PROVISIONAL_SOURCE, append_history, latest_dates, normalize_history, stored_sources, upgrade_history
+from utils.config import PRICE_DAEMON_STALE_AFTER
+from utils.finnhub_quota import BACKGROUND
+from utils.market_calendar import is_trading_day, last_settled_session, quote_ttls, session
 
 # Ensure logs directory exists
 LOG_DIR = Path("finance_simulator/logs")
@@ -33,203 +41,212 @@ except PermissionError as e:
 load_dotenv()
 
 # Configuration
-FINNHUB_API_KEY = os.getenv('FINNHUB_API_KEY')
-MYSQL_HOST = os.getenv('MYSQL_HOST', 'localhost')
-MYSQL_USER = os.getenv('MYSQL_USER')
-MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD')
-MYSQL_DATABASE = os.getenv('MYSQL_DATABASE', 'stock_data')
+# The Finnhub quota itself (calls/minute) is shared process-wide, see utils/finnhub_quota.py
+FINNHUB_MAX_WORKERS = int(os.getenv('FINNHUB_MAX_WORKERS', '8'))
+# Daemon mode: seconds between refresh passes, randomized by +/- PRICE_DAEMON_JITTER
+PRICE_DAEMON_INTERVAL = float(os.getenv('PRICE_DAEMON_INTERVAL', '60'))
+PRICE_DAEMON_JITTER = float(os.getenv('PRICE_DAEMON_JITTER', '0.2'))
+# Days of price history checked for missing or provisional sessions on every append
+PRICE_HISTORY_LOOKBACK_DAYS = int(os.getenv('PRICE_HISTORY_LOOKBACK_DAYS', '30'))
 
 STOCK_LIST = [
     "UNH", "TSLA", "QCOM", "ORCL", "NVDA", "NFLX", "MSFT", "META", "LLY", "JNJ",
     "INTC", "IBM", "GOOGL", "GM", "F", "CSCO", "AMZN", "AMD", "ADBE", "AAPL"
 ]
 
-# Cache for stock prices (24-hour TTL)
-price_cache = TTLCache(maxsize=100, ttl=86400)
+# Sessions loading the same prices at once share one cache/DB/Finnhub pass
+@coalesced("stock_prices", key=lambda symbols=None, max_workers=None: tuple(sorted(symbols or STOCK_LIST)))
+def fetch_stock_prices_with_report(symbols=None, max_workers: int = None):
+    """Fetch prices for ``symbols`` through the shared tiered price cache.
 
-def get_db_connection(attempts=3, delay=5):
-    """Establish MySQL database connection with retries."""
-    for attempt in range(attempts):
-        try:
-            conn = mysql.connector.connect(
-                user=AZURE_USER, 
-                password=AZURE_PASSWORD,
-                host=AZURE_HOSTNAME,
-                port=AZURE_PORT, 
-                database=AZURE_DATABASE,
-                ssl_disabled=False,
-                tls_versions=['TLSv1.2', 'TLSv1.3'])
-            logger.debug("Database connection established")
-            return conn
-        except Error as e:
-            logger.error(f"Attempt {attempt + 1}/{attempts} - Failed to connect to database: {str(e)}")
-            if attempt < attempts - 1:
-                time.sleep(delay)
-    logger.error("Failed to connect to database after all attempts")
-    return None
-
-def get_stock_price_from_db(symbol: str) -> dict:
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT open_price, close_price, high_price, low_price, current_price, last_updated
-            FROM stock_prices
-            WHERE symbol = %s
-        """, (symbol,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        if result:
-            last_updated = result["last_updated"]
-            if last_updated.tzinfo is None:
-                last_updated = last_updated.replace(tzinfo=timezone.utc)
-            if last_updated >= datetime.now(timezone.utc) - timedelta(hours=1):
-                logger.info(f"Fetched recent price for {symbol} from DB")
-                return {
-                    "o": float(result["open_price"]),
-                    "c": float(result["current_price"]),
-                    "h": float(result["high_price"]),
-                    "l": float(result["low_price"]),
-                    "pc": float(result["close_price"])
-                }
-        logger.info(f"No recent price for {symbol} in DB")
-        return None
-    except Exception as e:
-        logger.error(f"Failed to fetch price from DB for {symbol}: {str(e)}")
-        return None
+    Memory and DB hits are served directly, stale prices are served while
+    they refresh in the background and the remainder is fetched from Finnhub
+    concurrently; see data/price_cache.py.
 
-def update_stock_price_in_db(symbol: str, quote: dict):
-    """Update or insert stock price in the database."""
-    conn = get_db_connection()
-    if not conn:
-        return
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO stock_prices (symbol, open_price, close_price, high_price, low_price, current_price, timestamp, last_updated)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                open_price = %s,
-                close_price = %s,
-                high_price = %s,
-                low_price = %s,
-                current_price = %s,
-                timestamp = %s,
-                last_updated = %s
-        """, (
-            symbol, quote["o"], quote["pc"], quote["h"], quote["l"], quote["c"], datetime.now(timezone.utc), datetime.now(timezone.utc),
-            quote["o"], quote["pc"], quote["h"], quote["l"], quote["c"], datetime.now(timezone.utc), datetime.now(timezone.utc)
-        ))
-        conn.commit()
-        logger.info(f"Updated price for {symbol} in DB: ${quote['c']:.2f}")
-    except Error as e:
-        logger.error(f"Failed to update price in DB for {symbol}: {str(e)}")
-    finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
+    Returns (stock_data, report). ``stock_data`` has the same shape as
+    ``fetch_stock_prices``; ``report`` maps each symbol to its source
+    (cache, db, stale, api or default), age in seconds, latency in
+    milliseconds, retry count and the seconds spent waiting on the shared
+    Finnhub rate limiter.
+    """
+    symbols = list(symbols or STOCK_LIST)
+    started = time.monotonic()
+    stock_data, report = get_price_cache().get_many(symbols, max_workers=max_workers or FINNHUB_MAX_WORKERS)
+    elapsed_ms = (time.monotonic() - started) * 1000
+    sources = {}
+    for entry in report.values():
+        sources[entry["source"]] = sources.get(entry["source"], 0) + 1
+    logger.info(
+        f"Fetched {len(symbols)} prices in {elapsed_ms:.0f}ms "
+        f"(sources: {sources}, retries: {sum(r['retries'] for r in report.values())})"
+    )
+    return stock_data, report
 
 def fetch_stock_prices():
     """Fetch stock prices from Finnhub and store in database, handling rate limits."""
-    stock_data = {}
+    stock_data, _ = fetch_stock_prices_with_report()
+    return stock_data
+
+def refresh_once(symbols=None) -> dict:
+    """One daemon pass over ``symbols``, writing new quotes to the stock_prices table.
+
+    While the market is live every quote is re-fetched. Once it has closed,
+    only symbols without a post-close quote are fetched, so passes during
+    nights and weekends make no Finnhub calls.
+    """
+    symbols = list(symbols or STOCK_LIST)
+    started = time.monotonic()
+    _, report = get_price_cache().get_many(symbols, priority=BACKGROUND, max_age=0, origin=True,
+                                           max_workers=FINNHUB_MAX_WORKERS)
+    sources = {}
+    for entry in report.values():
+        sources[entry["source"]] = sources.get(entry["source"], 0) + 1
+    return {
+        "market_live": quote_ttls().live,
+        "sources": sources,
+        "fetched": sources.get("api", 0),
+        "failed": sources.get("stale", 0) + sources.get("default", 0),
+        "seconds": round(time.monotonic() - started, 3)
+    }
+
+def append_daily_history(symbols=None) -> int:
+    """Append every finished session missing from price_history for ``symbols``.
+
+    Gaps are found against the trading calendar over the last
+    ``PRICE_HISTORY_LOOKBACK_DAYS`` (or since the newest bar, if that is
+    older), so a session skipped in the middle of the history is refilled
+    too. Provisional bars count as missing: they are downloaded again and
+    replaced once Yahoo Finance has the final bar. Everything missing is
+    fetched from Yahoo in one download; symbols without any history only get
+    the last session (use ``python -m data.price_history backfill`` for
+    those). When Yahoo has no bar yet for the last session, the post-close
+    quote in stock_prices is stored as a provisional bar, without volume.
+    The price matrix (analytics/price_matrix.py) is then updated, and rebuilt
+    when bars before its newest day changed. Returns the number of bars
+    added or replaced.
+    """
+    from data.yahoo_finance import get_price_history
+    symbols = list(symbols or STOCK_LIST)
+    last_session = last_settled_session()
+    window_start = last_session - timedelta(days=PRICE_HISTORY_LOOKBACK_DAYS)
+    latest = latest_dates(symbols)
+    stored = stored_sources([symbol for symbol in symbols if symbol in latest], window_start)
+    missing = {}
+    for symbol in symbols:
+        if symbol not in latest:
+            missing[symbol] = [last_session]
+            continue
+        sources = stored.get(symbol, {})
+        # Sessions before a symbol's first bar in the window are not gaps
+        first = min(sources) if sources else latest[symbol] + timedelta(days=1)
+        day, days = first, []
+        while day <= last_session:
+            if is_trading_day(day) and sources.get(day, PROVISIONAL_SOURCE) == PROVISIONAL_SOURCE:
+                days.append(day)
+            day += timedelta(days=1)
+        if days:
+            missing[symbol] = days
+    if not missing:
+        logger.info(f"Price history already includes {last_session} for {len(symbols)} symbols")
+        return 0
+    start = min(days[0] for days in missing.values())
     try:
-        finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
-        logger.info("Initialized Finnhub client")
+        bars = normalize_history(get_price_history(list(missing), start, last_session), source="yahoo")
     except Exception as e:
-        logger.error(f"Failed to initialize Finnhub client: {str(e)}")
-        print(f"Error: Failed to initialize Finnhub client: {str(e)}")
-        return stock_data
+        logger.error(f"Yahoo history download failed for {list(missing)}: {str(e)}")
+        bars = normalize_history(pd.DataFrame())
 
-    for symbol in STOCK_LIST:
+    covered = set(bars.loc[bars["date"] == last_session, "symbol"])
+    closed_at = session(last_session)[1]
+    fallback = [
+        {"symbol": symbol, "date": last_session, "open": quote["o"], "high": quote["h"], "low": quote["l"], "close": quote["c"]}
+        for symbol, (quote, last_updated) in get_stock_price_rows([
+            s for s in missing if s not in covered and last_session not in stored.get(s, {})
+        ]).items()
+        if last_updated >= closed_at
+    ]
+    if fallback:
+        bars = pd.concat([bars, normalize_history(pd.DataFrame(fallback), source=PROVISIONAL_SOURCE)], ignore_index=True)
+    added = append_history(bars)
+    upgraded = upgrade_history(bars)
+    logger.info(f"Appended {added} bars through {last_session} ({len(fallback)} from post-close quotes), "
+                f"replaced {upgraded} provisional bars")
+    if added or upgraded:
+        # Incremental builds only append days after the matrix's newest one
+        newest = max(latest.values(), default=None)
+        refilled = any(day <= newest and day in missing.get(symbol, ())
+                       for symbol, day in zip(bars["symbol"], bars["date"])) if newest else False
+        full = bool(upgraded) or refilled
         try:
-            cache_key = f"price_{symbol}"
-            if cache_key in price_cache:
-                logger.debug(f"Using cached price for {symbol}: ${price_cache[cache_key]['current_price']:.2f}")
-                stock_data[symbol] = price_cache[cache_key]
-                continue
-
-            db_quote = get_stock_price_from_db(symbol)
-            if db_quote:
-                stock_data[symbol] = {
-                    "current_price": db_quote["c"],
-                    "high_price": db_quote["h"],
-                    "low_price": db_quote["l"],
-                    "previous_close": db_quote["pc"]
-                }
-                price_cache[cache_key] = stock_data[symbol]
-                continue
-
-            for attempt in range(5):
-                try:
-                    quote = finnhub_client.quote(symbol)
-                    if not isinstance(quote.get("c"), (int, float)) or quote["c"] <= 0:
-                        logger.warning(f"Invalid price data for {symbol}: {quote}")
-                        quote = {"o": 0.0, "c": 0.0, "h": 0.0, "l": 0.0, "pc": 0.0}
-                    stock_data[symbol] = {
-                        "current_price": float(quote["c"]),
-                        "high_price": float(quote["h"]),
-                        "low_price": float(quote["l"]),
-                        "previous_close": float(quote["pc"])
-                    }
-                    price_cache[cache_key] = stock_data[symbol]
-                    update_stock_price_in_db(symbol, quote)
-                    logger.info(f"Fetched and stored price for {symbol}: ${quote['c']:.2f}")
-                    break
-                except Exception as e:
-                    if "429" in str(e):
-                        delay = min(60, 10 * (2 ** attempt))
-                        logger.warning(f"Rate limit for {symbol}, retrying in {delay}s (attempt {attempt + 1}/5)")
-                        time.sleep(delay)
-                        if attempt == 4:
-                            logger.error(f"Rate limit exceeded for {symbol}, falling back to DB")
-                            db_quote = get_stock_price_from_db(symbol)
-                            if db_quote:
-                                stock_data[symbol] = {
-                                    "current_price": db_quote["c"],
-                                    "high_price": db_quote["h"],
-                                    "low_price": db_quote["l"],
-                                    "previous_close": db_quote["pc"]
-                                }
-                                price_cache[cache_key] = stock_data[symbol]
-                                logger.info(f"Used DB price for {symbol}: ${db_quote['c']:.2f}")
-                            else:
-                                logger.error(f"No DB price for {symbol}, using default 0.0")
-                                stock_data[symbol] = {
-                                    "current_price": 0.0,
-                                    "high_price": 0.0,
-                                    "low_price": 0.0,
-                                    "previous_close": 0.0
-                                }
-                                price_cache[cache_key] = stock_data[symbol]
-                            break
-                    else:
-                        logger.error(f"Failed to fetch Finnhub price for {symbol}: {str(e)}")
-                        stock_data[symbol] = {
-                            "current_price": 0.0,
-                            "high_price": 0.0,
-                            "low_price": 0.0,
-                            "previous_close": 0.0
-                        }
-                        price_cache[cache_key] = stock_data[symbol]
-                        break
+            logger.info(f"Price matrix updated: {build_matrix(full=full)}")
         except Exception as e:
-            logger.error(f"Unexpected error processing {symbol}: {str(e)}")
-            stock_data[symbol] = {
-                "current_price": 0.0,
-                "high_price": 0.0,
-                "low_price": 0.0,
-                "previous_close": 0.0
-            }
-            price_cache[cache_key] = stock_data[symbol]
+            logger.error(f"Failed to update the price matrix: {str(e)}")
+    return added + upgraded
 
-    return stock_data
+def run_daemon(symbols=None, interval: float = PRICE_DAEMON_INTERVAL, jitter: float = PRICE_DAEMON_JITTER):
+    """Refresh prices every ``interval`` seconds (+/- ``jitter``) until SIGTERM or SIGINT.
+
+    A heartbeat row is written after every pass; pages read prices from the
+    DB only while it is recent (see data/price_cache.py). Once per session,
+    after the close has settled, the day's bars are appended to price_history. On shutdown the
+    current pass is finished and the heartbeat is marked stopped, so pages
+    fall back to fetching inline right away.
+    """
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info(f"Received signal {signum}; stopping after the current pass")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    if interval * (1 + jitter) >= PRICE_DAEMON_STALE_AFTER:
+        logger.warning(f"Daemon interval {interval}s (+{jitter:.0%}) exceeds PRICE_DAEMON_STALE_AFTER "
+                       f"({PRICE_DAEMON_STALE_AFTER}s); pages will keep falling back to inline fetches")
+
+    started_at = datetime.now(timezone.utc)
+    passes = 0
+    history_through = None
+    record_heartbeat(PRICE_DAEMON, "running", started_at, {"passes": passes, "interval": interval})
+    logger.info(f"Price daemon started for {len(symbols or STOCK_LIST)} symbols, every {interval}s +/- {jitter:.0%}")
+    try:
+        while not stop.is_set():
+            try:
+                summary = refresh_once(symbols)
+                passes += 1
+                logger.info(f"Price daemon pass {passes}: {summary}")
+                if not summary["market_live"] and history_through != last_settled_session():
+                    append_daily_history(symbols)
+                    history_through = last_settled_session()
+            except Exception as e:
+                logger.error(f"Price daemon pass failed: {str(e)}")
+                summary = {"error": str(e)}
+            record_heartbeat(PRICE_DAEMON, "running", started_at, {"passes": passes, "interval": interval, **summary})
+            # Jitter keeps several replicas from hitting Finnhub in lockstep
+            stop.wait(interval * random.uniform(1 - jitter, 1 + jitter))
+    finally:
+        record_heartbeat(PRICE_DAEMON, "stopped", started_at, {"passes": passes, "interval": interval})
+        logger.info(f"Price daemon stopped after {passes} passes")
 
 def main():
-    """Main function to fetch and store stock prices."""
+    """Fetch and store stock prices once, or keep refreshing them with --daemon."""
+    parser = argparse.ArgumentParser(description="Fetch stock prices into the stock_prices table.")
+    parser.add_argument("--daemon", action="store_true", help="Keep refreshing prices until SIGTERM/SIGINT")
+    parser.add_argument("--interval", type=float, default=PRICE_DAEMON_INTERVAL, help="Seconds between daemon passes")
+    parser.add_argument("--jitter", type=float, default=PRICE_DAEMON_JITTER, help="Random +/- fraction of the interval")
+    parser.add_argument("--history", action="store_true", help="Append finished sessions to price_history and exit")
+    parser.add_argument("--symbols", nargs="+", default=None, help="Symbols to refresh (default: STOCK_LIST)")
+    args = parser.parse_args()
+    if args.daemon:
+        run_daemon(args.symbols, interval=args.interval, jitter=args.jitter)
+        return
+    if args.history:
+        print(f"Appended {append_daily_history(args.symbols)} bars to price_history")
+        return
+
     logger.info("Starting stock price fetch")
     try:
-        stock_data = fetch_stock_prices()
+        stock_data, report = fetch_stock_prices_with_report(args.symbols)
         if not stock_data:
             print("No stock prices fetched. Check logs for details.")
             logger.error("No stock prices fetched")
@@ -237,7 +254,9 @@ def main():
         logger.info("Stock price fetch completed")
         print("Fetched stock prices:")
         for symbol, data in stock_data.items():
-            print(f"{symbol}: ${data['current_price']:.2f}")
+            entry = report[symbol]
+            print(f"{symbol}: ${data['current_price']:.2f} "
+                  f"[{entry['source']}, {entry['latency_ms']:.0f}ms, {entry['retries']} retries]")
     except Exception as e:
         logger.error(f"Stock price fetch failed: {str(e)}")
         print(f"Error: {str(e)}")
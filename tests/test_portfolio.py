@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from analytics.portfolio import compute_positions
+from gamification.virtual_currency import replay_trades
+
+def assert_matches_replay(trades):
+    expected = replay_trades(trades)
+    positions = compute_positions(trades)
+    for symbol, position in expected.items():
+        for column in ("quantity", "cost_basis", "realized_pnl"):
+            value = positions.loc[symbol, column]
+            assert np.isfinite(value), (symbol, column)
+            assert value == pytest.approx(position[column], rel=1e-9, abs=1e-6), (symbol, column)
+
+def test_long_run_of_partial_sells_stays_finite():
+    # Each sell halves the cost scale; the rebuy keeps the position (and the run) open
+    trades = [{"symbol": "AAPL", "trade_type": "buy", "amount": 1000.0, "price": 10.0}]
+    for _ in range(1200):
+        trades.append({"symbol": "AAPL", "trade_type": "sell", "amount": 500.0, "price": 10.0})
+        trades.append({"symbol": "AAPL", "trade_type": "buy", "amount": 500.0, "price": 10.0})
+    assert_matches_replay(trades)
+    assert compute_positions(trades).loc["AAPL", "cost_basis"] == pytest.approx(1000.0)
+
+def test_mixed_history_matches_replay():
+    rng = np.random.default_rng(0)
+    held = {}
+    trades = []
+    for _ in range(5000):
+        symbol = f"S{rng.integers(5)}"
+        price = float(rng.uniform(5, 50))
+        if held.get(symbol, 0.0) > 0 and rng.random() < 0.5:
+            shares = held[symbol] if rng.random() < 0.1 else held[symbol] * float(rng.uniform(0.05, 0.95))
+            trades.append({"symbol": symbol, "trade_type": "sell", "amount": shares * price, "price": price})
+            held[symbol] -= shares
+        else:
+            amount = float(rng.uniform(1, 1000))
+            trades.append({"symbol": symbol, "trade_type": "buy", "amount": amount, "price": price})
+            held[symbol] = held.get(symbol, 0.0) + amount / price
+    assert_matches_replay(trades)
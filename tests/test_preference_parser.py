@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain.prompts")
+
+from agents import preference_parser
+from agents.preference_parser import PreferenceParserAgent, extract_preferences, parser_stats
+from utils.config import PREFERENCE_RULE_CONFIDENCE
+
+@pytest.mark.parametrize("text", [
+    "I don't want anything risky, retire in 30 years",
+    "Avoid aggressive bets, I want income",
+    "I won't take high-risk positions",
+    "I want to invest safely, not aggressively",
+])
+def test_negated_risk_is_not_matched(text):
+    preferences, confidence = extract_preferences(text)
+    assert preferences["risk_appetite"] == "medium"
+    assert confidence < PREFERENCE_RULE_CONFIDENCE
+
+def test_negation_stays_within_its_clause():
+    preferences, _ = extract_preferences("I don't want anything risky, retire in 30 years")
+    assert preferences["investment_goals"] == "retirement"
+    assert preferences["time_horizon"] == "long"
+
+def test_plain_phrasing_is_served_by_rules():
+    preferences, confidence = extract_preferences("Safe investing for retirement, $5000 in index funds over 20 years")
+    assert preferences == {
+        "risk_appetite": "low", "investment_goals": "retirement", "time_horizon": "long",
+        "investment_amount": 5000.0, "investment_style": "index"
+    }
+    assert confidence >= PREFERENCE_RULE_CONFIDENCE
+
+class StubLLM:
+    def __init__(self, reply):
+        self.reply = reply
+        self.prompts = []
+        self.invalidated = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return SimpleNamespace(content=self.reply)
+
+    def invalidate(self, prompt):
+        self.invalidated.append(prompt)
+
+def make_agent(reply):
+    agent = PreferenceParserAgent.__new__(PreferenceParserAgent)
+    agent.llm = StubLLM(reply)
+    return agent
+
+def test_llm_reply_is_parsed_and_counted(monkeypatch):
+    monkeypatch.setattr(preference_parser, "_stats", dict.fromkeys(preference_parser._stats, 0))
+    agent = make_agent('{"risk_appetite": "low", "investment_goals": "retirement", "time_horizon": "long", '
+                       '"investment_amount": 10000.0, "investment_style": "index"}')
+    preferences = agent.parse_preferences("I don't want anything risky, retire in 30 years")
+    assert preferences["risk_appetite"] == "low"
+    assert len(agent.llm.prompts) == 1
+    assert "i don't want anything risky" in agent.llm.prompts[0]
+    assert parser_stats()["llm"] == 1
+
+def test_unparseable_llm_reply_falls_back_to_rules(monkeypatch):
+    monkeypatch.setattr(preference_parser, "_stats", dict.fromkeys(preference_parser._stats, 0))
+    agent = make_agent("not json")
+    preferences = agent.parse_preferences("I don't want anything risky, retire in 30 years")
+    assert preferences["investment_goals"] == "retirement"
+    assert agent.llm.invalidated == agent.llm.prompts
+    stats = parser_stats()
+    assert stats["llm"] == 0 and stats["llm_fallbacks"] == 1
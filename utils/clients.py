@@ -0,0 +1,34 @@
+"""Process-wide API clients, built lazily on first use and shared across threads."""
+import threading
+
+import finnhub
+from langchain_groq import ChatGroq
+from newsapi import NewsApiClient
+
+from utils.config import GROQ_API_KEY, FINNHUB_API_KEY, NEWSAPI_KEY
+from utils.logger import logger
+
+_clients = {}
+_lock = threading.Lock()
+
+def shared_client(key, factory):
+    """Return the client stored under ``key``, building it with ``factory`` once."""
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                _clients[key] = client
+                logger.info(f"Initialized shared client {key}")
+    return client
+
+def get_groq_llm(model_name: str) -> ChatGroq:
+    """One ChatGroq client (and its HTTP connection pool) per model."""
+    return shared_client(("groq", model_name), lambda: ChatGroq(model_name=model_name, api_key=GROQ_API_KEY))
+
+def get_finnhub_client() -> finnhub.Client:
+    return shared_client("finnhub", lambda: finnhub.Client(api_key=FINNHUB_API_KEY))
+
+def get_newsapi_client() -> NewsApiClient:
+    return shared_client("newsapi", lambda: NewsApiClient(api_key=NEWSAPI_KEY))
@@ -4,6 +4,7 @@ import os
 import base64
 import tempfile
 import requests
+from datetime import date
 from utils.logger import logger
 
 #API Configs
@@ -30,8 +31,42 @@ AZURE_HOSTNAME=st.secrets["database"]["AZURE_HOSTNAME"]
 AZURE_PASSWORD=st.secrets["database"]["AZURE_PASSWORD"]
 AZURE_USER=st.secrets["database"]["AZURE_USER"]
 AZURE_PORT=st.secrets["database"]["AZURE_PORT"]
+
+#Connection pool settings (optional)
+DB_POOL_SIZE=int(st.secrets["database"].get("POOL_SIZE", 5))
+DB_POOL_TIMEOUT=float(st.secrets["database"].get("POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE=float(st.secrets["database"].get("POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING=bool(st.secrets["database"].get("POOL_PRE_PING", True))
 # AZURE_SSL_CA=st.secrets["database"]["AZURE_SSL_CA"]
 
+#LLM response cache settings (optional)
+LLM_CACHE_SIZE=int(st.secrets.get("LLM_CACHE_SIZE", 512))
+LLM_CACHE_DB=st.secrets.get("LLM_CACHE_DB") or None
+LLM_CACHE_TTLS={name: float(ttl) for name, ttl in st.secrets.get("llm_cache_ttl", {}).items()}
+
+#News sentiment settings (optional)
+SENTIMENT_LLM_CONFIDENCE=float(st.secrets.get("SENTIMENT_LLM_CONFIDENCE", 0.6))
+
+#Preference parser settings (optional)
+PREFERENCE_RULE_CONFIDENCE=float(st.secrets.get("PREFERENCE_RULE_CONFIDENCE", 0.8))
+
+#Finnhub quota settings (optional; the free tier allows 60 calls/minute)
+FINNHUB_CALLS_PER_MINUTE=int(st.secrets.get("FINNHUB_CALLS_PER_MINUTE", 60))
+FINNHUB_INTERACTIVE_RESERVE=float(st.secrets.get("FINNHUB_INTERACTIVE_RESERVE", 2))
+
+#Price cache settings in seconds (optional); outside market hours see utils/market_calendar.py
+PRICE_FRESH_TTL=float(st.secrets.get("PRICE_FRESH_TTL", 60))
+PRICE_STALE_TTL=float(st.secrets.get("PRICE_STALE_TTL", 86400))
+PRICE_NEGATIVE_TTL=float(st.secrets.get("PRICE_NEGATIVE_TTL", 60))
+PRICE_DAEMON_STALE_AFTER=float(st.secrets.get("PRICE_DAEMON_STALE_AFTER", 180))
+
+#Monte Carlo projection settings (optional): paths per simulation and process-pool workers (1 runs in-process)
+MONTE_CARLO_PATHS=int(st.secrets.get("MONTE_CARLO_PATHS", 20000))
+MONTE_CARLO_WORKERS=int(st.secrets.get("MONTE_CARLO_WORKERS", 1))
+
+#Market calendar settings (optional): extra full-day NYSE closures as "YYYY-MM-DD"
+MARKET_HOLIDAYS=[date.fromisoformat(str(day)) for day in st.secrets.get("MARKET_HOLIDAYS", [])]
+
 cert_base64 = st.secrets["database"]["AZURE_CERT"]
 AZURE_SSL = base64.b64decode(cert_base64)
 
@@ -0,0 +1,130 @@
+"""One Finnhub quota for every call site in the process.
+
+All Finnhub requests go through ``get_finnhub_quota().call(...)`` (or the
+``quote``/``company_profile2`` shortcuts), which
+
+- takes a token from one shared bucket sized to the account's calls/minute,
+- lets interactive requests (a user waiting on a page) overtake background
+  fetches: background callers only proceed while ``FINNHUB_INTERACTIVE_RESERVE``
+  tokens would remain, so a page request never queues behind a bulk refresh,
+- collapses identical in-flight requests into one upstream call, and
+- on a 429 pauses the whole bucket with exponential backoff instead of each
+  caller sleeping on its own, then retries.
+"""
+import copy
+import threading
+from typing import Callable, Dict, Optional
+
+from utils.config import FINNHUB_CALLS_PER_MINUTE, FINNHUB_INTERACTIVE_RESERVE
+from utils.logger import logger
+from utils.rate_limit import TokenBucket
+from utils.singleflight import SingleFlight
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+MAX_RETRIES = {INTERACTIVE: 2, BACKGROUND: 4}
+RATE_LIMIT_PAUSE = 5.0
+MAX_RATE_LIMIT_PAUSE = 60.0
+
+class FinnhubRateLimited(Exception):
+    """Finnhub kept answering 429 after all retries."""
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or "429" in str(error)
+
+class FinnhubQuota:
+    def __init__(self, client_factory: Callable, calls_per_minute: int = FINNHUB_CALLS_PER_MINUTE,
+                 interactive_reserve: float = FINNHUB_INTERACTIVE_RESERVE):
+        self._client_factory = client_factory
+        self._client = None
+        self.bucket = TokenBucket.per_minute(calls_per_minute)
+        # Background callers must always be able to proceed eventually
+        self.reserve = max(0.0, min(interactive_reserve, self.bucket.capacity - 1))
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats = {
+            priority: {"requests": 0, "calls": 0, "deduplicated": 0, "waits": 0,
+                       "wait_seconds": 0.0, "rate_limited": 0, "retries": 0, "errors": 0}
+            for priority in (INTERACTIVE, BACKGROUND)
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    def _count(self, priority: str, event: str, amount: float = 1):
+        with self._lock:
+            self._stats[priority][event] += amount
+
+    def call(self, method: str, *args, priority: str = BACKGROUND, report: Optional[Dict] = None, **kwargs):
+        """Call ``finnhub.Client.<method>`` under the shared quota.
+
+        Identical calls already in flight are joined rather than repeated.
+        ``report``, if given, gets ``retries`` and ``rate_limit_wait`` added to
+        it. Raises FinnhubRateLimited if the retries are exhausted on 429s,
+        and re-raises any other API error.
+        """
+        self._count(priority, "requests")
+        key = (method, args, tuple(sorted(kwargs.items())))
+        result, shared = self._flights.do(key, self._call_upstream, method, args, kwargs, priority, report)
+        if shared:
+            self._count(priority, "deduplicated")
+            return copy.deepcopy(result)
+        return result
+
+    def _call_upstream(self, method: str, args: tuple, kwargs: Dict, priority: str, report: Optional[Dict]):
+        reserve = self.reserve if priority == BACKGROUND else 0.0
+        for attempt in range(MAX_RETRIES[priority] + 1):
+            waited = self.bucket.acquire(reserve=reserve)
+            if waited > 0:
+                self._count(priority, "waits")
+                self._count(priority, "wait_seconds", waited)
+            if report is not None:
+                report["rate_limit_wait"] = report.get("rate_limit_wait", 0.0) + waited
+            self._count(priority, "calls")
+            try:
+                return getattr(self.client, method)(*args, **kwargs)
+            except Exception as e:
+                if not _is_rate_limited(e):
+                    self._count(priority, "errors")
+                    raise
+                self._count(priority, "rate_limited")
+                if attempt == MAX_RETRIES[priority]:
+                    raise FinnhubRateLimited(f"Finnhub rate limit on {method}{args} after {attempt + 1} attempts") from e
+                pause = min(MAX_RATE_LIMIT_PAUSE, RATE_LIMIT_PAUSE * (2 ** attempt))
+                logger.warning(f"Finnhub 429 on {method}{args}; pausing all Finnhub calls for {pause:.0f}s "
+                               f"(attempt {attempt + 1}/{MAX_RETRIES[priority] + 1})")
+                self.bucket.pause(pause)
+                self._count(priority, "retries")
+                if report is not None:
+                    report["retries"] = report.get("retries", 0) + 1
+
+    def quote(self, symbol: str, priority: str = BACKGROUND, report: Optional[Dict] = None) -> Dict:
+        return self.call("quote", symbol, priority=priority, report=report)
+
+    def company_profile2(self, symbol: str, priority: str = BACKGROUND) -> Dict:
+        return self.call("company_profile2", symbol=symbol, priority=priority)
+
+    def stats(self) -> Dict:
+        """Counters per priority lane plus totals."""
+        with self._lock:
+            lanes = {priority: dict(counters) for priority, counters in self._stats.items()}
+        totals = {event: sum(counters[event] for counters in lanes.values()) for event in lanes[BACKGROUND]}
+        return {"totals": totals, "lanes": lanes, "in_flight": self._flights.in_flight()}
+
+_quota = None
+_quota_lock = threading.Lock()
+
+def get_finnhub_quota() -> FinnhubQuota:
+    """Return the process-wide quota manager, creating it on first use."""
+    global _quota
+    if _quota is None:
+        with _quota_lock:
+            if _quota is None:
+                from utils.clients import get_finnhub_client
+                _quota = FinnhubQuota(get_finnhub_client)
+    return _quota
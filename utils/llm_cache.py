@@ -0,0 +1,238 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from utils.logger import logger
+from utils.config import LLM_CACHE_DB, LLM_CACHE_SIZE, LLM_CACHE_TTLS
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_prompt(prompt) -> str:
+    """Render a prompt (string, PromptValue or message list) to a canonical string.
+
+    Runs of whitespace are collapsed so indentation changes in the f-string
+    templates do not split otherwise identical prompts across cache entries.
+    """
+    if hasattr(prompt, "to_messages"):
+        prompt = prompt.to_messages()
+    if isinstance(prompt, (list, tuple)):
+        parts = []
+        for message in prompt:
+            if isinstance(message, (list, tuple)) and len(message) == 2:
+                role, content = message
+            else:
+                role, content = getattr(message, "type", "human"), getattr(message, "content", message)
+            parts.append(f"{role}: {content if isinstance(content, str) else json.dumps(content, sort_keys=True)}")
+        prompt = "\n".join(parts)
+    return _WHITESPACE.sub(" ", str(prompt)).strip()
+
+def cache_key(model: str, prompt) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """Two-tier response cache shared by every agent in the process.
+
+    The memory tier is an LRU of at most ``max_entries`` responses. When
+    ``db_path`` is set, responses are also written to a SQLite file so they
+    survive restarts; memory misses fall through to it and promote hits.
+    Each entry carries its own expiry, so namespaces can use different TTLs.
+    """
+
+    def __init__(self, max_entries: int = 512, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute("""
+                    CREATE TABLE IF NOT EXISTS llm_cache (
+                        key TEXT PRIMARY KEY,
+                        namespace TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                """)
+                self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+                self._db.commit()
+                logger.info(f"LLM response cache persisted to {db_path}")
+            except sqlite3.Error as e:
+                logger.error(f"Failed to open LLM cache database {db_path}, using memory only: {str(e)}")
+                self._db = None
+
+    def _count(self, namespace: str, event: str):
+        counters = self._stats.setdefault(namespace, {
+            "hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0
+        })
+        counters[event] += 1
+
+    def get(self, key: str, namespace: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                content, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._count(namespace, "hits")
+                    return content
+                del self._entries[key]
+                self._count(namespace, "expired")
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT content, expires_at FROM llm_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"LLM cache database read failed: {str(e)}")
+                    row = None
+                if row and row[1] > now:
+                    self._put_memory(key, row[0], row[1], namespace)
+                    self._count(namespace, "disk_hits")
+                    return row[0]
+            self._count(namespace, "misses")
+            return None
+
+    def _put_memory(self, key: str, content: str, expires_at: float, namespace: str):
+        self._entries[key] = (content, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._count(namespace, "evictions")
+
+    def set(self, key: str, content: str, ttl: float, namespace: str):
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._put_memory(key, content, expires_at, namespace)
+            self._count(namespace, "stores")
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, namespace, content, expires_at) VALUES (?, ?, ?, ?)",
+                        (key, namespace, content, expires_at)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"LLM cache database write failed: {str(e)}")
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"LLM cache database delete failed: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """Per-namespace counters plus totals and the current memory tier size."""
+        with self._lock:
+            per_namespace = {name: dict(counters) for name, counters in self._stats.items()}
+            size = len(self._entries)
+        totals = {}
+        for counters in per_namespace.values():
+            for event, count in counters.items():
+                totals[event] = totals.get(event, 0) + count
+        lookups = totals.get("hits", 0) + totals.get("disk_hits", 0) + totals.get("misses", 0)
+        hit_rate = (totals.get("hits", 0) + totals.get("disk_hits", 0)) / lookups if lookups else 0.0
+        return {"size": size, "hit_rate": hit_rate, "totals": totals, "namespaces": per_namespace}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMResponseCache:
+    """Return the process-wide response cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache(max_entries=LLM_CACHE_SIZE, db_path=LLM_CACHE_DB)
+    return _cache
+
+def get_llm_cache_stats() -> dict:
+    return get_llm_cache().stats()
+
+class CachedLLM:
+    """Drop-in wrapper around a chat model that memoizes ``invoke`` results.
+
+    Keys are the model name plus a hash of the normalized prompt, so agents
+    sharing a model also share responses. Only the response text is cached;
+    hits come back as an ``AIMessage`` so callers reading ``.content`` work
+    unchanged. Anything else is delegated to the wrapped model.
+    """
+
+    def __init__(self, llm, namespace: str, ttl: float, cache: Optional[LLMResponseCache] = None):
+        self.llm = llm
+        self.namespace = namespace
+        self.ttl = float(LLM_CACHE_TTLS.get(namespace, ttl))
+        self.model_name = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+        self._cache = cache
+
+    @property
+    def cache(self) -> LLMResponseCache:
+        return self._cache or get_llm_cache()
+
+    def key(self, prompt) -> str:
+        return cache_key(self.model_name, prompt)
+
+    def invoke(self, prompt, *args, **kwargs):
+        if self.ttl <= 0:
+            return self.llm.invoke(prompt, *args, **kwargs)
+        key = self.key(prompt)
+        content = self.cache.get(key, self.namespace)
+        if content is not None:
+            logger.debug(f"LLM cache hit for {self.namespace} ({self.model_name})")
+            return AIMessage(content=content)
+        response = self.llm.invoke(prompt, *args, **kwargs)
+        content = getattr(response, "content", response)
+        if isinstance(content, str) and content:
+            self.cache.set(key, content, self.ttl, self.namespace)
+        return response
+
+    __call__ = invoke
+
+    def stream(self, prompt, *args, **kwargs):
+        """Yield response chunks as the model produces them.
+
+        A cache hit is yielded as a single chunk. A miss streams from the
+        model and stores the assembled text once the stream completes, so an
+        abandoned stream never leaves a partial response in the cache.
+        """
+        key = self.key(prompt) if self.ttl > 0 else None
+        content = self.cache.get(key, self.namespace) if key else None
+        if content is not None:
+            logger.debug(f"LLM cache hit for {self.namespace} ({self.model_name})")
+            yield AIMessageChunk(content=content)
+            return
+        parts = []
+        for chunk in self.llm.stream(prompt, *args, **kwargs):
+            if isinstance(chunk.content, str):
+                parts.append(chunk.content)
+            yield chunk
+        if key and parts:
+            self.cache.set(key, "".join(parts), self.ttl, self.namespace)
+
+    def invalidate(self, prompt):
+        """Drop a cached response, e.g. one that failed validation, so a retry reaches the model."""
+        self.cache.invalidate(self.key(prompt))
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
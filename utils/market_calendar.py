@@ -0,0 +1,164 @@
+"""NYSE trading calendar and the quote freshness policy derived from it.
+
+Regular sessions run 09:30-16:00 America/New_York on weekdays, except on
+exchange holidays, and close at 13:00 on the usual early-close days. The
+standard holidays are computed from their rules, observed dates included, so
+the calendar does not need a yearly update. One-off closures (e.g. a national
+day of mourning) can be added with ``MARKET_HOLIDAYS`` in the secrets.
+
+``quote_ttls()`` turns the calendar into cache lifetimes. While a session is
+open, a quote is fresh for ``PRICE_FRESH_TTL`` seconds. Once the session has
+closed and settled, any quote taken after the close stays fresh until the
+next open, because the price cannot change until then.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from utils.config import MARKET_HOLIDAYS, PRICE_FRESH_TTL, PRICE_STALE_TTL
+
+EXCHANGE_TZ = ZoneInfo("America/New_York")
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+EARLY_CLOSE = time(13, 0)
+# Closing prints keep arriving for a few minutes after the bell
+SETTLE_DELAY = timedelta(minutes=5)
+
+class QuoteTTLs(NamedTuple):
+    # True while prices can still move: during a session and until the close settles
+    live: bool
+    fresh: float
+    stale: float
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """The ``n``-th ``weekday`` (Mon=0) of the month; n=-1 for the last one."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year, month + 1, 1) - timedelta(days=1) if month < 12 else date(year, 12, 31)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+def _easter(year: int) -> date:
+    """Western Easter Sunday (anonymous Gregorian algorithm)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    month = (h + l - 7 * m + 90) // 25
+    return date(year, month, (h + l - 7 * m + 33 * month + 19) % 32)
+
+def _observed(day: date) -> date:
+    """Saturday holidays are observed on Friday, Sunday holidays on Monday."""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+@lru_cache(maxsize=None)
+def holidays(year: int) -> frozenset:
+    """Full-day NYSE closures in ``year``, including configured extra closures."""
+    days = {
+        _nth_weekday(year, 1, 0, 3),    # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),    # Washington's Birthday
+        _easter(year) - timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),   # Memorial Day
+        _observed(date(year, 7, 4)),    # Independence Day
+        _nth_weekday(year, 9, 0, 1),    # Labor Day
+        _nth_weekday(year, 11, 3, 4),   # Thanksgiving
+        _observed(date(year, 12, 25)),  # Christmas
+    }
+    # NYSE does not close on Friday Dec 31 when New Year's Day is a Saturday
+    new_year = _observed(date(year, 1, 1))
+    if new_year.year == year:
+        days.add(new_year)
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))  # Juneteenth
+    days.update(day for day in MARKET_HOLIDAYS if day.year == year)
+    return frozenset(days)
+
+@lru_cache(maxsize=None)
+def early_closes(year: int) -> frozenset:
+    """Days the session ends at 13:00: July 3, the day after Thanksgiving and Christmas Eve."""
+    candidates = {
+        date(year, 7, 3),
+        _nth_weekday(year, 11, 3, 4) + timedelta(days=1),
+        date(year, 12, 24),
+    }
+    return frozenset(day for day in candidates if is_trading_day(day))
+
+def is_trading_day(day: date) -> bool:
+    return day.weekday() < 5 and day not in holidays(day.year)
+
+def session(day: date) -> Optional[Tuple[datetime, datetime]]:
+    """(open, close) of the regular session on ``day`` as aware datetimes, or None if closed."""
+    if not is_trading_day(day):
+        return None
+    close = EARLY_CLOSE if day in early_closes(day.year) else MARKET_CLOSE
+    return (datetime.combine(day, MARKET_OPEN, EXCHANGE_TZ), datetime.combine(day, close, EXCHANGE_TZ))
+
+def _local(at: Optional[datetime]) -> datetime:
+    if at is None:
+        return datetime.now(EXCHANGE_TZ)
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return at.astimezone(EXCHANGE_TZ)
+
+def is_market_open(at: Optional[datetime] = None) -> bool:
+    """Whether the regular session is open at ``at`` (naive datetimes are UTC; default now)."""
+    at = _local(at)
+    hours = session(at.date())
+    return hours is not None and hours[0] <= at < hours[1]
+
+def next_open(at: Optional[datetime] = None) -> datetime:
+    """Start of the next regular session after ``at``."""
+    at = _local(at)
+    day = at.date()
+    while True:
+        hours = session(day)
+        if hours and hours[0] > at:
+            return hours[0]
+        day += timedelta(days=1)
+
+def last_close(at: Optional[datetime] = None) -> datetime:
+    """End of the most recent regular session at or before ``at``."""
+    at = _local(at)
+    day = at.date()
+    while True:
+        hours = session(day)
+        if hours and hours[1] <= at:
+            return hours[1]
+        day -= timedelta(days=1)
+
+def quote_ttls(at: Optional[datetime] = None) -> QuoteTTLs:
+    """How long a quote stays fresh, and how long it may be served stale, at ``at``.
+
+    During a session (and while the close settles) ``fresh`` is
+    ``PRICE_FRESH_TTL``. Afterwards it is the time since the settled close,
+    so every quote taken after the close is fresh until the next open.
+    """
+    at = _local(at)
+    settled = last_close(at) + SETTLE_DELAY
+    if is_market_open(at) or at < settled:
+        return QuoteTTLs(True, PRICE_FRESH_TTL, max(PRICE_STALE_TTL, PRICE_FRESH_TTL))
+    fresh = (at - settled).total_seconds()
+    return QuoteTTLs(False, fresh, max(PRICE_STALE_TTL, fresh))
+
+def seconds_until_open(at: Optional[datetime] = None) -> float:
+    """0 while the market is open, otherwise the wait until the next session starts."""
+    at = _local(at)
+    if is_market_open(at):
+        return 0.0
+    return (next_open(at) - at).total_seconds()
+
+def last_settled_session(at: Optional[datetime] = None) -> date:
+    """Date of the most recent session whose close has settled, i.e. whose daily bar is final."""
+    at = _local(at)
+    close = last_close(at)
+    if at < close + SETTLE_DELAY:
+        close = last_close(close - timedelta(seconds=1))
+    return close.date()
@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter.
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``. Callers
+    block in ``acquire`` until enough tokens are available, so a pool of workers
+    sharing one bucket never exceeds the upstream quota.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, calls: int, burst: Optional[int] = None) -> "TokenBucket":
+        """Build a bucket sized to an upstream 'calls per minute' quota."""
+        return cls(rate=calls / 60.0, capacity=burst if burst is not None else max(1, calls // 6))
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._last_refill = now
+
+    def try_acquire(self, tokens: float = 1.0, reserve: float = 0.0) -> bool:
+        """Take tokens if they are available right now, without blocking."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens + reserve:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None, reserve: float = 0.0) -> float:
+        """Block until tokens are available and return the seconds spent waiting.
+
+        With ``reserve``, the caller only proceeds once ``reserve`` tokens would
+        still be left afterwards, so low-priority callers leave headroom for
+        callers acquiring without one. Raises TimeoutError if ``timeout``
+        seconds pass without enough tokens.
+        """
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens + reserve:
+                    self._tokens -= tokens
+                    return time.monotonic() - start
+                wait = (tokens + reserve - self._tokens) / self.rate
+            if timeout is not None:
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    raise TimeoutError("Timed out waiting for rate limit token")
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def drain(self):
+        """Empty the bucket, e.g. after the upstream reports its quota is exhausted."""
+        with self._lock:
+            self._refill()
+            self._tokens = 0.0
+
+    def pause(self, seconds: float):
+        """Hold every caller back for about ``seconds`` by putting the bucket into debt."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
@@ -0,0 +1,99 @@
+import copy
+import functools
+import threading
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse identical concurrent calls into one.
+
+    The first caller for a key runs the function; callers arriving with the
+    same key while it is in flight block and receive the same result (or
+    exception). Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._saved = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Tuple[object, bool]:
+        """Run ``fn`` once per in-flight ``key``; returns (result, shared)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._calls += 1
+            else:
+                self._saved += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self) -> Dict:
+        """Upstream calls made, calls saved by joining one in flight, and current in-flight keys."""
+        with self._lock:
+            return {"upstream_calls": self._calls, "saved_calls": self._saved, "in_flight": len(self._flights)}
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+def get_group(name: str) -> SingleFlight:
+    """Process-wide SingleFlight registered under ``name``.
+
+    Looked up by name so that functions redefined on every Streamlit rerun
+    still share one group across sessions.
+    """
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = _groups[name] = SingleFlight()
+        return group
+
+def coalesced(name: str, key: Optional[Callable] = None):
+    """Decorator sharing one in-flight call between concurrent identical calls.
+
+    ``key`` maps the call's arguments to the coalescing key; by default all
+    positional and keyword arguments are used. Callers that joined another
+    caller's flight get a deep copy so they can mutate the result freely.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            flight_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            result, shared = get_group(name).do(flight_key, fn, *args, **kwargs)
+            return copy.deepcopy(result) if shared else result
+        return wrapper
+    return decorator
+
+def coalescing_stats() -> Dict[str, Dict]:
+    """Per-group counters, e.g. to see how many upstream calls were saved."""
+    with _groups_lock:
+        groups = dict(_groups)
+    return {name: group.stats() for name, group in groups.items()}